@@ -0,0 +1,313 @@
+"""
+离线视频批量分析
+录像文件按时间段切块，多个进程各自跳转到起点并行解码，主进程大批量推理并批量写库
+"""
+
+import os
+import cv2
+import logging
+import multiprocessing as mp
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+from app import db
+from app.ai.chunk_decoder import init_decode_worker, decode_chunk, split_ranges
+from app.ai.model_manager import model_manager
+from app.ai.model_registry import model_registry
+from app.models.ai_model import ModelPrediction
+
+logger = logging.getLogger(__name__)
+
+# 支持的录像格式，与清理服务管理的uploads目录一致
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+# 任务状态
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+# 长时间收不到解码进程的消息即判定解码卡死（进程池中被杀死的进程会让任务永远不返回）
+DECODE_STALL_TIMEOUT = 120
+
+class BatchAnalysisJob:
+    """单个录像文件的批量分析任务"""
+
+    def __init__(self, video_path: str, camera_id: str, model_ids: List[str], workers: int = 4,
+                 batch_size: int = 32, write_batch_size: int = 500, sample_fps: Optional[float] = None,
+                 start_time: Optional[datetime] = None, max_decode_width: int = 1280):
+        self.id = str(uuid.uuid4())
+        self.video_path = video_path
+        self.camera_id = camera_id
+        self.model_ids = model_ids
+        self.workers = workers
+        self.batch_size = batch_size
+        self.write_batch_size = write_batch_size
+        self.sample_fps = sample_fps
+        self.start_time = start_time or datetime.utcnow()
+        self.max_decode_width = max_decode_width
+
+        self.state = JOB_PENDING
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+        self.video_fps = 0.0
+        self.video_frames = 0
+        self.total_frames = 0
+        self.frames_decoded = 0
+        self.frames_analyzed = 0
+        self.detections = 0
+        self.chunks_done = 0
+        self.chunk_count = 0
+        self._scale = (1.0, 1.0)
+        self._pending: List[ModelPrediction] = []
+        # 模型ID -> 实际执行推理的模型ID（选中的低精度版本），任务开始时确定
+        self._targets: Dict[str, str] = {}
+
+    def cancel(self):
+        """请求取消任务"""
+        self._cancel.set()
+
+    def run(self, app):
+        """在应用上下文中执行任务（由任务线程池调用）"""
+        if self._cancel.is_set():
+            self.state = JOB_CANCELLED
+            return
+        self.state = JOB_RUNNING
+        self.started_at = time.time()
+        with app.app_context():
+            try:
+                self._run()
+                self.state = JOB_CANCELLED if self._cancel.is_set() else JOB_COMPLETED
+            except Exception as e:
+                self.state = JOB_FAILED
+                self.error = str(e)
+                logger.error(f'批量分析任务 {self.id} 失败: {str(e)}')
+            finally:
+                self.finished_at = time.time()
+                logger.info(f'批量分析任务 {self.id} 结束: {self.state}，分析 {self.frames_analyzed} 帧，'
+                            f'{self.get_status()["fps"]} 帧/秒')
+
+    def _probe(self) -> Tuple[int, int]:
+        """读取视频帧数、帧率和分辨率"""
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            if not cap.isOpened():
+                raise RuntimeError(f'无法打开视频文件: {self.video_path}')
+            self.video_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.video_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        finally:
+            cap.release()
+
+    def _decode_size(self, width: int, height: int) -> Optional[Tuple[int, int]]:
+        """解码端缩放尺寸：不超过模型输入宽度，保持宽高比"""
+        target_width = self.max_decode_width
+        for model_id in self.model_ids:
+            model = model_registry.get(model_id)
+            if model and model.input_size:
+                target_width = min(target_width, int(model.input_size.split('x')[0]))
+        if not width or width <= target_width:
+            return None
+        size = (target_width, max(2, int(round(height * target_width / width / 2)) * 2))
+        self._scale = (width / size[0], height / size[1])
+        return size
+
+    def _run(self):
+        width, height = self._probe()
+        if self.video_frames <= 0:
+            raise RuntimeError('无法获取视频帧数')
+
+        # 选中了低精度版本的模型只加载该版本，结果仍记在原模型名下
+        self._targets = {model_id: model_registry.select_variant(model_id) for model_id in self.model_ids}
+        for model_id, target_id in self._targets.items():
+            if not model_manager.is_model_loaded(target_id) and not model_manager.load_model(target_id):
+                raise RuntimeError(f'模型加载失败: {target_id}')
+
+        stride = max(1, int(round(self.video_fps / self.sample_fps))) if self.sample_fps else 1
+        size = self._decode_size(width, height)
+        # 切块数多于进程数，先完成的进程可以接着处理剩余时间段
+        ranges = split_ranges(self.video_frames, self.workers * 2, stride)
+        tasks = [(index, self.video_path, start, end, stride, size) for index, (start, end) in enumerate(ranges)]
+        self.chunk_count = len(tasks)
+        self.total_frames = -(-self.video_frames // stride)
+
+        ctx = mp.get_context('spawn')
+        # 有界队列：推理跟不上时解码进程阻塞，内存占用不随视频长度增长
+        frame_queue = ctx.Queue(maxsize=self.batch_size * 2)
+        cancel_event = ctx.Event()
+        pool = ctx.Pool(min(self.workers, len(tasks)), initializer=init_decode_worker,
+                        initargs=(frame_queue, cancel_event))
+        try:
+            result = pool.map_async(decode_chunk, tasks)
+            batch = []
+            last_message = time.time()
+            while self.chunks_done < len(tasks):
+                if self._cancel.is_set():
+                    cancel_event.set()
+                    break
+                try:
+                    kind, chunk_index, value, frame = frame_queue.get(timeout=1)
+                except queue.Empty:
+                    idle = time.time() - last_message
+                    if (result.ready() and (not result.successful() or idle > 5)) or idle > DECODE_STALL_TIMEOUT:
+                        raise RuntimeError('解码进程异常退出')
+                    continue
+                last_message = time.time()
+
+                if kind == 'frame':
+                    batch.append((value, frame))
+                    self.frames_decoded += 1
+                    if len(batch) >= self.batch_size:
+                        self._infer(batch)
+                        batch = []
+                elif kind == 'done':
+                    self.chunks_done += 1
+                else:
+                    raise RuntimeError(f'时间段 {chunk_index} 解码失败: {value}')
+
+            if batch and not self._cancel.is_set():
+                self._infer(batch)
+            self._flush()
+        finally:
+            cancel_event.set()
+            pool.terminate()
+            pool.join()
+
+    def _infer(self, batch: List[Tuple[int, Any]]):
+        """一个批次的帧逐模型批量推理，结果缓存后批量写库"""
+        frames = [frame for _, frame in batch]
+        scale_x, scale_y = self._scale
+        for model_id in self.model_ids:
+            start = time.time()
+            results = model_manager.predict_batch(self._targets.get(model_id, model_id), frames)
+            per_frame = (time.time() - start) / len(frames)
+
+            for (frame_index, _), predictions in zip(batch, results):
+                if not predictions:
+                    continue
+                for prediction in predictions:
+                    bbox = prediction.get('bbox')
+                    if bbox and len(bbox) >= 4 and (scale_x != 1 or scale_y != 1):
+                        prediction['bbox'] = [bbox[0] * scale_x, bbox[1] * scale_y, bbox[2] * scale_x, bbox[3] * scale_y]
+
+                record = ModelPrediction(
+                    model_id=model_id,
+                    camera_id=self.camera_id,
+                    prediction_type='detection',
+                    input_image_path=f'{self.video_path}#frame={frame_index}',
+                    confidence=max([p.get('confidence', 0) for p in predictions]),
+                    processing_time=per_frame,
+                    timestamp=self.start_time + timedelta(seconds=frame_index / self.video_fps)
+                )
+                record.set_predictions(predictions)
+                self._pending.append(record)
+                self.detections += len(predictions)
+
+        self.frames_analyzed += len(batch)
+        if len(self._pending) >= self.write_batch_size:
+            self._flush()
+
+    def _flush(self):
+        """批量写入缓存的预测结果，一批一次事务"""
+        if not self._pending:
+            return
+        try:
+            db.session.bulk_save_objects(self._pending)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            self._pending = []
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取进度和吞吐量"""
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0
+        fps = self.frames_analyzed / elapsed if elapsed > 0 else 0
+        progress = self.frames_analyzed / self.total_frames if self.total_frames else 0
+        remaining = self.total_frames - self.frames_analyzed
+        return {
+            'id': self.id,
+            'state': self.state,
+            'videoPath': self.video_path,
+            'cameraId': self.camera_id,
+            'modelIds': self.model_ids,
+            'workers': self.workers,
+            'batchSize': self.batch_size,
+            'videoDuration': round(self.video_frames / self.video_fps, 1) if self.video_fps else None,
+            'totalFrames': self.total_frames,
+            'framesDecoded': self.frames_decoded,
+            'framesAnalyzed': self.frames_analyzed,
+            'detections': self.detections,
+            'chunks': {'done': self.chunks_done, 'total': self.chunk_count},
+            'progress': round(min(progress, 1.0) * 100, 1),
+            'fps': round(fps, 2),
+            # 处理速度相对实时播放的倍数
+            'speedup': round(fps * (self.total_frames / self.video_frames) / self.video_fps, 2)
+            if fps and self.video_frames and self.video_fps else None,
+            'elapsed': round(elapsed, 1),
+            'eta': round(remaining / fps, 1) if fps and self.state == JOB_RUNNING else None,
+            'error': self.error,
+            'createdAt': self.created_at,
+            'finishedAt': self.finished_at
+        }
+
+class BatchAnalysisManager:
+    """批量分析任务管理器，限制同时运行的任务数"""
+
+    def __init__(self, max_concurrent_jobs: int = 1, workers: Optional[int] = None,
+                 batch_size: int = 32, max_history: int = 100):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_history = max_history
+        self.jobs: Dict[str, BatchAnalysisJob] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix='batch-analysis')
+        self._lock = threading.Lock()
+
+    def submit(self, app, video_path: str, camera_id: str, model_ids: List[str], **options) -> BatchAnalysisJob:
+        """提交任务，按提交顺序排队执行"""
+        options.setdefault('workers', self.workers)
+        options.setdefault('batch_size', self.batch_size)
+        job = BatchAnalysisJob(video_path, camera_id, model_ids, **options)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self._executor.submit(job.run, app)
+        logger.info(f'提交批量分析任务 {job.id}: {video_path}')
+        return job
+
+    def _prune(self):
+        """只保留最近的已结束任务"""
+        finished = [job for job in self.jobs.values() if job.finished_at]
+        for job in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(self.jobs) - self.max_history)]:
+            self.jobs.pop(job.id, None)
+
+    def get(self, job_id: str) -> Optional[BatchAnalysisJob]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [job.get_status() for job in sorted(self.jobs.values(), key=lambda j: j.created_at, reverse=True)]
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.state not in (JOB_PENDING, JOB_RUNNING):
+            return False
+        job.cancel()
+        return True
+
+# 全局批量分析任务管理器
+batch_analyzer = BatchAnalysisManager(
+    max_concurrent_jobs=int(os.environ.get('BATCH_ANALYSIS_CONCURRENT_JOBS', 1)),
+    workers=int(os.environ.get('BATCH_ANALYSIS_DECODE_WORKERS', 0)) or None,
+    batch_size=int(os.environ.get('BATCH_ANALYSIS_BATCH_SIZE', 32))
+)
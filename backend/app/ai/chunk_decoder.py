@@ -0,0 +1,57 @@
+"""
+录像分段解码
+在独立进程中运行，只依赖OpenCV，避免子进程导入推理框架和数据库
+"""
+
+import cv2
+from typing import List, Optional, Tuple
+
+# 解码进程内的全局变量，由进程池initializer设置
+_frame_queue = None
+_cancel_event = None
+
+def init_decode_worker(frame_queue, cancel_event):
+    global _frame_queue, _cancel_event
+    _frame_queue = frame_queue
+    _cancel_event = cancel_event
+
+def decode_chunk(task: Tuple[int, str, int, int, int, Optional[Tuple[int, int]]]):
+    """解码进程：跳转到时间段起点，按步长抽帧、缩放后放入帧队列"""
+    chunk_index, video_path, start_frame, end_frame, stride, size = task
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError(f'无法打开视频文件: {video_path}')
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        decoded = 0
+        frame_index = start_frame
+        while frame_index < end_frame and not _cancel_event.is_set():
+            if frame_index % stride:
+                # 不分析的帧只grab，省去像素格式转换
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if size and (frame.shape[1], frame.shape[0]) != size:
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                _frame_queue.put(('frame', chunk_index, frame_index, frame))
+                decoded += 1
+            frame_index += 1
+
+        _frame_queue.put(('done', chunk_index, decoded, None))
+
+    except Exception as e:
+        _frame_queue.put(('error', chunk_index, str(e), None))
+    finally:
+        cap.release()
+
+def split_ranges(total_frames: int, chunks: int, stride: int = 1) -> List[Tuple[int, int]]:
+    """把[0, total_frames)切成chunks个连续区间，区间起点对齐抽帧步长"""
+    chunks = max(1, min(chunks, total_frames // max(stride, 1) or 1))
+    size = -(-total_frames // chunks)
+    size = -(-size // stride) * stride
+    return [(start, min(start + size, total_frames)) for start in range(0, total_frames, size)]
@@ -0,0 +1,130 @@
+"""
+FFmpeg rawvideo管道解码器
+解码时完成缩放和抽帧，按固定大小从stdout读入预分配的numpy缓冲
+"""
+
+import subprocess
+import logging
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class FFmpegCapture:
+    """FFmpeg管道捕获器，接口与cv2.VideoCapture的isOpened/read/release一致
+
+    ffmpeg以 -vf fps,scale 在解码阶段缩小分辨率、降低帧率，输出bgr24原始帧，
+    每帧直接readinto到轮换使用的预分配缓冲中。返回的帧在之后buffers-1次read内保持不变，
+    需要长期持有的调用方自行复制（LatestFrameGrabber按reuses_buffers在交出帧时复制）。
+    extra_outputs可以在同一进程中附加其他输出（如HLS），源流只拉取、解码一次。
+    """
+
+    # read()返回的数组会被之后的read()复用
+    reuses_buffers = True
+
+    def __init__(self, stream_url: str, width: int, height: int, fps: Optional[float] = None,
+                 buffers: int = 4, ffmpeg_bin: str = 'ffmpeg', extra_outputs: Optional[List[str]] = None,
+                 on_release: Optional[Callable[[subprocess.Popen], None]] = None):
+        self.stream_url = stream_url
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = fps
+        self.frame_size = self.width * self.height * 3
+        self.extra_outputs = list(extra_outputs or [])
+        self.on_release = on_release
+        self._buffers: List[np.ndarray] = [
+            np.empty((self.height, self.width, 3), dtype=np.uint8) for _ in range(max(2, buffers))
+        ]
+        self._next_buffer = 0
+        self._process: Optional[subprocess.Popen] = None
+
+        try:
+            self._process = subprocess.Popen(
+                self.build_command(ffmpeg_bin),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                stdin=subprocess.DEVNULL,
+                bufsize=self.frame_size
+            )
+        except Exception as e:
+            logger.error(f'启动FFmpeg解码失败: {str(e)}')
+            self._process = None
+
+    def build_command(self, ffmpeg_bin: str = 'ffmpeg') -> List[str]:
+        """构建FFmpeg命令"""
+        filters = []
+        if self.fps:
+            filters.append(f'fps={self.fps}')
+        filters.append(f'scale={self.width}:{self.height}')
+
+        command = [ffmpeg_bin, '-hide_banner', '-loglevel', 'error', '-nostdin']
+        if self.stream_url.startswith('rtsp://'):
+            command += ['-rtsp_transport', 'tcp']
+        command += ['-i', self.stream_url]
+        if self.extra_outputs:
+            # 其他输出在前，原始帧输出只映射视频流
+            command += ['-map', '0:v:0', '-map', '0:a?'] + self.extra_outputs + ['-map', '0:v:0']
+        command += [
+            '-an',
+            '-vf', ','.join(filters),
+            '-pix_fmt', 'bgr24',
+            '-f', 'rawvideo',
+            'pipe:1'
+        ]
+        return command
+
+    @property
+    def process(self) -> Optional[subprocess.Popen]:
+        return self._process
+
+    def isOpened(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def set(self, prop_id, value) -> bool:
+        """兼容cv2.VideoCapture.set，管道模式下不支持属性设置"""
+        return False
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """读取一帧到下一个预分配缓冲"""
+        if self._process is None or self._process.stdout is None:
+            return False, None
+
+        frame = self._buffers[self._next_buffer]
+        view = memoryview(frame).cast('B')
+        received = 0
+        while received < self.frame_size:
+            count = self._process.stdout.readinto(view[received:])
+            if not count:
+                return False, None
+            received += count
+
+        self._next_buffer = (self._next_buffer + 1) % len(self._buffers)
+        return True, frame
+
+    def release(self):
+        """终止FFmpeg进程"""
+        if self._process is None:
+            return
+        try:
+            if self.on_release is not None:
+                self.on_release(self._process)
+            self._process.terminate()
+            self._process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        except Exception as e:
+            logger.error(f'关闭FFmpeg解码失败: {str(e)}')
+        finally:
+            if self._process.stdout is not None:
+                self._process.stdout.close()
+            self._process = None
+
+def decode_size(config: dict, resolution: Optional[tuple], default_width: int = 640) -> Tuple[int, int]:
+    """根据配置和摄像头分辨率计算解码输出尺寸（保持宽高比，取偶数）"""
+    width = int(config.get('decode_width') or default_width)
+    height = config.get('decode_height')
+    if not height:
+        src_width, src_height = resolution or (1920, 1080)
+        height = width * src_height / src_width
+    return width - width % 2, int(height) - int(height) % 2
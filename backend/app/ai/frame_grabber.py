@@ -0,0 +1,184 @@
+"""
+最新帧抓取器
+每个摄像头一个独立的抓帧线程，只保留最新解码的一帧
+"""
+
+import cv2
+import numpy as np
+import logging
+import threading
+import time
+from typing import Callable, Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+class LatestFrameGrabber:
+    """最新帧抓取器
+
+    抓帧线程持续读取视频流以清空解码缓冲，分析端按需拉取当前最新帧，
+    分析延迟因此最多为一个帧间隔，而不是缓冲深度。
+    捕获器复用输出缓冲（reuses_buffers，如FFmpegCapture）时，在交出帧时复制一份，
+    之后的抓帧不会改写已交给分析、快照编码或调度队列的帧。
+    """
+
+    def __init__(self, camera_id: str, stream_url: str, capture_factory: Optional[Callable] = None):
+        self.camera_id = camera_id
+        self.stream_url = stream_url
+        self._capture_factory = capture_factory or cv2.VideoCapture
+        self._cap = None
+        self._copy_frames = False
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._condition = threading.Condition()
+
+        self._frame = None
+        self._frame_id = 0
+        self._frame_time = 0.0
+        self._consumed_id = 0
+        self.last_read_time = 0.0
+
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.start_time = 0.0
+        self.ended = False
+
+    def start(self) -> bool:
+        """打开视频流并启动抓帧线程"""
+        try:
+            self._cap = self._capture_factory(self.stream_url)
+            if not self._cap.isOpened():
+                logger.error(f'无法打开视频流: {self.stream_url}')
+                return False
+
+            self._copy_frames = bool(getattr(self._cap, 'reuses_buffers', False))
+            # 尽量缩小解码端缓冲，部分后端不支持时忽略
+            if hasattr(self._cap, 'set'):
+                self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+            self.start_time = time.time()
+            self._thread = threading.Thread(target=self._grab_loop, name=f'grabber-{self.camera_id}')
+            self._thread.daemon = True
+            self._thread.start()
+            return True
+
+        except Exception as e:
+            logger.error(f'启动抓帧线程失败: {str(e)}')
+            return False
+
+    def stop(self, timeout: float = 5):
+        """停止抓帧线程并释放视频流"""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def _grab_loop(self):
+        """抓帧循环"""
+        try:
+            while not self._stop_event.is_set():
+                ret, frame = self._cap.read()
+                if not ret:
+                    logger.warning(f'无法读取帧: {self.camera_id}')
+                    break
+
+                with self._condition:
+                    # 上一帧还未被取走就被覆盖，记为丢帧
+                    if self._frame_id > self._consumed_id:
+                        self.frames_dropped += 1
+                    self._frame = frame
+                    self._frame_id += 1
+                    self._frame_time = time.time()
+                    self.frames_read += 1
+                    self._condition.notify_all()
+
+        except Exception as e:
+            logger.error(f'抓帧失败: {str(e)}')
+        finally:
+            with self._condition:
+                self.ended = True
+                self._condition.notify_all()
+
+    def read(self, after_id: int = 0, timeout: Optional[float] = None) -> Tuple[int, Optional[np.ndarray]]:
+        """获取最新帧
+
+        Args:
+            after_id: 只返回编号大于该值的帧
+            timeout: 等待新帧的最长时间（秒），None表示一直等待
+
+        Returns:
+            (帧编号, 帧)，超时或流结束时帧为None
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._frame_id <= after_id:
+                if self.ended or self._stop_event.is_set():
+                    return self._frame_id, None
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return self._frame_id, None
+                self._condition.wait(remaining)
+
+            self._consumed_id = self._frame_id
+            self.last_read_time = self._frame_time
+            return self._frame_id, self._hand_off()
+
+    def peek(self) -> Tuple[int, Optional[np.ndarray], float]:
+        """不等待、不标记消费地查看最新帧"""
+        with self._condition:
+            return self._frame_id, self._hand_off(), self._frame_time
+
+    def _hand_off(self) -> Optional[np.ndarray]:
+        """交出当前帧（持有锁时调用）
+
+        抓帧线程发布下一帧前需要拿到锁，持锁期间最多再向另一个缓冲写入一帧，复制时当前缓冲不会被改写。
+        """
+        if self._copy_frames and self._frame is not None:
+            return self._frame.copy()
+        return self._frame
+
+    def is_alive(self) -> bool:
+        """抓帧线程是否仍在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取抓帧统计"""
+        elapsed = time.time() - self.start_time if self.start_time else 0
+        return {
+            'frames_read': self.frames_read,
+            'frames_dropped': self.frames_dropped,
+            'decode_fps': round(self.frames_read / elapsed, 2) if elapsed > 0 else 0,
+            'frame_age': round(time.time() - self._frame_time, 3) if self._frame_time else None,
+            'alive': self.is_alive()
+        }
+
+class GrabberRegistry:
+    """正在运行的流水线抓帧句柄（按摄像头）
+
+    视频处理器和视频流接口的流水线各自创建抓帧句柄，启动后登记、结束时注销，
+    快照等只读方从这里取最新帧，不再为同一摄像头另开一路连接。
+    """
+
+    def __init__(self):
+        self._grabbers: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, camera_id: str, grabber: Any):
+        with self._lock:
+            self._grabbers[camera_id] = grabber
+
+    def unregister(self, camera_id: str, grabber: Any):
+        """注销抓帧句柄；该摄像头已登记了其他句柄（如重连后的新流水线）时保持不变"""
+        with self._lock:
+            if self._grabbers.get(camera_id) is grabber:
+                del self._grabbers[camera_id]
+
+    def get(self, camera_id: str) -> Optional[Any]:
+        with self._lock:
+            return self._grabbers.get(camera_id)
+
+# 全局抓帧句柄登记表
+grabber_registry = GrabberRegistry()
@@ -0,0 +1,278 @@
+"""
+跨摄像头动态批处理推理调度器
+"""
+
+import os
+import queue
+import logging
+import threading
+import time
+import numpy as np
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional
+from app.ai.model_manager import model_manager
+from app.ai.model_registry import model_registry
+from app.ai.model_config import inference_concurrency
+from app.ai.lazy_import import loaded_framework
+from app.ai.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+class InferenceRequest:
+    """单帧推理请求"""
+
+    __slots__ = ('camera_id', 'frame', 'future', 'enqueue_time')
+
+    def __init__(self, camera_id: Optional[str], frame: np.ndarray):
+        self.camera_id = camera_id
+        self.frame = frame
+        self.future = Future()
+        self.enqueue_time = time.time()
+
+class FairRequestQueue:
+    """按摄像头轮转出队的请求队列
+
+    每个摄像头一个子队列，出队时在有待处理请求的摄像头之间轮转，
+    帧率高或积压多的摄像头不会挤占其他摄像头的推理机会。
+    """
+
+    def __init__(self):
+        self._queues: Dict[Optional[str], deque] = {}
+        self._order: deque = deque()
+        self._size = 0
+        self._not_empty = threading.Condition()
+
+    def put(self, request: InferenceRequest):
+        with self._not_empty:
+            camera_queue = self._queues.get(request.camera_id)
+            if camera_queue is None:
+                camera_queue = self._queues[request.camera_id] = deque()
+                self._order.append(request.camera_id)
+            camera_queue.append(request)
+            self._size += 1
+            self._not_empty.notify()
+
+    def get(self, timeout: Optional[float] = None) -> InferenceRequest:
+        """取出下一个摄像头的最早请求，超时抛出queue.Empty"""
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._size > 0, timeout):
+                raise queue.Empty
+            camera_id = self._order.popleft()
+            camera_queue = self._queues[camera_id]
+            request = camera_queue.popleft()
+            self._size -= 1
+            if camera_queue:
+                self._order.append(camera_id)
+            else:
+                del self._queues[camera_id]
+            return request
+
+    def get_nowait(self) -> InferenceRequest:
+        return self.get(timeout=0)
+
+    def qsize(self) -> int:
+        return self._size
+
+    def depth_by_camera(self) -> Dict[str, int]:
+        """各摄像头的待处理请求数"""
+        with self._not_empty:
+            return {str(camera_id): len(camera_queue) for camera_id, camera_queue in self._queues.items()}
+
+class InferenceScheduler:
+    """推理调度器
+
+    每个模型一个按摄像头公平轮转的队列和一组工作线程（数量即该模型的并发上限）。
+    工作线程收到第一帧后在批处理窗口内继续收集其他摄像头的帧（最多max_batch_size帧，不超过模型输入的固定批次维），
+    合并为一次前向推理，再把结果分发给各自的请求方。
+    ONNX会话的intra-op线程数按每个工作线程的预算设置（每个会话独立）；
+    torch的计算线程数是进程级设置，无法按线程限制，取所有PyTorch模型中最小的单工作线程预算统一设置，
+    并发推理的PyTorch工作线程合计不超过CPU核数。
+    """
+
+    def __init__(self, manager=None, batch_window: float = 0.01, max_batch_size: int = 16,
+                 model_provider=None, variant_selector=None):
+        self.manager = manager or model_manager
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.model_provider = model_provider or model_registry.get
+        self.variant_selector = variant_selector or model_registry.select_variant
+        self.queues: Dict[str, FairRequestQueue] = {}
+        self.workers: Dict[str, List[threading.Thread]] = {}
+        self.concurrency: Dict[str, Dict[str, int]] = {}
+        self.busy_workers: Dict[str, int] = {}
+        self.batch_size_histograms: Dict[str, Histogram] = {}
+        self.queue_wait_histograms: Dict[str, Histogram] = {}
+        # PyTorch模型ID -> 单个工作线程的计算线程预算，以及当前生效的torch进程级线程数
+        self.torch_budgets: Dict[str, int] = {}
+        self.torch_threads: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def submit(self, model_id: str, frame: np.ndarray, camera_id: Optional[str] = None) -> Future:
+        """提交一帧到模型队列，返回结果Future
+        
+        原模型有在精度容差内更快的低精度版本时，帧进入该版本的队列（结果格式不变）。
+        """
+        request = InferenceRequest(camera_id, frame)
+        self._get_queue(self.variant_selector(model_id)).put(request)
+        return request.future
+
+    def predict(self, model_id: str, frame: np.ndarray, camera_id: Optional[str] = None,
+                timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """提交一帧并等待结果"""
+        try:
+            return self.submit(model_id, frame, camera_id).result(timeout=timeout)
+        except Exception as e:
+            logger.error(f'调度推理失败: {str(e)}')
+            return []
+
+    def _get_queue(self, model_id: str) -> FairRequestQueue:
+        """获取模型队列，首次使用时按模型的并发配置启动工作线程"""
+        with self._lock:
+            if model_id not in self.queues:
+                self._stop_event.clear()
+                model = self.model_provider(model_id)
+                workers, threads = inference_concurrency(model)
+                if model is not None and model.framework == 'pytorch':
+                    self.torch_budgets[model_id] = threads
+                request_queue = FairRequestQueue()
+                self.queues[model_id] = request_queue
+                self.concurrency[model_id] = {'workers': workers, 'threadsPerWorker': threads}
+                self.busy_workers[model_id] = 0
+                self.batch_size_histograms[model_id] = Histogram(BATCH_SIZE_BUCKETS)
+                self.queue_wait_histograms[model_id] = Histogram()
+
+                self.workers[model_id] = []
+                for index in range(workers):
+                    worker = threading.Thread(
+                        target=self._worker_loop,
+                        args=(model_id, request_queue),
+                        name=f'inference-{model_id}-{index}'
+                    )
+                    worker.daemon = True
+                    worker.start()
+                    self.workers[model_id].append(worker)
+                logger.info(f'启动模型 {model_id} 的推理工作线程: {workers} 个，每个 {threads} 个计算线程')
+            return self.queues[model_id]
+
+    def _apply_torch_threads(self):
+        """按PyTorch模型的线程预算设置torch的进程级计算线程数（预算变化或torch刚导入时才调用set_num_threads）"""
+        torch = loaded_framework('torch')
+        if torch is None:
+            return
+        with self._lock:
+            if not self.torch_budgets:
+                return
+            threads = min(self.torch_budgets.values())
+            if threads == self.torch_threads:
+                return
+            self.torch_threads = threads
+        try:
+            torch.set_num_threads(threads)
+            logger.info(f'torch计算线程数设置为 {threads}（进程级，所有PyTorch推理共用）')
+        except Exception as e:
+            logger.warning(f'设置torch计算线程数失败: {str(e)}')
+
+    def _worker_loop(self, model_id: str, request_queue: FairRequestQueue):
+        """收集批次并执行推理"""
+        while not self._stop_event.is_set():
+            try:
+                first = request_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            # 模型输入的批次维固定时，每批不超过该大小
+            batch_limit = min(self.max_batch_size, self.manager.max_batch_size(model_id) or self.max_batch_size)
+            batch = [first]
+            deadline = time.time() + self.batch_window
+            while len(batch) < batch_limit:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(request_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            if model_id in self.torch_budgets:
+                self._apply_torch_threads()
+            with self._lock:
+                self.busy_workers[model_id] += 1
+            try:
+                self._run_batch(model_id, batch)
+            finally:
+                with self._lock:
+                    self.busy_workers[model_id] -= 1
+
+        # 退出前让剩余请求返回空结果，避免调用方一直等待
+        while True:
+            try:
+                request = request_queue.get_nowait()
+            except queue.Empty:
+                break
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_result([])
+
+    def _run_batch(self, model_id: str, batch: List[InferenceRequest]):
+        """执行一个批次并分发结果"""
+        start_time = time.time()
+        wait_histogram = self.queue_wait_histograms[model_id]
+        for request in batch:
+            wait_histogram.observe((start_time - request.enqueue_time) * 1000)
+
+        # 预处理后输入形状不同的帧无法拼成一个张量，按模型管理器给出的分组键分组推理
+        groups: Dict[tuple, List[InferenceRequest]] = {}
+        for request in batch:
+            if request.future.set_running_or_notify_cancel():
+                groups.setdefault(self.manager.batch_key(model_id, request.frame), []).append(request)
+
+        for requests in groups.values():
+            self.batch_size_histograms[model_id].observe(len(requests))
+            try:
+                results = self.manager.predict_batch(model_id, [r.frame for r in requests])
+                for request, result in zip(requests, results):
+                    request.future.set_result(result)
+            except Exception as e:
+                logger.error(f'批量推理失败: {str(e)}')
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def stop(self):
+        """停止所有工作线程"""
+        self._stop_event.set()
+        for workers in list(self.workers.values()):
+            for worker in workers:
+                worker.join(timeout=5)
+        with self._lock:
+            self.queues.clear()
+            self.workers.clear()
+            self.concurrency.clear()
+            self.torch_budgets.clear()
+            self.torch_threads = None
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各模型的批大小和排队等待直方图"""
+        return {
+            model_id: {
+                'queue_depth': request_queue.qsize(),
+                'queue_depth_by_camera': request_queue.depth_by_camera(),
+                'workers': self.concurrency[model_id]['workers'],
+                'threads_per_worker': self.concurrency[model_id]['threadsPerWorker'],
+                # PyTorch模型实际生效的是进程级线程数
+                'torch_threads': self.torch_threads if model_id in self.torch_budgets else None,
+                'busy_workers': self.busy_workers[model_id],
+                'batch_size': self.batch_size_histograms[model_id].snapshot(),
+                'queue_wait_ms': self.queue_wait_histograms[model_id].snapshot()
+            }
+            for model_id, request_queue in list(self.queues.items())
+        }
+
+# 全局推理调度器实例
+inference_scheduler = InferenceScheduler(
+    batch_window=float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', 10)) / 1000.0,
+    max_batch_size=int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', 16))
+)
@@ -0,0 +1,41 @@
+"""
+深度学习框架延迟导入
+torch、tensorflow等框架只在加载对应框架的模型时才导入，并记录每个框架的导入耗时
+"""
+
+import importlib
+import logging
+import sys
+import threading
+import time
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+_import_times: Dict[str, float] = {}
+_lock = threading.Lock()
+
+def import_framework(name: str):
+    """导入框架模块，首次导入时记录耗时"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    with _lock:
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        elapsed = time.perf_counter() - start
+        _import_times[name] = elapsed
+    logger.info(f'导入 {name} 耗时 {elapsed:.2f}s')
+    return module
+
+def loaded_framework(name: str):
+    """已导入时返回框架模块，否则返回None（不触发导入）"""
+    return sys.modules.get(name)
+
+def get_import_profile() -> Dict[str, Any]:
+    """各框架的首次导入耗时（秒）"""
+    return {name: round(elapsed, 3) for name, elapsed in _import_times.items()}
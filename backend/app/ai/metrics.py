@@ -0,0 +1,190 @@
+"""
+推理流水线指标工具
+"""
+
+import bisect
+import time
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+# 默认耗时分桶（毫秒）
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class Histogram:
+    """固定分桶直方图
+
+    观测只做一次二分查找和计数自增，不加锁；并发下极少量计数竞争可以接受。
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        """记录一个观测值"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """按分桶上界估算分位数，q取值0-100"""
+        if self.count == 0:
+            return None
+        target = self.count * q / 100.0
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出直方图数据"""
+        labels: List[str] = [f'le_{b}' for b in self.buckets] + ['inf']
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 3) if self.count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+class RateMeter:
+    """滑动窗口速率计
+
+    按秒分槽计数，读取时汇总最近window个完整秒；只做自增，不加锁。
+    """
+
+    def __init__(self, window: int = 10):
+        self.window = window
+        self._seconds = [0] * (window + 1)
+        self._counts = [0] * (window + 1)
+        self._start = int(time.time())
+        self.total = 0
+
+    def mark(self, count: int = 1, now: Optional[float] = None):
+        """记录count个事件"""
+        second = int(time.time() if now is None else now)
+        slot = second % len(self._seconds)
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._counts[slot] = 0
+        self._counts[slot] += count
+        self.total += count
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """最近窗口内的每秒事件数（不含当前未结束的一秒）"""
+        second = int(time.time() if now is None else now)
+        span = max(1, min(self.window, second - self._start))
+        count = sum(c for s, c in zip(self._seconds, self._counts) if 0 < second - s <= span)
+        return count / span
+
+class CameraMetrics:
+    """单个摄像头流水线的指标"""
+
+    def __init__(self, camera_id: str, group: str):
+        self.camera_id = camera_id
+        self.group = group
+        self._source_decoded = 0
+        self._source_dropped = 0
+        self.reset()
+
+    def reset(self):
+        """清零所有指标（基准测试预热结束时使用），帧源累计计数的基准保持不变"""
+        self.decode_rate = RateMeter()
+        self.analyzed_rate = RateMeter()
+        self.inference_latency: Dict[str, Histogram] = {}
+        self.end_to_end_latency = Histogram()
+
+        self.frames_decoded = 0
+        self.frames_dropped = 0
+        self.frames_analyzed = 0
+        self.frames_skipped = 0
+        self.connects = 0
+
+    @property
+    def reconnects(self) -> int:
+        return max(0, self.connects - 1)
+
+    def on_connect(self):
+        """流（重新）连接，新的帧源计数从0开始"""
+        self.connects += 1
+        self._source_decoded = 0
+        self._source_dropped = 0
+
+    def update_source(self, frames_read: int, frames_dropped: int):
+        """根据帧源的累计计数更新解码帧数和丢帧数"""
+        decoded = frames_read - self._source_decoded
+        if decoded > 0:
+            self.decode_rate.mark(decoded)
+            self.frames_decoded += decoded
+            self._source_decoded = frames_read
+        dropped = frames_dropped - self._source_dropped
+        if dropped > 0:
+            self.frames_dropped += dropped
+            self._source_dropped = frames_dropped
+
+    def observe_inference(self, model_id: str, latency_ms: float):
+        """记录单个模型的推理耗时（含排队）"""
+        histogram = self.inference_latency.get(model_id)
+        if histogram is None:
+            histogram = self.inference_latency.setdefault(model_id, Histogram())
+        histogram.observe(latency_ms)
+
+    def observe_analyzed(self, frame_time: Optional[float] = None):
+        """一帧分析完成，frame_time为该帧解码完成的时间"""
+        self.analyzed_rate.mark()
+        self.frames_analyzed += 1
+        if frame_time:
+            self.end_to_end_latency.observe((time.time() - frame_time) * 1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'cameraId': self.camera_id,
+            'group': self.group,
+            'decodeFps': round(self.decode_rate.rate(), 2),
+            'analyzedFps': round(self.analyzed_rate.rate(), 2),
+            'framesDecoded': self.frames_decoded,
+            'framesAnalyzed': self.frames_analyzed,
+            'framesDropped': self.frames_dropped,
+            'framesSkipped': self.frames_skipped,
+            'reconnects': self.reconnects,
+            'inferenceLatencyMs': {
+                model_id: histogram.snapshot() for model_id, histogram in list(self.inference_latency.items())
+            },
+            'endToEndLatencyMs': self.end_to_end_latency.snapshot()
+        }
+
+class PipelineMetrics:
+    """所有摄像头流水线的指标登记表"""
+
+    def __init__(self):
+        self.cameras: Dict[Tuple[str, str], CameraMetrics] = {}
+
+    def camera(self, camera_id: str, group: str = 'analysis') -> CameraMetrics:
+        """获取（必要时创建）摄像头指标"""
+        key = (group, camera_id)
+        metrics = self.cameras.get(key)
+        if metrics is None:
+            metrics = self.cameras.setdefault(key, CameraMetrics(camera_id, group))
+        return metrics
+
+    def reset(self):
+        """清零所有摄像头的指标"""
+        for metrics in list(self.cameras.values()):
+            metrics.reset()
+
+    def remove(self, camera_id: str, group: str = 'analysis'):
+        self.cameras.pop((group, camera_id), None)
+
+    def snapshot(self, camera_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [
+            metrics.snapshot()
+            for (_, cid), metrics in list(self.cameras.items())
+            if camera_id is None or cid == camera_id
+        ]
+
+# 全局流水线指标实例
+pipeline_metrics = PipelineMetrics()
@@ -0,0 +1,270 @@
+"""
+模型基准测试
+在本机上按批次大小、输入尺寸和计算线程数扫描模型的推理性能，统计预热后的延迟分位数、吞吐量和峰值内存，
+结果写入 AIModel.performance_metrics，作为容量规划（每个模型能带多少路摄像头）的依据
+"""
+
+import os
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from app import db
+from app.models.ai_model import AIModel
+from app.ai.lazy_import import loaded_framework
+from app.ai.model_manager import model_manager, _resident_mb
+from app.ai.model_registry import ModelSnapshot
+from app.ai.onnx_runtime import OnnxRunner, load_session_config, create_session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZES = (1, 2, 4, 8)
+DEFAULT_ITERATIONS = 30
+DEFAULT_WARMUP_RUNS = 3
+# 测试帧尺寸（宽, 高），与摄像头常见分辨率一致，预处理的缩放开销计入延迟
+DEFAULT_FRAME_SIZE = (1280, 720)
+
+def _default_thread_counts() -> List[int]:
+    """默认扫描的线程数：1、2、4…直到CPU核数"""
+    cpus = os.cpu_count() or 1
+    counts = []
+    threads = 1
+    while threads < cpus:
+        counts.append(threads)
+        threads *= 2
+    counts.append(cpus)
+    return counts
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    """精确延迟分位数（毫秒）"""
+    values = np.asarray(latencies)
+    return {
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+        'avg': round(float(values.mean()), 3),
+        'min': round(float(values.min()), 3),
+        'max': round(float(values.max()), 3)
+    }
+
+class ModelBenchmark:
+    """模型基准测试
+
+    每个(输入尺寸, 线程数)组合单独建立模型条目（ONNX按线程数重建会话，PyTorch设置torch线程数），
+    再依次测试各批次大小：先推理warmup_runs次丢弃，之后逐次计时。
+    TensorFlow的线程池在首次使用后无法调整，只按默认线程数测试。
+    """
+
+    def __init__(self, batch_sizes: Optional[List[int]] = None, input_sizes: Optional[List[str]] = None,
+                 thread_counts: Optional[List[int]] = None, iterations: int = DEFAULT_ITERATIONS,
+                 warmup_runs: int = DEFAULT_WARMUP_RUNS, frame_size: Tuple[int, int] = DEFAULT_FRAME_SIZE):
+        self.batch_sizes = list(batch_sizes or DEFAULT_BATCH_SIZES)
+        self.input_sizes = list(input_sizes or [])
+        self.thread_counts = list(thread_counts or _default_thread_counts())
+        self.iterations = max(1, iterations)
+        self.warmup_runs = max(1, warmup_runs)
+        self.frame_size = frame_size
+
+    def _frames(self, count: int) -> List[np.ndarray]:
+        """固定种子的随机帧，每次测试输入一致"""
+        width, height = self.frame_size
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+    def _create_entry(self, model: ModelSnapshot, threads: Optional[int]) -> Dict[str, Any]:
+        """按线程数建立独立的模型条目（不登记到模型缓存，不影响线上推理）"""
+        loaded_model = None
+        if model.framework == 'onnx' and threads:
+            config = load_session_config(model)
+            config['intraOpThreads'] = threads
+            config['interOpThreads'] = 1
+            # 测试过程中不写优化模型缓存，避免与线上会话使用的缓存文件互相覆盖
+            config['optimizedModelDir'] = None
+            loaded_model = OnnxRunner(create_session(model.model_path, config), config)
+        entry = model_manager._create_entry(model, loaded_model)
+        if entry is None:
+            raise RuntimeError(f'不支持的框架: {model.framework}')
+        return entry
+
+    def _set_torch_threads(self, threads: Optional[int]) -> Optional[int]:
+        """设置torch计算线程数，返回原来的线程数"""
+        torch = loaded_framework('torch')
+        if torch is None or not threads:
+            return None
+        previous = torch.get_num_threads()
+        torch.set_num_threads(threads)
+        return previous
+
+    def _measure(self, entry: Dict[str, Any], batch_size: int, frames: List[np.ndarray]) -> Dict[str, Any]:
+        """测试一个批次大小"""
+        max_batch = entry.get('max_batch_size')
+        if max_batch and batch_size > max_batch:
+            # 推理时会拆成多次执行，测得的不是该批次大小的性能
+            raise RuntimeError(f'模型输入的批次大小固定为 {max_batch}')
+        batch = frames[:batch_size]
+        for _ in range(self.warmup_runs):
+            model_manager._predict_entry(entry, batch)
+
+        latencies = []
+        peak_rss = _resident_mb()
+        started = time.perf_counter()
+        for _ in range(self.iterations):
+            run_start = time.perf_counter()
+            model_manager._predict_entry(entry, batch)
+            latencies.append((time.perf_counter() - run_start) * 1000)
+            peak_rss = max(peak_rss, _resident_mb())
+        elapsed = time.perf_counter() - started
+
+        return {
+            'batchSize': batch_size,
+            'latencyMs': _percentiles(latencies),
+            'perFrameMs': round(float(np.median(latencies)) / batch_size, 3),
+            'throughputFps': round(batch_size * self.iterations / elapsed, 2),
+            'peakRssMb': round(peak_rss, 1)
+        }
+
+    def run(self, model: ModelSnapshot, progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """执行全部组合的测试，返回结果（不写数据库）
+
+        Args:
+            model: 模型记录快照
+            progress: 可选的进度字典，测试过程中更新 completed / total
+        """
+        if not os.path.exists(model.model_path):
+            raise RuntimeError(f'模型文件不存在: {model.model_path}')
+
+        input_sizes = self.input_sizes or [model.input_size]
+        thread_counts = self.thread_counts if model.framework in ('onnx', 'pytorch') else [None]
+        frames = self._frames(max(self.batch_sizes))
+        total = len(input_sizes) * len(thread_counts) * len(self.batch_sizes)
+        if progress is not None:
+            progress.update({'completed': 0, 'total': total})
+
+        results = []
+        started = time.time()
+        for input_size in input_sizes:
+            for threads in thread_counts:
+                variant = ModelSnapshot(**dict(vars(model), input_size=input_size))
+                previous_threads = None
+                try:
+                    entry = self._create_entry(variant, threads)
+                    if model.framework == 'pytorch':
+                        # 加载模型时才导入torch，线程数在建立条目之后设置
+                        previous_threads = self._set_torch_threads(threads)
+                    for batch_size in self.batch_sizes:
+                        try:
+                            result = self._measure(entry, batch_size, frames)
+                        except Exception as e:
+                            # 固定输入形状的模型不支持其他批次大小或输入尺寸，记录失败继续测试
+                            logger.warning(f'基准测试失败: {model.id} 输入{input_size} 线程{threads} 批次{batch_size}: {str(e)}')
+                            result = {'batchSize': batch_size, 'error': str(e).splitlines()[0] if str(e) else type(e).__name__}
+                        result.update({'inputSize': input_size, 'threads': threads})
+                        results.append(result)
+                        if progress is not None:
+                            progress['completed'] += 1
+                    del entry
+                except Exception as e:
+                    logger.warning(f'基准测试模型加载失败: {model.id} 输入{input_size} 线程{threads}: {str(e)}')
+                    for batch_size in self.batch_sizes:
+                        results.append({'batchSize': batch_size, 'inputSize': input_size, 'threads': threads, 'error': str(e).splitlines()[0] if str(e) else type(e).__name__})
+                    if progress is not None:
+                        progress['completed'] += len(self.batch_sizes)
+                finally:
+                    if previous_threads is not None:
+                        self._set_torch_threads(previous_threads)
+
+        succeeded = [result for result in results if 'error' not in result]
+        best_latency = min(succeeded, key=lambda result: result['latencyMs']['p95'], default=None)
+        best_throughput = max(succeeded, key=lambda result: result['throughputFps'], default=None)
+        return {
+            'runAt': datetime.utcnow().isoformat(),
+            'host': {'cpuCount': os.cpu_count(), 'node': os.uname().nodename if hasattr(os, 'uname') else None},
+            'framework': model.framework,
+            'version': model.version,
+            'frameSize': f'{self.frame_size[0]}x{self.frame_size[1]}',
+            'iterations': self.iterations,
+            'warmupRuns': self.warmup_runs,
+            'seconds': round(time.time() - started, 2),
+            # 单帧延迟最低的组合，以及吞吐量最高的组合
+            'bestLatency': best_latency,
+            'bestThroughput': best_throughput,
+            'results': results
+        }
+
+class BenchmarkService:
+    """在后台线程中运行基准测试并把结果写入模型记录，同一时间只运行一个测试（测试会占满CPU）"""
+
+    def __init__(self):
+        self.status: Dict[str, Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app, model_id: str, benchmark: ModelBenchmark) -> bool:
+        """开始测试；已有测试在进行时返回False"""
+        with self._lock:
+            if self.is_running():
+                return False
+            status = {'state': 'pending', 'startedAt': time.time(), 'error': None}
+            self.status[model_id] = status
+            self._thread = threading.Thread(target=self._run, args=(app, model_id, benchmark, status),
+                                            name=f'model-benchmark-{model_id}')
+            self._thread.daemon = True
+            self._thread.start()
+        return True
+
+    def _run(self, app, model_id: str, benchmark: ModelBenchmark, status: Dict[str, Any]):
+        try:
+            with app.app_context():
+                model = AIModel.query.get(model_id)
+                if model is None:
+                    raise RuntimeError('模型不存在')
+                snapshot = ModelSnapshot.from_model(model)
+
+            status['state'] = 'running'
+            result = benchmark.run(snapshot, progress=status)
+
+            with app.app_context():
+                model = AIModel.query.get(model_id)
+                if model is None:
+                    raise RuntimeError('模型不存在')
+                save_benchmark(model, result)
+                db.session.commit()
+
+            status['state'] = 'completed'
+            logger.info(f'模型基准测试完成: {model_id}，耗时 {result["seconds"]}s')
+
+        except Exception as e:
+            status['state'] = 'failed'
+            status['error'] = str(e)
+            logger.error(f'模型基准测试失败: {model_id}: {str(e)}')
+        finally:
+            status['finishedAt'] = time.time()
+
+def save_benchmark(model, result: Dict[str, Any]):
+    """把测试结果合并进模型的performance_metrics（保留其他指标，覆盖上一次基准测试）"""
+    metrics = model.get_performance_metrics() or {}
+    metrics['benchmark'] = result
+    model.set_performance_metrics(metrics)
+    model.updated_at = datetime.utcnow()
+
+def benchmark_summary(metrics: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """从performance_metrics中取出基准测试的关键数字"""
+    benchmark = (metrics or {}).get('benchmark')
+    if not benchmark:
+        return None
+    best_latency = benchmark.get('bestLatency') or {}
+    best_throughput = benchmark.get('bestThroughput') or {}
+    return {
+        'runAt': benchmark.get('runAt'),
+        'p95LatencyMs': (best_latency.get('latencyMs') or {}).get('p95'),
+        'maxThroughputFps': best_throughput.get('throughputFps'),
+        'peakRssMb': max((result.get('peakRssMb', 0) for result in benchmark.get('results', [])), default=None)
+    }
+
+# 全局基准测试服务实例
+benchmark_service = BenchmarkService()
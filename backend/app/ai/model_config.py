@@ -0,0 +1,42 @@
+"""
+模型运行配置
+读取模型配置文件（config_path指向的JSON）中的分段配置，并计算每个模型的推理并发和线程预算
+"""
+
+import os
+import json
+import logging
+from typing import Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每个模型的推理工作线程数，以及每个工作线程的计算线程数（0表示按CPU核数平均分配）
+INFERENCE_WORKERS_PER_MODEL = int(os.environ.get('INFERENCE_WORKERS_PER_MODEL', 1))
+INFERENCE_THREADS_PER_WORKER = int(os.environ.get('INFERENCE_THREADS_PER_WORKER', 0))
+
+def load_model_config(model, section: str) -> Dict[str, Any]:
+    """读取模型配置文件中的一段，文件不存在或不是JSON时返回空字典"""
+    if model is None or not model.config_path or not model.config_path.endswith('.json'):
+        return {}
+    if not os.path.exists(model.config_path):
+        return {}
+    try:
+        with open(model.config_path, 'r', encoding='utf-8') as f:
+            value = json.load(f).get(section) or {}
+        return value if isinstance(value, dict) else {}
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f'读取模型配置文件失败: {model.config_path}: {str(e)}')
+        return {}
+
+def inference_concurrency(model) -> Tuple[int, int]:
+    """模型的(工作线程数, 每个工作线程的计算线程数)
+
+    配置文件 inference 段的 workers / threadsPerWorker 优先，其次使用环境变量；
+    未指定计算线程数时按 CPU核数 / 工作线程数 分配，所有工作线程同时推理也不会超额占用CPU。
+    """
+    config = load_model_config(model, 'inference')
+    workers = max(1, int(config.get('workers') or INFERENCE_WORKERS_PER_MODEL))
+    threads = int(config.get('threadsPerWorker') or INFERENCE_THREADS_PER_WORKER)
+    if threads <= 0:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    return workers, threads
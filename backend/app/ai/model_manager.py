@@ -3,27 +3,114 @@ AI模型管理器
 """
 
 import os
+import gc
+import json
 import logging
-import torch
-import cv2
+import threading
+import time
 import numpy as np
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
 from app.models.ai_model import AIModel
+from app.ai.model_registry import model_registry
+from app.ai.preprocess import Preprocessor
+from app.ai.lazy_import import import_framework, loaded_framework, get_import_profile
+from app.ai.onnx_runtime import OnnxRunner, load_session_config, create_session
+from app.ai.postprocess import (decode_yolo, filter_detections, detections_to_dicts, make_detections,
+                                empty_detections)
+from app.ai.tiling import make_tiles, merge_tile_predictions
 
 logger = logging.getLogger(__name__)
 
+# 检测后处理：NMS重叠度阈值、每帧最多保留的检测框数
+NMS_IOU_THRESHOLD = 0.45
+MAX_DETECTIONS = 100
+
+def _resident_mb() -> float:
+    """当前进程常驻内存（MB）
+
+    Linux读取/proc；其他系统（包括Windows）有psutil时使用psutil，都不可用时返回0，
+    模型占用随之按模型文件大小估算。不使用resource的ru_maxrss：它是峰值而不是当前值（macOS上单位还是字节），
+    加载前后相减得不到模型的占用。
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return 0.0
+
+def _path_size_mb(path: str) -> float:
+    """模型文件（或SavedModel目录）大小（MB）"""
+    if not path or not os.path.exists(path):
+        return 0.0
+    if os.path.isfile(path):
+        return os.path.getsize(path) / (1024 * 1024)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
 class ModelManager:
-    """AI模型管理器"""
+    """AI模型管理器
+
+    已加载的模型按最近使用顺序缓存。设置内存预算后，加载新模型使总占用超出预算时
+    淘汰最久未使用且未固定的模型，被淘汰的模型在下次使用时重新加载。
+    每个模型的占用按加载前后进程常驻内存的增量估算（不低于模型文件大小）。
+    """
+    
+    def __init__(self, memory_budget_mb: float = 0, pinned: Optional[List[str]] = None, warmup_runs: int = 2,
+                 swap_grace_seconds: float = 300):
+        self.models: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.memory_budget_mb = memory_budget_mb  # 0表示不限制
+        self.pinned = set(pinned or [])
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.RLock] = {}
+        
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.evictions = 0
+        self.loads = 0
+        
+        self.swap_grace_seconds = swap_grace_seconds
+        self.retired: Dict[str, Dict[str, Any]] = {}  # 热切换换下的上一版本，宽限期内可立即回滚
+        self.swaps: Dict[str, Dict[str, Any]] = {}
+        
+        self.warmup_runs = warmup_runs
+        self.warmup_status = {'state': 'idle', 'models': {}}
+        self._warmup_thread = None
+        
+        # 设备在第一次加载PyTorch模型时才确定，启动时不导入torch
+        self._device = None
     
-    def __init__(self):
-        self.models = {}
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        logger.info(f'使用设备: {self.device}')
+    @property
+    def device(self):
+        """PyTorch推理设备"""
+        if self._device is None:
+            torch = import_framework('torch')
+            self._device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            logger.info(f'使用设备: {self._device}')
+        return self._device
+    
+    def _load_lock(self, model_id: str) -> threading.RLock:
+        """模型的加载锁，保证多个线程同时未命中时只加载一次"""
+        with self._lock:
+            return self._load_locks.setdefault(model_id, threading.RLock())
     
     def load_model(self, model_id: str) -> bool:
-        """加载模型"""
+        """加载模型；已由其他线程加载完成时直接返回"""
+        with self._load_lock(model_id):
+            if self.is_model_loaded(model_id):
+                return True
+            return self._load_model(model_id)
+    
+    def _load_model(self, model_id: str) -> bool:
         try:
-            model = AIModel.query.get(model_id)
+            model = model_registry.get(model_id)
             if not model:
                 logger.error(f'模型不存在: {model_id}')
                 return False
@@ -32,41 +119,94 @@ class ModelManager:
                 logger.error(f'模型文件不存在: {model.model_path}')
                 return False
             
-            if model.framework == 'pytorch':
-                self._load_pytorch_model(model)
-            elif model.framework == 'tensorflow':
-                self._load_tensorflow_model(model)
-            elif model.framework == 'onnx':
-                self._load_onnx_model(model)
-            else:
-                logger.error(f'不支持的框架: {model.framework}')
-                return False
+            return self.register_model(model)
             
-            self.models[model_id] = {
-                'model': model,
-                'loaded_model': None,  # 实际加载的模型对象
-                'is_loaded': True
-            }
+        except Exception as e:
+            logger.error(f'加载模型失败: {str(e)}')
+            return False
+    
+    def register_model(self, model: AIModel, loaded_model: Any = None) -> bool:
+        """登记模型并按框架加载；传入loaded_model时直接使用（离线基准测试等不经过数据库的场景）
+        
+        外部传入的模型无法从磁盘重新加载，自动固定，不参与淘汰。
+        """
+        with self._load_lock(model.id):
+            return self._register_model(model, loaded_model)
+    
+    def _register_model(self, model: AIModel, loaded_model: Any = None) -> bool:
+        try:
+            entry = self._create_entry(model, loaded_model)
+            if entry is None:
+                return False
+            with self._lock:
+                self.models[model.id] = entry
+                self.models.move_to_end(model.id)
+                if loaded_model is not None:
+                    self.pinned.add(model.id)
+            self.loads += 1
+            logger.info(f'模型加载成功: {model.name}，约占用 {entry["size_mb"]:.1f} MB')
             
-            logger.info(f'模型加载成功: {model.name}')
+            self._enforce_budget(exclude=model.id)
             return True
             
         except Exception as e:
             logger.error(f'加载模型失败: {str(e)}')
             return False
     
+    def _create_entry(self, model: AIModel, loaded_model: Any = None) -> Optional[Dict[str, Any]]:
+        """按框架加载模型并建立缓存条目（不登记到缓存中，热切换时新版本在旧版本继续服务期间加载）"""
+        rss_before = _resident_mb()
+        if loaded_model is None:
+            if model.framework == 'pytorch':
+                loaded_model = self._load_pytorch_model(model)
+            elif model.framework == 'tensorflow':
+                loaded_model = self._load_tensorflow_model(model)
+            elif model.framework == 'onnx':
+                loaded_model = self._load_onnx_model(model)
+            else:
+                logger.error(f'不支持的框架: {model.framework}')
+                return None
+        elif model.framework == 'onnx' and not isinstance(loaded_model, OnnxRunner):
+            loaded_model = OnnxRunner(loaded_model)
+        
+        return {
+            'model': model,
+            'loaded_model': loaded_model,  # 实际加载的模型对象
+            'is_loaded': True,
+            'preprocessor': Preprocessor.for_model(model, loaded_model),
+            'class_names': self._class_names(model, loaded_model),
+            'max_batch_size': self._static_batch_size(model, loaded_model),  # 模型输入的固定批次维，None表示不限
+            'size_mb': max(_resident_mb() - rss_before, _path_size_mb(model.model_path)),
+            'last_used': time.time(),
+            'hits': 0,
+            'in_flight': 0  # 正在使用该条目推理的请求数，热切换后旧版本等其归零再释放
+        }
+    
+    def _static_batch_size(self, model: AIModel, loaded_model: Any) -> Optional[int]:
+        """模型输入的固定批次大小（ONNX会话或Keras模型的输入第一维为整数时），动态批次返回None"""
+        if model.framework == 'onnx':
+            return loaded_model.batch_size
+        if model.framework != 'tensorflow':
+            return None
+        try:
+            batch_dim = loaded_model.input_shape[0]
+        except (AttributeError, IndexError, TypeError):
+            return None
+        return batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+    
     def _load_pytorch_model(self, model: AIModel):
         """加载PyTorch模型"""
         try:
             # 这里应该根据实际的模型类型加载
             # 例如：YOLO、ResNet等
             if 'yolo' in model.name.lower():
-                from ultralytics import YOLO
+                YOLO = import_framework('ultralytics').YOLO
                 loaded_model = YOLO(model.model_path)
             else:
+                torch = import_framework('torch')
                 loaded_model = torch.load(model.model_path, map_location=self.device)
             
-            self.models[model.id]['loaded_model'] = loaded_model
+            return loaded_model
             
         except Exception as e:
             logger.error(f'加载PyTorch模型失败: {str(e)}')
@@ -75,9 +215,8 @@ class ModelManager:
     def _load_tensorflow_model(self, model: AIModel):
         """加载TensorFlow模型"""
         try:
-            import tensorflow as tf
-            loaded_model = tf.keras.models.load_model(model.model_path)
-            self.models[model.id]['loaded_model'] = loaded_model
+            tf = import_framework('tensorflow')
+            return tf.keras.models.load_model(model.model_path)
             
         except Exception as e:
             logger.error(f'加载TensorFlow模型失败: {str(e)}')
@@ -86,150 +225,522 @@ class ModelManager:
     def _load_onnx_model(self, model: AIModel):
         """加载ONNX模型"""
         try:
-            import onnxruntime as ort
-            loaded_model = ort.InferenceSession(model.model_path)
-            self.models[model.id]['loaded_model'] = loaded_model
+            config = load_session_config(model)
+            start = time.time()
+            loaded_model = OnnxRunner(create_session(model.model_path, config), config)
+            logger.info(f'ONNX会话创建耗时 {time.time() - start:.2f}s，图优化: {config["graphOptimizationLevel"]}，'
+                        f'线程: {config["intraOpThreads"]}/{config["interOpThreads"]}，执行模式: {config["executionMode"]}，'
+                        f'I/O绑定: {loaded_model.io_binding}')
+            return loaded_model
             
         except Exception as e:
             logger.error(f'加载ONNX模型失败: {str(e)}')
             raise
     
     def predict(self, model_id: str, image: np.ndarray) -> List[Dict[str, Any]]:
-        """执行预测"""
+        """执行预测，推理失败时抛出异常"""
+        results = self.predict_batch(model_id, [image])
+        return results[0] if results else []
+    
+    def _acquire(self, model_id: str) -> Optional[Dict[str, Any]]:
+        """取得已加载的模型条目并更新最近使用顺序，缓存未命中（或已被淘汰）时重新加载"""
+        with self._lock:
+            entry = self.models.get(model_id)
+            if entry is not None and entry['is_loaded']:
+                self.models.move_to_end(model_id)
+                entry['last_used'] = time.time()
+                entry['hits'] += 1
+                self.cache_hits += 1
+                return entry
+            self.cache_misses += 1
+        
+        if not self.load_model(model_id):
+            return None
+        return self.models.get(model_id)
+    
+    def _enforce_budget(self, exclude: Optional[str] = None):
+        """总占用超出预算时，先释放热切换换下的旧版本（放弃回滚），再按最久未使用顺序淘汰未固定的模型
+        
+        宽限期内的旧版本同样占用内存，计入总占用；仍有推理在使用的旧版本暂不释放。
+        """
+        if not self.memory_budget_mb:
+            return
+        
+        evicted = []
+        released = []
+        with self._lock:
+            used = (sum(entry['size_mb'] for entry in self.models.values()) +
+                    sum(item['entry']['size_mb'] for item in self.retired.values()))
+            for model_id in list(self.retired.keys()):
+                if used <= self.memory_budget_mb:
+                    break
+                entry = self.retired[model_id]['entry']
+                if entry['in_flight'] > 0:
+                    continue
+                self.retired.pop(model_id)
+                used -= entry['size_mb']
+                released.append((model_id, entry['model'].version, entry['size_mb']))
+            for model_id in list(self.models.keys()):
+                if used <= self.memory_budget_mb:
+                    break
+                if model_id == exclude or model_id in self.pinned:
+                    continue
+                entry = self.models.pop(model_id)
+                used -= entry['size_mb']
+                self.evictions += 1
+                evicted.append((model_id, entry['size_mb']))
+        
+        for model_id, version, size_mb in released:
+            logger.info(f'模型缓存超出预算，提前释放模型 {model_id} 的旧版本 {version}（{size_mb:.1f} MB），不再可回滚')
+        for model_id, size_mb in evicted:
+            logger.info(f'模型缓存超出预算，淘汰模型: {model_id}（{size_mb:.1f} MB）')
+        if evicted or released:
+            gc.collect()
+            torch = loaded_framework('torch')
+            if torch is not None and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        if used > self.memory_budget_mb:
+            logger.warning(f'模型缓存占用 {used:.1f} MB 超出预算 {self.memory_budget_mb} MB，剩余模型均已固定、刚刚加载或是仍在推理中的旧版本')
+    
+    def pin_model(self, model_id: str):
+        """固定模型，不参与淘汰"""
+        with self._lock:
+            self.pinned.add(model_id)
+    
+    def unpin_model(self, model_id: str):
+        """取消固定，超出预算时可被淘汰"""
+        with self._lock:
+            self.pinned.discard(model_id)
+        self._enforce_budget()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取模型缓存的占用和命中统计"""
+        with self._lock:
+            entries = list(self.models.items())
+            retired = list(self.retired.items())
+        return {
+            'budgetMb': self.memory_budget_mb,
+            'usedMb': round(sum(entry['size_mb'] for _, entry in entries) +
+                            sum(item['entry']['size_mb'] for _, item in retired), 1),
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'evictions': self.evictions,
+            'loads': self.loads,
+            'pinned': sorted(self.pinned),
+            'warmup': self.warmup_status,
+            'frameworkImports': get_import_profile(),
+            'swaps': self.swaps,
+            # 热切换换下、宽限期内可回滚的旧版本
+            'retired': [
+                {
+                    'id': model_id,
+                    'version': item['entry']['model'].version,
+                    'sizeMb': round(item['entry']['size_mb'], 1),
+                    'inFlight': item['entry']['in_flight'],
+                    'retiredAt': item['retiredAt']
+                }
+                for model_id, item in retired
+            ],
+            # 按最近使用顺序，第一个最先被淘汰
+            'models': [
+                {
+                    'id': model_id,
+                    'sizeMb': round(entry['size_mb'], 1),
+                    'pinned': model_id in self.pinned,
+                    'hits': entry['hits'],
+                    'lastUsed': entry['last_used'],
+                    'isLoaded': entry['is_loaded'],
+                    'version': entry['model'].version,
+                    'inFlight': entry['in_flight'],
+                    'runtime': entry['loaded_model'].get_stats() if isinstance(entry['loaded_model'], OnnxRunner) else None
+                }
+                for model_id, entry in entries
+            ]
+        }
+    
+    def warm_up(self, model_ids: Optional[List[str]] = None, runs: Optional[int] = None) -> Dict[str, Any]:
+        """预热模型：加载后用空白帧推理若干次，让首个真实帧不承担懒初始化开销
+        
+        Args:
+            model_ids: 要预热的模型，默认为所有固定模型
+            runs: 每个模型的空推理次数，默认warmup_runs（第一次触发内存分配和内核选择，之后的耗时即稳定耗时）
+        """
+        runs = self.warmup_runs if runs is None else runs
+        results = {}
+        for model_id in model_ids if model_ids is not None else sorted(self.pinned):
+            start = time.time()
+            try:
+                model_info = self._acquire(model_id)
+                if model_info is None:
+                    results[model_id] = {'ok': False, 'error': '模型加载失败'}
+                    continue
+                load_seconds = time.time() - start
+                
+                width, height = model_info['preprocessor'].size or (640, 640)
+                frame = np.zeros((height, width, 3), dtype=np.uint8)
+                timings = []
+                for _ in range(max(1, runs)):
+                    run_start = time.time()
+                    self._predict_entry(model_info, [frame])
+                    timings.append(round((time.time() - run_start) * 1000, 1))
+                results[model_id] = {'ok': True, 'loadSeconds': round(load_seconds, 2), 'inferenceMs': timings}
+                logger.info(f'模型预热完成: {model_id}，加载 {load_seconds:.2f}s，推理 {timings} ms')
+                
+            except Exception as e:
+                results[model_id] = {'ok': False, 'error': str(e)}
+                logger.error(f'模型预热失败: {model_id}: {str(e)}')
+            finally:
+                self.warmup_status['models'] = dict(self.warmup_status['models'], **results)
+        return results
+    
+    def start_warmup(self, app=None, model_ids: Optional[List[str]] = None, runs: Optional[int] = None) -> bool:
+        """在后台线程中预热模型，不阻塞服务启动；已有预热在进行时返回False"""
+        with self._lock:
+            if self._warmup_thread is not None and self._warmup_thread.is_alive():
+                return False
+            
+            def run():
+                self.warmup_status['state'] = 'running'
+                started = time.time()
+                try:
+                    if app is not None:
+                        with app.app_context():
+                            self.warm_up(model_ids, runs)
+                    else:
+                        self.warm_up(model_ids, runs)
+                finally:
+                    self.warmup_status['state'] = 'completed'
+                    self.warmup_status['seconds'] = round(time.time() - started, 2)
+            
+            self.warmup_status = {'state': 'pending', 'models': {}}
+            self._warmup_thread = threading.Thread(target=run, name='model-warmup')
+            self._warmup_thread.daemon = True
+            self._warmup_thread.start()
+        return True
+    
+    def swap_model(self, model, warmup: bool = True) -> bool:
+        """热切换模型版本（同一模型ID的新文件/新版本）
+        
+        旧版本继续服务期间加载并预热新版本，然后在批次之间原子替换缓存条目：
+        已取得旧条目的推理照常完成，之后的请求都使用新版本。旧版本在宽限期内保留，可立即回滚；
+        宽限期结束且没有进行中的推理后释放。
+        """
+        status = {'state': 'loading', 'version': model.version, 'modelPath': model.model_path,
+                  'startedAt': time.time(), 'error': None}
+        self.swaps[model.id] = status
         try:
-            if model_id not in self.models:
-                if not self.load_model(model_id):
-                    return []
+            if not os.path.exists(model.model_path):
+                raise RuntimeError(f'模型文件不存在: {model.model_path}')
+            entry = self._create_entry(model)
+            if entry is None:
+                raise RuntimeError(f'不支持的框架: {model.framework}')
+            
+            if warmup:
+                status['state'] = 'warming'
+                width, height = entry['preprocessor'].size or (640, 640)
+                frame = np.zeros((height, width, 3), dtype=np.uint8)
+                for _ in range(max(1, self.warmup_runs)):
+                    self._predict_entry(entry, [frame])
+            
+            with self._load_lock(model.id), self._lock:
+                previous = self.models.get(model.id)
+                self.models[model.id] = entry
+                self.models.move_to_end(model.id)
+                if previous is not None:
+                    self.retired[model.id] = {'entry': previous, 'retiredAt': time.time()}
+            self.loads += 1
+            
+            status['state'] = 'completed'
+            status['finishedAt'] = time.time()
+            logger.info(f'模型热切换完成: {model.id} -> 版本 {model.version}，'
+                        f'耗时 {status["finishedAt"] - status["startedAt"]:.2f}s')
+            self._schedule_release(model.id)
+            self._enforce_budget(exclude=model.id)
+            return True
             
-            model_info = self.models[model_id]
+        except Exception as e:
+            status['state'] = 'failed'
+            status['error'] = str(e)
+            status['finishedAt'] = time.time()
+            logger.error(f'模型热切换失败: {model.id}: {str(e)}')
+            return False
+    
+    def start_swap(self, model, warmup: bool = True) -> bool:
+        """在后台线程中热切换模型；同一模型已有切换在进行时返回False"""
+        with self._lock:
+            status = self.swaps.get(model.id)
+            if status is not None and status['state'] in ('pending', 'loading', 'warming'):
+                return False
+            self.swaps[model.id] = {'state': 'pending', 'version': model.version, 'modelPath': model.model_path,
+                                    'startedAt': time.time(), 'error': None}
+        
+        thread = threading.Thread(target=self.swap_model, args=(model, warmup), name=f'model-swap-{model.id}')
+        thread.daemon = True
+        thread.start()
+        return True
+    
+    def rollback_model(self, model_id: str):
+        """回滚到热切换前的版本，返回回滚后生效的模型记录；没有保留的旧版本时返回None
+        
+        回滚同样是交换两个条目，被换下的版本进入宽限期，可以再次前滚。
+        """
+        with self._load_lock(model_id), self._lock:
+            retired = self.retired.pop(model_id, None)
+            if retired is None:
+                return None
+            current = self.models.get(model_id)
+            self.models[model_id] = retired['entry']
+            self.models.move_to_end(model_id)
+            if current is not None:
+                self.retired[model_id] = {'entry': current, 'retiredAt': time.time()}
+            model = retired['entry']['model']
+        
+        logger.info(f'模型已回滚: {model_id} -> 版本 {model.version}')
+        self._schedule_release(model_id)
+        return model
+    
+    def _schedule_release(self, model_id: str, delay: Optional[float] = None):
+        """宽限期结束后释放换下的版本"""
+        timer = threading.Timer(self.swap_grace_seconds if delay is None else delay, self._release_retired, args=(model_id,))
+        timer.daemon = True
+        timer.start()
+    
+    def _release_retired(self, model_id: str):
+        """释放宽限期已过的旧版本；仍有推理在使用时稍后再试"""
+        with self._lock:
+            retired = self.retired.get(model_id)
+            if retired is None or time.time() - retired['retiredAt'] < self.swap_grace_seconds:
+                return
+            if retired['entry']['in_flight'] > 0:
+                retry = True
+            else:
+                retry = False
+                self.retired.pop(model_id)
+        
+        if retry:
+            self._schedule_release(model_id, delay=1.0)
+            return
+        gc.collect()
+        logger.info(f'已释放模型 {model_id} 的旧版本: {retired["entry"]["model"].version}')
+    
+    def get_swap_status(self, model_id: str) -> Dict[str, Any]:
+        """热切换进度和可回滚的版本"""
+        retired = self.retired.get(model_id)
+        return {
+            'swap': self.swaps.get(model_id),
+            'rollbackVersion': retired['entry']['model'].version if retired else None,
+            'rollbackAvailableUntil': retired['retiredAt'] + self.swap_grace_seconds if retired else None
+        }
+    
+    def predict_batch(self, model_id: str, images: List[np.ndarray]) -> List[List[Dict[str, Any]]]:
+        """批量执行预测，一次前向推理处理多帧，按输入顺序返回每帧的结果；推理失败时抛出异常"""
+        if not images:
+            return []
+        model_info = self._acquire(model_id)
+        if model_info is None:
+            return [[] for _ in images]
+        return [detections_to_dicts(detections, model_info['class_names'])
+                for detections in self._predict_entry(model_info, images)]
+    
+    def predict_batch_arrays(self, model_id: str, images: List[np.ndarray]) -> List[np.ndarray]:
+        """批量执行预测，每帧返回结构化数组（DETECTION_DTYPE），不构造字典；推理失败时抛出异常"""
+        if not images:
+            return []
+        model_info = self._acquire(model_id)
+        if model_info is None:
+            return [empty_detections() for _ in images]
+        return self._predict_entry(model_info, images)
+    
+    def max_batch_size(self, model_id: str) -> Optional[int]:
+        """已加载模型的固定批次大小，未加载或批次维动态时返回None"""
+        entry = self.models.get(model_id)
+        return entry['max_batch_size'] if entry else None
+    
+    def batch_key(self, model_id: str, image: np.ndarray) -> tuple:
+        """合批分组键：键相同的帧才能拼入同一次前向推理
+        
+        预处理统一缩放到模型输入尺寸（或Ultralytics模型自带预处理）时任意尺寸的帧都能合批，
+        否则按原始帧尺寸分组；模型尚未加载时也按原始帧尺寸分组。
+        """
+        entry = self.models.get(model_id)
+        if entry is not None and (entry['preprocessor'].size or self._handles_raw_frames(entry)):
+            return ()
+        return image.shape
+    
+    def _handles_raw_frames(self, model_info: Dict[str, Any]) -> bool:
+        """Ultralytics YOLO自带letterbox预处理，直接接收原始BGR帧"""
+        return model_info['model'].framework == 'pytorch' and hasattr(model_info['loaded_model'], 'predict')
+    
+    def get_class_names(self, model_id: str) -> List[str]:
+        """已加载模型的类别名称，下标即检测结果中的class_id"""
+        entry = self.models.get(model_id)
+        return entry['class_names'] if entry else []
+    
+    def _predict_entry(self, model_info: Dict[str, Any], images: List[np.ndarray]) -> List[np.ndarray]:
+        """用已取得的模型条目执行批量预测
+        
+        超过模型固定批次大小的批次拆成多次推理；失败时记录日志后抛出异常，
+        调用方据此区分推理失败和没有检测到目标。
+        """
+        max_batch = model_info.get('max_batch_size')
+        if max_batch and len(images) > max_batch:
+            results = []
+            for start in range(0, len(images), max_batch):
+                results.extend(self._predict_entry(model_info, images[start:start + max_batch]))
+            return results
+        
+        with self._lock:
+            model_info['in_flight'] += 1
+        try:
             model = model_info['model']
             loaded_model = model_info['loaded_model']
             
-            if not model_info['is_loaded']:
-                logger.error(f'模型未加载: {model_id}')
-                return []
+            if self._handles_raw_frames(model_info):
+                # 直接传入原始BGR帧，输出已是原图坐标
+                predictions = self._predict_pytorch(loaded_model, images, model)
+                return [self._postprocess_predictions(detections, model) for detections in predictions]
             
-            # 预处理图像
-            processed_image = self._preprocess_image(image, model)
+            # 预处理写入复用的批次缓冲区，同时得到每帧的缩放填充参数
+            batch, infos = model_info['preprocessor'](images)
             
             # 执行预测
             if model.framework == 'pytorch':
-                predictions = self._predict_pytorch(loaded_model, processed_image, model)
+                predictions = self._predict_pytorch(loaded_model, batch, model)
             elif model.framework == 'tensorflow':
-                predictions = self._predict_tensorflow(loaded_model, processed_image, model)
+                predictions = self._predict_tensorflow(loaded_model, batch, model)
             elif model.framework == 'onnx':
-                predictions = self._predict_onnx(loaded_model, processed_image, model)
+                predictions = self._predict_onnx(loaded_model, batch, model)
             else:
-                return []
+                raise ValueError(f'不支持的框架: {model.framework}')
             
-            # 后处理结果
-            return self._postprocess_predictions(predictions, model)
+            # 后处理结果，检测框从模型输入坐标换算回原图坐标
+            return [
+                info.restore_detections(self._postprocess_predictions(detections, model))
+                for detections, info in zip(predictions, infos)
+            ]
             
         except Exception as e:
             logger.error(f'预测失败: {str(e)}')
+            raise
+        finally:
+            with self._lock:
+                model_info['in_flight'] -= 1
+    
+    def predict_tiled(self, model_id: str, image: np.ndarray, tile_size: Optional[tuple] = None,
+                      overlap: float = 0.2, iou_threshold: float = 0.5, include_full: bool = True) -> List[Dict[str, Any]]:
+        """切片推理：把高分辨率图像切成重叠切片，作为一个批次推理后跨切片NMS合并
+        
+        Args:
+            tile_size: 切片尺寸(宽, 高)，默认使用模型输入尺寸，切片无需缩放
+            overlap: 相邻切片的重叠比例
+            include_full: 额外检测整帧缩略图，保留跨越多个切片的大目标
+        
+        推理失败时抛出异常。
+        """
+        model_info = self._acquire(model_id)
+        if model_info is None:
             return []
+        input_size = model_info['preprocessor'].size
+        
+        if tile_size is None:
+            if not input_size:
+                return detections_to_dicts(self._predict_entry(model_info, [image])[0], model_info['class_names'])
+            tile_size = input_size
+        
+        tiles, origins = make_tiles(image, tile_size[0], tile_size[1], overlap)
+        # 尺寸不同的整帧只有在预处理会统一缩放时才能并入同一批次
+        if include_full and len(tiles) > 1 and input_size:
+            tiles.append(image)
+            origins.append((0, 0))
+        
+        tile_predictions = [detections_to_dicts(detections, model_info['class_names'])
+                            for detections in self._predict_entry(model_info, tiles)]
+        return merge_tile_predictions(tile_predictions, origins, iou_threshold)
     
-    def _preprocess_image(self, image: np.ndarray, model: AIModel) -> np.ndarray:
-        """预处理图像"""
-        try:
-            # 调整图像大小
-            if model.input_size:
-                width, height = map(int, model.input_size.split('x'))
-                image = cv2.resize(image, (width, height))
-            
-            # 归一化
-            image = image.astype(np.float32) / 255.0
-            
-            # 添加批次维度
-            if len(image.shape) == 3:
-                image = np.expand_dims(image, axis=0)
-            
-            return image
-            
-        except Exception as e:
-            logger.error(f'图像预处理失败: {str(e)}')
-            raise
+    def _class_names(self, model, loaded_model: Any) -> List[str]:
+        """类别名称：优先使用模型记录中配置的类别，其次使用模型文件自带的名称"""
+        if model.classes:
+            try:
+                return list(json.loads(model.classes))
+            except (ValueError, TypeError):
+                logger.warning(f'模型 {model.id} 的类别配置不是有效的JSON，忽略')
+        names = getattr(loaded_model, 'names', None)
+        if isinstance(names, dict):
+            return [names[key] for key in sorted(names)]
+        return list(names) if names else []
+    
+    def _decode(self, output: Any, model_info: AIModel) -> List[np.ndarray]:
+        """解码YOLO风格的原始检测输出"""
+        return decode_yolo(np.asarray(output, dtype=np.float32), conf_threshold=model_info.confidence_threshold,
+                           iou_threshold=NMS_IOU_THRESHOLD, max_detections=MAX_DETECTIONS)
     
-    def _predict_pytorch(self, model, image: np.ndarray, model_info: AIModel) -> List[Dict[str, Any]]:
-        """PyTorch模型预测"""
+    def _predict_pytorch(self, model, images, model_info: AIModel) -> List[np.ndarray]:
+        """PyTorch模型预测，返回每帧的检测结果"""
         try:
             if hasattr(model, 'predict'):
-                # YOLO模型
-                results = model.predict(image, conf=model_info.confidence_threshold)
-                predictions = []
+                # YOLO模型，传入图像列表时一次推理整个批次；检测框整批转换为数组，不逐框访问张量
+                results = model.predict(list(images), conf=model_info.confidence_threshold, verbose=False)
+                batch_predictions = []
                 for result in results:
-                    if result.boxes is not None:
-                        for box in result.boxes:
-                            predictions.append({
-                                'class': model.names[int(box.cls)],
-                                'confidence': float(box.conf),
-                                'bbox': box.xyxy[0].tolist()
-                            })
-                return predictions
+                    boxes = result.boxes
+                    if boxes is None or len(boxes) == 0:
+                        batch_predictions.append(empty_detections())
+                        continue
+                    batch_predictions.append(make_detections(
+                        boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy().astype(np.int32)))
+                return batch_predictions
             else:
-                # 其他PyTorch模型
+                # 其他PyTorch模型，按YOLO检测头输出解码
+                torch = import_framework('torch')
                 with torch.no_grad():
-                    input_tensor = torch.from_numpy(image).to(self.device)
+                    input_tensor = torch.from_numpy(images).to(self.device)
                     outputs = model(input_tensor)
-                    # 这里需要根据具体模型调整
-                    return []
+                    if isinstance(outputs, (list, tuple)):
+                        outputs = outputs[0]
+                    return self._decode(outputs.cpu().numpy(), model_info)
                     
         except Exception as e:
             logger.error(f'PyTorch预测失败: {str(e)}')
-            return []
+            raise
     
-    def _predict_tensorflow(self, model, image: np.ndarray, model_info: AIModel) -> List[Dict[str, Any]]:
-        """TensorFlow模型预测"""
+    def _predict_tensorflow(self, model, images: np.ndarray, model_info: AIModel) -> List[np.ndarray]:
+        """TensorFlow模型预测，返回每帧的检测结果"""
         try:
-            predictions = model.predict(image)
-            # 这里需要根据具体模型调整
-            return []
+            outputs = model.predict(images, verbose=0)
+            if isinstance(outputs, (list, tuple)):
+                outputs = outputs[0]
+            return self._decode(outputs, model_info)
             
         except Exception as e:
             logger.error(f'TensorFlow预测失败: {str(e)}')
-            return []
+            raise
     
-    def _predict_onnx(self, model, image: np.ndarray, model_info: AIModel) -> List[Dict[str, Any]]:
-        """ONNX模型预测"""
+    def _predict_onnx(self, model, images: np.ndarray, model_info: AIModel) -> List[np.ndarray]:
+        """ONNX模型预测，返回每帧的检测结果"""
         try:
-            input_name = model.get_inputs()[0].name
-            outputs = model.run(None, {input_name: image})
-            # 这里需要根据具体模型调整
-            return []
+            outputs = model.run(images)
+            return self._decode(outputs[0], model_info)
             
         except Exception as e:
             logger.error(f'ONNX预测失败: {str(e)}')
-            return []
+            raise
     
-    def _postprocess_predictions(self, predictions: List[Dict[str, Any]], model: AIModel) -> List[Dict[str, Any]]:
-        """后处理预测结果"""
+    def _postprocess_predictions(self, detections: np.ndarray, model: AIModel) -> np.ndarray:
+        """后处理预测结果：过滤低置信度，限制数量"""
         try:
-            # 过滤低置信度预测
-            filtered_predictions = [
-                pred for pred in predictions 
-                if pred.get('confidence', 0) >= model.confidence_threshold
-            ]
-            
-            # 限制预测数量
-            max_predictions = 100
-            if len(filtered_predictions) > max_predictions:
-                filtered_predictions = sorted(
-                    filtered_predictions, 
-                    key=lambda x: x.get('confidence', 0), 
-                    reverse=True
-                )[:max_predictions]
-            
-            return filtered_predictions
+            return filter_detections(detections, model.confidence_threshold, MAX_DETECTIONS)
             
         except Exception as e:
             logger.error(f'后处理预测结果失败: {str(e)}')
-            return predictions
+            return detections
     
     def unload_model(self, model_id: str) -> bool:
         """卸载模型"""
         try:
-            if model_id in self.models:
-                del self.models[model_id]
+            with self._lock:
+                entry = self.models.pop(model_id, None)
+                self.retired.pop(model_id, None)
+            if entry is not None:
                 logger.info(f'模型卸载成功: {model_id}')
                 return True
             return False
@@ -238,13 +749,43 @@ class ModelManager:
             logger.error(f'卸载模型失败: {str(e)}')
             return False
     
+    def update_model_info(self, model) -> bool:
+        """模型记录修改后同步到已加载的条目
+        
+        模型文件或框架变化时热切换到新版本；其余字段（置信度阈值、输入尺寸等）直接替换。
+        """
+        with self._lock:
+            entry = self.models.get(model.id)
+            if entry is None:
+                return False
+            current = entry['model']
+            if current.model_path != model.model_path or current.framework != model.framework:
+                # 模型文件变化：后台加载新版本后热切换，切换完成前旧版本继续服务
+                logger.info(f'模型文件已变更，开始热切换: {model.id}')
+                self.start_swap(model)
+            else:
+                entry['model'] = model
+                if current.input_size != model.input_size:
+                    entry['preprocessor'] = Preprocessor.for_model(model, entry['loaded_model'])
+                if current.classes != model.classes:
+                    entry['class_names'] = self._class_names(model, entry['loaded_model'])
+        return True
+    
     def get_loaded_models(self) -> List[str]:
         """获取已加载的模型列表"""
-        return list(self.models.keys())
+        with self._lock:
+            return list(self.models.keys())
     
     def is_model_loaded(self, model_id: str) -> bool:
         """检查模型是否已加载"""
-        return model_id in self.models and self.models[model_id]['is_loaded']
+        entry = self.models.get(model_id)
+        return entry is not None and entry['is_loaded']
 
 # 全局模型管理器实例
-model_manager = ModelManager()
+model_manager = ModelManager(
+    memory_budget_mb=float(os.environ.get('MODEL_CACHE_BUDGET_MB', 0)),
+    pinned=[model_id for model_id in os.environ.get('MODEL_CACHE_PINNED', '').split(',') if model_id],
+    warmup_runs=int(os.environ.get('MODEL_WARMUP_RUNS', 2)),
+    swap_grace_seconds=float(os.environ.get('MODEL_SWAP_GRACE_SECONDS', 300))
+)
+
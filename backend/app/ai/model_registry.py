@@ -0,0 +1,204 @@
+"""
+模型注册表
+在进程内缓存AI模型记录，分析热路径按内存查询，不访问数据库
+"""
+
+import os
+import json
+import logging
+import threading
+import time
+from typing import List, Dict, Any, Optional
+from flask import has_app_context, current_app
+from app.models.ai_model import AIModel
+from app.ai.model_config import load_model_config
+
+logger = logging.getLogger(__name__)
+
+# 自动选用低精度版本：允许的F1下降（绝对值），可被原模型配置文件 variants 段的 tolerance / autoSelect 覆盖
+VARIANT_ACCURACY_TOLERANCE = float(os.environ.get('MODEL_VARIANT_TOLERANCE', 0.01))
+VARIANT_AUTO_SELECT = os.environ.get('MODEL_VARIANT_AUTO_SELECT', 'true').lower() == 'true'
+
+def variant_info(model) -> Optional[Dict[str, Any]]:
+    """模型记录是另一个模型的低精度版本时返回其版本信息（performance_metrics.variant），否则返回None"""
+    if not model.performance_metrics:
+        return None
+    try:
+        metrics = json.loads(model.performance_metrics)
+    except (ValueError, TypeError):
+        return None
+    info = metrics.get('variant') if isinstance(metrics, dict) else None
+    return info if isinstance(info, dict) and info.get('parentId') else None
+
+class ModelSnapshot:
+    """模型记录的只读快照
+
+    与数据库会话无关，可以在任意线程中读取；字段名与AIModel列名一致。
+    """
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    @classmethod
+    def from_model(cls, model: AIModel) -> 'ModelSnapshot':
+        return cls(**{column.name: getattr(model, column.name) for column in AIModel.__table__.columns})
+
+    def __repr__(self):
+        return f'<ModelSnapshot {self.name}>'
+
+class ModelRegistry:
+    """模型注册表
+
+    模型增删改、激活/停用的接口提交事务后调用refresh()立即更新；
+    多进程部署时其他进程的缓存靠TTL过期后重新加载（过期期间仍返回旧数据，由一个线程负责刷新）。
+    """
+
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self._models: Dict[str, ModelSnapshot] = {}
+        self._variant_ids = set()
+        # 原模型ID -> 实际执行推理的版本ID（只包含选中了低精度版本的模型）
+        self._selected: Dict[str, str] = {}
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._app = None
+
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def init_app(self, app):
+        """记录应用实例，后台线程刷新时使用其应用上下文"""
+        self._app = app
+
+    def _query(self, query):
+        """执行查询；当前线程没有应用上下文时使用init_app记录的应用
+
+        未调用init_app时记录第一次在应用上下文中查询时的应用，之后后台线程也能刷新。
+        """
+        if has_app_context():
+            if self._app is None:
+                self._app = current_app._get_current_object()
+            return query()
+        if self._app is None:
+            raise RuntimeError('模型注册表没有可用的应用上下文，请先调用 model_registry.init_app(app)')
+        with self._app.app_context():
+            return query()
+
+    def refresh(self) -> bool:
+        """从数据库重新加载全部模型记录"""
+        try:
+            models = self._query(lambda: AIModel.query.all())
+
+            snapshots = {model.id: ModelSnapshot.from_model(model) for model in models}
+            variants = {model_id: info for model_id, info in
+                        ((model_id, variant_info(snapshot)) for model_id, snapshot in snapshots.items()) if info}
+            selected = self._select_variants(snapshots, variants)
+            with self._lock:
+                self._models = snapshots
+                self._variant_ids = set(variants)
+                self._selected = selected
+                self._loaded_at = time.time()
+            self.refreshes += 1
+            return True
+
+        except Exception as e:
+            self.refresh_errors += 1
+            logger.error(f'刷新模型注册表失败: {str(e)}')
+            return False
+
+    def _select_variants(self, snapshots: Dict[str, ModelSnapshot],
+                         variants: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """为每个原模型选出精度下降在容差内、单帧耗时最短的活跃低精度版本
+
+        精度变化和耗时都是生成版本时在同一验证集、同一台机器上与原模型对比测得的；没有更快的版本时继续使用原模型。
+        """
+        candidates: Dict[str, List[tuple]] = {}
+        for model_id, info in variants.items():
+            snapshot = snapshots[model_id]
+            parent = snapshots.get(info['parentId'])
+            if parent is None or not snapshot.is_active or info.get('accuracyDelta') is None:
+                continue
+            if not info.get('latencyMs') or not info.get('parentLatencyMs') or info['latencyMs'] >= info['parentLatencyMs']:
+                continue
+            candidates.setdefault(parent.id, []).append((info['latencyMs'], info['accuracyDelta'], model_id))
+
+        selected = {}
+        for parent_id, options in candidates.items():
+            config = load_model_config(snapshots[parent_id], 'variants')
+            if not config.get('autoSelect', VARIANT_AUTO_SELECT):
+                continue
+            tolerance = float(config.get('tolerance', VARIANT_ACCURACY_TOLERANCE))
+            eligible = [option for option in options if option[1] >= -tolerance]
+            if eligible:
+                selected[parent_id] = min(eligible)[2]
+        return selected
+
+    def _ensure_fresh(self):
+        """缓存过期时刷新；已有数据时只让一个线程去刷新，其余线程继续使用旧数据"""
+        if time.time() - self._loaded_at < self.ttl:
+            return
+        with self._lock:
+            if time.time() - self._loaded_at < self.ttl or (self._refreshing and self._loaded_at):
+                return
+            self._refreshing = True
+        try:
+            if not self.refresh():
+                # 数据库不可用时推迟下一次重试，避免每帧都去连接
+                with self._lock:
+                    self._loaded_at = time.time() - self.ttl + min(self.ttl, 5)
+        finally:
+            self._refreshing = False
+
+    def get(self, model_id: str) -> Optional[ModelSnapshot]:
+        """按ID获取模型记录，缓存中没有时单独查询一次（其他进程刚创建的模型）"""
+        self._ensure_fresh()
+        snapshot = self._models.get(model_id)
+        if snapshot is not None:
+            return snapshot
+
+        try:
+            model = self._query(lambda: AIModel.query.get(model_id))
+        except Exception as e:
+            logger.error(f'查询模型 {model_id} 失败: {str(e)}')
+            return None
+
+        if model is None:
+            return None
+        snapshot = ModelSnapshot.from_model(model)
+        with self._lock:
+            self._models = {**self._models, model_id: snapshot}
+        return snapshot
+
+    def get_active_models(self, model_type: Optional[str] = None) -> List[ModelSnapshot]:
+        """获取活跃模型"""
+        self._ensure_fresh()
+        variant_ids = self._variant_ids
+        # 低精度版本不单独参与分析，由select_variant替原模型选用
+        return [
+            model for model in list(self._models.values())
+            if model.is_active and model.id not in variant_ids and (model_type is None or model.model_type == model_type)
+        ]
+
+    def get_detection_models(self) -> List[ModelSnapshot]:
+        """获取活跃的检测模型"""
+        return self.get_active_models('detection')
+
+    def select_variant(self, model_id: str) -> str:
+        """实际执行推理的模型ID：选中了低精度版本时返回该版本，否则返回原模型"""
+        self._ensure_fresh()
+        return self._selected.get(model_id, model_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'models': len(self._models),
+            'active': sum(1 for model in list(self._models.values()) if model.is_active),
+            'ttl': self.ttl,
+            'age': round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+            'refreshes': self.refreshes,
+            'refreshErrors': self.refresh_errors,
+            'variantSelections': dict(self._selected)
+        }
+
+# 全局模型注册表实例
+model_registry = ModelRegistry(ttl=float(os.environ.get('MODEL_REGISTRY_TTL', 60)))
@@ -0,0 +1,427 @@
+"""
+模型低精度版本生成
+把已登记的模型导出为ONNX，生成FP16、INT8动态量化和INT8静态量化版本（静态量化用最近的摄像头画面做校准），
+在本地验证集上测量每个版本相对原模型的精度变化和推理耗时，并登记为关联的模型版本，供调度器自动选用
+"""
+
+import os
+import glob
+import json
+import logging
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+import cv2
+import numpy as np
+from app import db
+from app.models.ai_model import AIModel
+from app.ai.lazy_import import import_framework
+from app.ai.model_manager import model_manager
+from app.ai.model_registry import ModelSnapshot, model_registry, variant_info
+from app.ai.postprocess import box_iou
+from app.ai.preprocess import Preprocessor
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = ('fp32', 'fp16', 'int8-dynamic', 'int8-static')
+DEFAULT_PRECISIONS = ('int8-dynamic', 'int8-static')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+VARIANT_DIR = os.environ.get('MODEL_VARIANT_DIR', 'models/variants')
+VALIDATION_DIR = os.environ.get('MODEL_VALIDATION_DIR', 'data/validation')
+# 精度评估时检测框与标注（或原模型结果）匹配的重叠度阈值
+MATCH_IOU_THRESHOLD = 0.5
+
+def load_images(directory: str, limit: Optional[int] = None) -> List[Tuple[str, np.ndarray]]:
+    """读取目录中的图像，按文件名排序"""
+    paths = sorted(path for path in glob.glob(os.path.join(directory, '*'))
+                   if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+    images = []
+    for path in paths[:limit]:
+        image = cv2.imread(path)
+        if image is not None:
+            images.append((path, image))
+    return images
+
+def load_labels(image_path: str, width: int, height: int) -> Optional[np.ndarray]:
+    """读取YOLO格式标注（每行: 类别 中心x 中心y 宽 高，0-1归一化），返回(N, 5)的[x1, y1, x2, y2, 类别]
+
+    标注文件与图像同名，放在图像旁边或同级的labels目录中；没有标注文件时返回None。
+    """
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    directory = os.path.dirname(image_path)
+    for label_path in (os.path.join(directory, f'{stem}.txt'),
+                       os.path.join(os.path.dirname(directory), 'labels', f'{stem}.txt')):
+        if os.path.exists(label_path):
+            rows = np.loadtxt(label_path, dtype=np.float32, ndmin=2)
+            if rows.size == 0:
+                return np.zeros((0, 5), dtype=np.float32)
+            cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+            return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2, rows[:, 0]], axis=1)
+    return None
+
+def match_detections(detections: np.ndarray, truth: np.ndarray) -> int:
+    """按置信度从高到低把检测框与同类别的真值框一对一匹配，返回匹配数"""
+    if len(detections) == 0 or len(truth) == 0:
+        return 0
+    order = np.argsort(-detections['confidence'], kind='stable')
+    ious = box_iou(detections['bbox'][order], truth[:, :4])
+    ious[detections['class_id'][order][:, None] != truth[None, :, 4].astype(np.int32)] = 0
+    matched = np.zeros(len(truth), dtype=bool)
+    hits = 0
+    for row in ious:
+        row = np.where(matched, 0, row)
+        best = int(np.argmax(row))
+        if row[best] >= MATCH_IOU_THRESHOLD:
+            matched[best] = True
+            hits += 1
+    return hits
+
+def detection_scores(predictions: List[np.ndarray], references: List[np.ndarray]) -> Dict[str, float]:
+    """检测结果相对参考框（标注或原模型结果）的精确率、召回率和F1"""
+    hits = sum(match_detections(p, r) for p, r in zip(predictions, references))
+    predicted = sum(len(p) for p in predictions)
+    expected = sum(len(r) for r in references)
+    precision = hits / predicted if predicted else 1.0
+    recall = hits / expected if expected else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': round(precision, 4), 'recall': round(recall, 4), 'f1': round(f1, 4)}
+
+def collect_calibration_frames(count: int = 64, interval: float = 0.2, timeout: float = 60.0,
+                               image_dir: Optional[str] = None) -> List[np.ndarray]:
+    """收集静态量化的校准帧
+
+    优先轮流取正在分析的摄像头的最新画面（与线上数据分布一致）；没有摄像头在分析时使用image_dir中的图像。
+    """
+    from app.ai.video_processor import video_processor
+
+    frames = []
+    deadline = time.time() + timeout
+    while len(frames) < count and time.time() < deadline:
+        grabbers = list(video_processor.grabbers.values())
+        if not grabbers:
+            break
+        for grabber in grabbers:
+            _, frame, _ = grabber.peek()
+            if frame is not None:
+                frames.append(frame.copy())
+        time.sleep(interval)
+
+    if len(frames) < count and image_dir:
+        frames.extend(image for _, image in load_images(image_dir, count - len(frames)))
+    return frames[:count]
+
+class CalibrationReader:
+    """ONNX Runtime静态量化的校准数据读取器，按模型预处理逐帧提供输入"""
+
+    def __init__(self, input_name: str, preprocessor: Preprocessor, frames: List[np.ndarray]):
+        self.input_name = input_name
+        self.preprocessor = preprocessor
+        self._frames = iter(frames)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        frame = next(self._frames, None)
+        if frame is None:
+            return None
+        batch, _ = self.preprocessor([frame])
+        return {self.input_name: batch.copy()}
+
+    def rewind(self):
+        pass
+
+class VariantBuilder:
+    """从一个已登记的模型生成低精度版本
+
+    流程：导出/复用FP32 ONNX → 生成各精度版本 → 在验证集上与原模型对比精度和单帧耗时 → 登记或更新关联版本。
+    单个精度失败（缺少依赖、算子不支持量化等）只记录错误，不影响其他精度。
+    """
+
+    def __init__(self, precisions: Optional[List[str]] = None, validation_dir: Optional[str] = None,
+                 calibration_frames: int = 64, calibration_dir: Optional[str] = None,
+                 output_dir: Optional[str] = None):
+        self.precisions = list(precisions or DEFAULT_PRECISIONS)
+        unknown = [precision for precision in self.precisions if precision not in PRECISIONS]
+        if unknown:
+            raise ValueError(f'不支持的精度: {", ".join(unknown)}')
+        self.validation_dir = validation_dir or VALIDATION_DIR
+        self.calibration_frames = calibration_frames
+        self.calibration_dir = calibration_dir or self.validation_dir
+        self.output_dir = output_dir or VARIANT_DIR
+        self.class_names: List[str] = []
+
+    def _output_path(self, model: ModelSnapshot, precision: str) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(model.model_path))[0]
+        return os.path.join(self.output_dir, f'{name}.{model.version or "1"}.{precision}.onnx')
+
+    def _input_size(self, model: ModelSnapshot) -> Tuple[int, int]:
+        return tuple(map(int, model.input_size.split('x'))) if model.input_size else (640, 640)
+
+    def export_onnx(self, model: ModelSnapshot) -> str:
+        """导出FP32 ONNX模型（批次维度可变），原模型已是ONNX时直接使用"""
+        if model.framework == 'onnx':
+            return model.model_path
+        if model.framework != 'pytorch':
+            raise ValueError(f'暂不支持从{model.framework}模型导出ONNX')
+
+        output_path = self._output_path(model, 'fp32')
+        width, height = self._input_size(model)
+        if 'yolo' in model.name.lower():
+            YOLO = import_framework('ultralytics').YOLO
+            exported = YOLO(model.model_path).export(format='onnx', imgsz=(height, width), dynamic=True)
+            shutil.move(str(exported), output_path)
+        else:
+            torch = import_framework('torch')
+            module = torch.load(model.model_path, map_location='cpu')
+            module.eval()
+            dummy = torch.zeros(1, 3, height, width)
+            torch.onnx.export(module, dummy, output_path, input_names=['images'], output_names=['output'],
+                              dynamic_axes={'images': {0: 'batch'}, 'output': {0: 'batch'}}, opset_version=17)
+        logger.info(f'模型已导出为ONNX: {output_path}')
+        return output_path
+
+    def convert(self, model: ModelSnapshot, onnx_path: str, precision: str) -> str:
+        """由FP32 ONNX模型生成指定精度的版本，返回文件路径"""
+        if precision == 'fp32':
+            if onnx_path == model.model_path:
+                raise ValueError('原模型已是FP32 ONNX模型')
+            return onnx_path
+
+        output_path = self._output_path(model, precision)
+        if precision == 'fp16':
+            onnx = import_framework('onnx')
+            float16 = import_framework('onnxconverter_common.float16')
+            # 输入输出保持float32，预处理和解码不需要区分精度
+            converted = float16.convert_float_to_float16(onnx.load(onnx_path), keep_io_types=True)
+            onnx.save(converted, output_path)
+            return output_path
+
+        quantization = import_framework('onnxruntime.quantization')
+        source = self._preprocess_for_quantization(onnx_path)
+        try:
+            if precision == 'int8-dynamic':
+                quantization.quantize_dynamic(source, output_path, weight_type=quantization.QuantType.QInt8)
+            else:
+                frames = collect_calibration_frames(self.calibration_frames, image_dir=self.calibration_dir)
+                if not frames:
+                    raise RuntimeError('没有可用的校准帧（无正在分析的摄像头，校准目录中也没有图像）')
+                ort = import_framework('onnxruntime')
+                session = ort.InferenceSession(source, providers=['CPUExecutionProvider'])
+                calibration_model = ModelSnapshot(**dict(vars(model), framework='onnx'))
+                reader = CalibrationReader(session.get_inputs()[0].name,
+                                           Preprocessor.for_model(calibration_model, session), frames)
+                quantization.quantize_static(
+                    source, output_path, reader,
+                    quant_format=quantization.QuantFormat.QDQ,
+                    activation_type=quantization.QuantType.QUInt8,
+                    weight_type=quantization.QuantType.QInt8,
+                    per_channel=True
+                )
+                logger.info(f'静态量化使用 {len(frames)} 帧校准')
+        finally:
+            if source != onnx_path and os.path.exists(source):
+                os.remove(source)
+        return output_path
+
+    def _preprocess_for_quantization(self, onnx_path: str) -> str:
+        """量化前做形状推断和图优化（ORT推荐步骤），失败时直接量化原文件"""
+        try:
+            shape_inference = import_framework('onnxruntime.quantization.shape_inference')
+            os.makedirs(self.output_dir, exist_ok=True)
+            name = os.path.splitext(os.path.basename(onnx_path))[0]
+            output_path = os.path.join(self.output_dir, f'{name}.quant-pre.onnx')
+            shape_inference.quant_pre_process(onnx_path, output_path)
+            return output_path
+        except Exception as e:
+            logger.warning(f'量化预处理失败，直接量化: {str(e)}')
+            return onnx_path
+
+    def _run(self, model: ModelSnapshot, images: List[np.ndarray]) -> Tuple[List[np.ndarray], float]:
+        """逐帧推理，返回检测结果和单帧耗时中位数（毫秒）"""
+        entry = model_manager._create_entry(model)
+        if entry is None:
+            raise RuntimeError(f'不支持的框架: {model.framework}')
+        if not self.class_names:
+            # 导出的ONNX模型不带类别名称，登记版本时沿用原模型的类别
+            self.class_names = entry['class_names']
+        model_manager._predict_entry(entry, images[:1])
+        predictions = []
+        latencies = []
+        for image in images:
+            start = time.perf_counter()
+            predictions.extend(model_manager._predict_entry(entry, [image]))
+            latencies.append((time.perf_counter() - start) * 1000)
+        return predictions, float(np.median(latencies))
+
+    def evaluate(self, model: ModelSnapshot, variants: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """在验证集上评估原模型和各版本
+
+        验证图像有标注时与标注对比；没有标注时以原模型的结果为参考（原模型F1记为1），衡量各版本与原模型的一致程度。
+        """
+        samples = load_images(self.validation_dir)
+        if not samples:
+            raise RuntimeError(f'验证集为空: {self.validation_dir}')
+        images = [image for _, image in samples]
+        labels = [load_labels(path, image.shape[1], image.shape[0]) for path, image in samples]
+        labelled = all(label is not None for label in labels)
+
+        original_predictions, original_latency = self._run(model, images)
+        if labelled:
+            references = labels
+            original_scores = detection_scores(original_predictions, references)
+        else:
+            references = [np.concatenate([p['bbox'], p['class_id'][:, None]], axis=1) for p in original_predictions]
+            original_scores = {'precision': 1.0, 'recall': 1.0, 'f1': 1.0}
+
+        results = {}
+        for precision, path in variants.items():
+            variant = ModelSnapshot(**dict(vars(model), id=f'{model.id}:{precision}', framework='onnx', model_path=path))
+            try:
+                predictions, latency = self._run(variant, images)
+                scores = detection_scores(predictions, references)
+                results[precision] = {
+                    'accuracy': scores,
+                    'accuracyDelta': round(scores['f1'] - original_scores['f1'], 4),
+                    'latencyMs': round(latency, 3),
+                    'parentLatencyMs': round(original_latency, 3),
+                    'speedup': round(original_latency / latency, 3) if latency else None
+                }
+            except Exception as e:
+                logger.warning(f'评估模型版本失败: {model.id} {precision}: {str(e)}')
+                results[precision] = {'error': str(e)}
+
+        for result in results.values():
+            result.update({
+                'parentAccuracy': original_scores,
+                'reference': 'labels' if labelled else 'parent',
+                'validationImages': len(images)
+            })
+        return results
+
+    def build(self, model: ModelSnapshot, progress: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        """生成并评估各精度版本，返回 {精度: 评估结果}（不写数据库）"""
+        if not os.path.exists(model.model_path):
+            raise RuntimeError(f'模型文件不存在: {model.model_path}')
+        if progress is not None:
+            progress['step'] = 'export'
+        onnx_path = self.export_onnx(model)
+
+        variants = {}
+        errors = {}
+        for precision in self.precisions:
+            if progress is not None:
+                progress['step'] = precision
+            try:
+                variants[precision] = self.convert(model, onnx_path, precision)
+            except Exception as e:
+                logger.warning(f'生成模型版本失败: {model.id} {precision}: {str(e)}')
+                errors[precision] = {'error': str(e)}
+
+        if progress is not None:
+            progress['step'] = 'evaluate'
+        results = self.evaluate(model, variants) if variants else {}
+        for precision, path in variants.items():
+            results[precision]['modelPath'] = path
+        results.update(errors)
+        return results
+
+def find_variant(parent_id: str, precision: str) -> Optional[AIModel]:
+    """查找已登记的同一原模型、同一精度的版本"""
+    for model in AIModel.query.filter_by(framework='onnx').all():
+        info = variant_info(model)
+        if info and info.get('parentId') == parent_id and info.get('precision') == precision:
+            return model
+    return None
+
+def register_variants(parent: AIModel, results: Dict[str, Dict[str, Any]],
+                      class_names: Optional[List[str]] = None) -> List[AIModel]:
+    """把评估成功的版本登记为关联的模型记录（已存在的同精度版本就地更新），返回登记的记录"""
+    registered = []
+    for precision, result in results.items():
+        if 'error' in result:
+            continue
+        model = find_variant(parent.id, precision)
+        if model is None:
+            model = AIModel(
+                name=f'{parent.name} ({precision})',
+                model_type=parent.model_type,
+                framework='onnx'
+            )
+            db.session.add(model)
+        model.model_path = result['modelPath']
+        model.version = f'{parent.version}-{precision}'[:20]
+        model.config_path = parent.config_path
+        model.confidence_threshold = parent.confidence_threshold
+        model.input_size = parent.input_size
+        model.classes = parent.classes or (json.dumps(class_names) if class_names else None)
+        model.description = f'{parent.name} 的{precision}版本，由模型版本生成工具创建'
+        model.is_active = parent.is_active
+
+        metrics = model.get_performance_metrics()
+        metrics['variant'] = dict(result, parentId=parent.id, precision=precision,
+                                  createdAt=datetime.utcnow().isoformat())
+        model.set_performance_metrics(metrics)
+        model.updated_at = datetime.utcnow()
+        registered.append(model)
+    return registered
+
+class VariantService:
+    """在后台线程中生成模型版本并登记，同一时间只运行一个任务（导出和量化占用大量CPU和内存）"""
+
+    def __init__(self):
+        self.status: Dict[str, Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app, model_id: str, builder: VariantBuilder) -> bool:
+        """开始生成；已有任务在进行时返回False"""
+        with self._lock:
+            if self.is_running():
+                return False
+            status = {'state': 'pending', 'step': None, 'startedAt': time.time(), 'error': None}
+            self.status[model_id] = status
+            self._thread = threading.Thread(target=self._run, args=(app, model_id, builder, status),
+                                            name=f'model-variants-{model_id}')
+            self._thread.daemon = True
+            self._thread.start()
+        return True
+
+    def _run(self, app, model_id: str, builder: VariantBuilder, status: Dict[str, Any]):
+        try:
+            with app.app_context():
+                model = AIModel.query.get(model_id)
+                if model is None:
+                    raise RuntimeError('模型不存在')
+                snapshot = ModelSnapshot.from_model(model)
+
+            status['state'] = 'running'
+            results = builder.build(snapshot, progress=status)
+
+            with app.app_context():
+                parent = AIModel.query.get(model_id)
+                if parent is None:
+                    raise RuntimeError('模型不存在')
+                registered = register_variants(parent, results, builder.class_names)
+                db.session.commit()
+                status['variants'] = {precision: {key: value for key, value in result.items() if key != 'modelPath'}
+                                      for precision, result in results.items()}
+                status['registered'] = [model.id for model in registered]
+                model_registry.refresh()
+
+            status['state'] = 'completed'
+            logger.info(f'模型版本生成完成: {model_id}，登记 {len(registered)} 个版本')
+
+        except Exception as e:
+            status['state'] = 'failed'
+            status['error'] = str(e)
+            logger.error(f'模型版本生成失败: {model_id}: {str(e)}')
+        finally:
+            status['finishedAt'] = time.time()
+
+# 全局模型版本生成服务实例
+variant_service = VariantService()
@@ -0,0 +1,89 @@
+"""
+运动门控
+静止画面跳过检测模型调用
+"""
+
+import cv2
+import numpy as np
+import time
+from typing import Dict, Any, Optional, Tuple
+
+class MotionGate:
+    """运动门控
+
+    把帧缩到很小的灰度图，与上一次分析时的参考帧做差分，
+    变化像素占比低于阈值时跳过本次分析；超过max_skip_seconds未分析则强制分析一次。
+    参考帧只在分析时更新，缓慢变化会累积到超过阈值。
+    """
+
+    def __init__(self, threshold: float = 0.005, pixel_threshold: int = 25,
+                 max_skip_seconds: float = 10.0, size: Tuple[int, int] = (64, 36)):
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.max_skip_seconds = max_skip_seconds
+        self.size = size
+
+        self._reference: Optional[np.ndarray] = None
+        self._last_analysis_time = 0.0
+
+        self.checks = 0
+        self.skipped = 0
+        self.forced = 0
+        self.last_change_ratio = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], defaults: Optional[Dict[str, Any]] = None) -> 'MotionGate':
+        """根据摄像头分析配置创建门控"""
+        settings = dict(defaults or {})
+        settings.update({k: v for k, v in (config or {}).items() if v is not None})
+        return cls(
+            threshold=float(settings.get('motion_threshold', 0.005)),
+            pixel_threshold=int(settings.get('motion_pixel_threshold', 25)),
+            max_skip_seconds=float(settings.get('motion_max_skip_seconds', 10.0))
+        )
+
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        """缩小并转为灰度"""
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def should_analyze(self, frame: np.ndarray, now: Optional[float] = None) -> bool:
+        """判断当前帧是否需要运行检测模型"""
+        now = time.time() if now is None else now
+        self.checks += 1
+        gray = self._downscale(frame)
+
+        if self._reference is None or self.threshold <= 0:
+            return self._accept(gray, now)
+
+        diff = cv2.absdiff(gray, self._reference)
+        self.last_change_ratio = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+        if self.last_change_ratio >= self.threshold:
+            return self._accept(gray, now)
+
+        if now - self._last_analysis_time >= self.max_skip_seconds:
+            self.forced += 1
+            return self._accept(gray, now)
+
+        self.skipped += 1
+        return False
+
+    def _accept(self, gray: np.ndarray, now: float) -> bool:
+        """放行本帧并更新参考帧"""
+        self._reference = gray
+        self._last_analysis_time = now
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取门控统计"""
+        return {
+            'threshold': self.threshold,
+            'checks': self.checks,
+            'skipped': self.skipped,
+            'forced': self.forced,
+            'skip_ratio': round(self.skipped / self.checks, 4) if self.checks else 0,
+            'last_change_ratio': None if self.last_change_ratio is None else round(self.last_change_ratio, 4)
+        }
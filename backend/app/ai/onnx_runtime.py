@@ -0,0 +1,188 @@
+"""
+ONNX Runtime会话管理
+按模型配置会话选项（图优化级别、线程数、执行模式），缓存优化后的模型文件，
+推理时使用I/O绑定复用输入输出缓冲区，并按配置统计推理耗时
+"""
+
+import os
+import hashlib
+import logging
+import threading
+import time
+from typing import List, Dict, Any, Optional
+import numpy as np
+from app.ai.metrics import Histogram
+from app.ai.lazy_import import import_framework
+from app.ai.model_config import load_model_config, inference_concurrency
+
+logger = logging.getLogger(__name__)
+
+# 会话默认选项，可被模型配置文件中的 onnxRuntime 段覆盖
+ONNX_DEFAULTS = {
+    'graphOptimizationLevel': os.environ.get('ONNX_GRAPH_OPTIMIZATION', 'all'),
+    'intraOpThreads': int(os.environ.get('ONNX_INTRA_OP_THREADS', 0)),
+    'interOpThreads': int(os.environ.get('ONNX_INTER_OP_THREADS', 0)),
+    'executionMode': os.environ.get('ONNX_EXECUTION_MODE', 'sequential'),
+    'ioBinding': os.environ.get('ONNX_IO_BINDING', 'true').lower() == 'true',
+    'optimizedModelDir': os.environ.get('ONNX_OPTIMIZED_MODEL_DIR', 'models/.onnx_cache'),
+    'providers': [provider for provider in os.environ.get('ONNX_PROVIDERS', '').split(',') if provider]
+}
+
+GRAPH_OPTIMIZATION_LEVELS = ('disable', 'basic', 'extended', 'all')
+EXECUTION_MODES = ('sequential', 'parallel')
+
+def load_session_config(model) -> Dict[str, Any]:
+    """合并默认选项和模型配置文件（config_path指向的JSON）中的 onnxRuntime 段
+
+    未指定intra-op线程数时使用模型的线程预算（CPU核数 / 推理工作线程数），inter-op线程固定为1，
+    多个工作线程同时推理时总线程数不超过CPU核数。
+    """
+    config = dict(ONNX_DEFAULTS)
+    overrides = load_model_config(model, 'onnxRuntime')
+    config.update({key: value for key, value in overrides.items() if key in ONNX_DEFAULTS})
+
+    if not config['intraOpThreads']:
+        _, threads = inference_concurrency(model)
+        config['intraOpThreads'] = threads
+        config['interOpThreads'] = config['interOpThreads'] or 1
+
+    if config['graphOptimizationLevel'] not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f'不支持的图优化级别: {config["graphOptimizationLevel"]}')
+    if config['executionMode'] not in EXECUTION_MODES:
+        raise ValueError(f'不支持的执行模式: {config["executionMode"]}')
+    return config
+
+def _optimized_model_path(model_path: str, config: Dict[str, Any], providers: List[str]) -> Optional[str]:
+    """优化后模型的缓存路径；模型文件、优化级别、执行提供程序或ORT版本变化时使用新文件"""
+    ort = import_framework('onnxruntime')
+
+    cache_dir = config.get('optimizedModelDir')
+    if not cache_dir or config['graphOptimizationLevel'] == 'disable':
+        return None
+    stat = os.stat(model_path)
+    key = '|'.join([os.path.abspath(model_path), str(stat.st_size), str(int(stat.st_mtime)),
+                    config['graphOptimizationLevel'], ','.join(providers), ort.__version__])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(cache_dir, f'{name}.{digest}.opt.onnx')
+
+def create_session(model_path: str, config: Dict[str, Any]):
+    """按配置创建InferenceSession
+
+    首次加载时让ORT把图优化结果序列化到缓存目录，之后直接加载优化后的模型并跳过图优化，缩短冷启动时间。
+    """
+    ort = import_framework('onnxruntime')
+
+    levels = {
+        'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    }
+    options = ort.SessionOptions()
+    options.graph_optimization_level = levels[config['graphOptimizationLevel']]
+    options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if config['executionMode'] == 'parallel'
+                              else ort.ExecutionMode.ORT_SEQUENTIAL)
+    if config['intraOpThreads']:
+        options.intra_op_num_threads = int(config['intraOpThreads'])
+    if config['interOpThreads']:
+        options.inter_op_num_threads = int(config['interOpThreads'])
+
+    available = ort.get_available_providers()
+    providers = [provider for provider in config['providers'] if provider in available] or ['CPUExecutionProvider']
+
+    source_path = model_path
+    optimized_path = _optimized_model_path(model_path, config, providers)
+    if optimized_path and os.path.exists(optimized_path):
+        source_path = optimized_path
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        logger.info(f'使用缓存的优化模型: {optimized_path}')
+    elif optimized_path:
+        os.makedirs(os.path.dirname(optimized_path), exist_ok=True)
+        options.optimized_model_filepath = optimized_path
+
+    return ort.InferenceSession(source_path, sess_options=options, providers=providers)
+
+class OnnxRunner:
+    """ONNX模型推理封装
+
+    输入输出名称和输入的固定批次大小在创建时读取一次；开启I/O绑定时每个线程持有自己的绑定对象，
+    输入直接绑定预处理缓冲区，输出按批次形状预分配并复用，推理时不再分配输出内存。
+    每次推理的耗时记录在直方图中，与会话配置一起导出。
+    """
+
+    def __init__(self, session, config: Optional[Dict[str, Any]] = None):
+        self.session = session
+        self.config = config or {}
+        model_inputs = session.get_inputs()
+        self.input_name = model_inputs[0].name
+        # 导出时批次维固定（如batch=1）的模型只能按该大小推理，动态批次维为字符串或None
+        input_shape = getattr(model_inputs[0], 'shape', None)
+        batch_dim = input_shape[0] if input_shape else None
+        self.batch_size: Optional[int] = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+        outputs = session.get_outputs() if hasattr(session, 'get_outputs') else []
+        self.output_names = [output.name for output in outputs]
+        self.io_binding = bool(self.config.get('ioBinding')) and hasattr(session, 'io_binding') and bool(self.output_names)
+        self.latency = Histogram()
+        self._local = threading.local()
+
+    def get_inputs(self):
+        return self.session.get_inputs()
+
+    def get_outputs(self):
+        return self.session.get_outputs()
+
+    def run(self, batch: np.ndarray) -> List[np.ndarray]:
+        """执行推理，返回全部输出"""
+        start = time.perf_counter()
+        if self.io_binding:
+            try:
+                outputs = self._run_bound(np.ascontiguousarray(batch))
+            except Exception as e:
+                # 输出形状随内容变化（如模型内含NMS）时无法预分配，退回普通推理
+                logger.warning(f'I/O绑定推理失败，改用普通推理: {str(e)}')
+                self.io_binding = False
+                outputs = self.session.run(None, {self.input_name: batch})
+        else:
+            outputs = self.session.run(None, {self.input_name: batch})
+        self.latency.observe((time.perf_counter() - start) * 1000)
+        return outputs
+
+    def _run_bound(self, batch: np.ndarray) -> List[np.ndarray]:
+        ort = import_framework('onnxruntime')
+
+        local = self._local
+        binding = getattr(local, 'binding', None)
+        if binding is None:
+            binding = local.binding = self.session.io_binding()
+            local.outputs = {}
+            local.input_shape = None
+
+        binding.bind_cpu_input(self.input_name, batch)
+        outputs = local.outputs.get(batch.shape)
+        if outputs is None:
+            # 该批次形状第一次推理：由ORT分配输出，按其形状预分配缓冲区，之后原地写入
+            for name in self.output_names:
+                binding.bind_output(name, 'cpu')
+            self.session.run_with_iobinding(binding)
+            results = binding.copy_outputs_to_cpu()
+            buffers = [np.empty_like(result) for result in results]
+            local.outputs[batch.shape] = (buffers, [ort.OrtValue.ortvalue_from_numpy(buffer) for buffer in buffers])
+            local.input_shape = None
+            return results
+
+        buffers, values = outputs
+        if local.input_shape != batch.shape:
+            for name, value in zip(self.output_names, values):
+                binding.bind_ortvalue_output(name, value)
+            local.input_shape = batch.shape
+        self.session.run_with_iobinding(binding)
+        # 返回预分配的缓冲区，在本线程下一次同形状推理前有效（解码时只复制保留下来的检测框）
+        return buffers
+
+    def get_stats(self) -> Dict[str, Any]:
+        """当前会话配置和推理耗时"""
+        stats = {key: value for key, value in self.config.items() if key != 'optimizedModelDir'}
+        stats['ioBinding'] = self.io_binding
+        stats['latencyMs'] = self.latency.snapshot()
+        return stats
@@ -0,0 +1,256 @@
+"""
+流水线阶段与有界队列
+解码、推理、持久化之间用有界队列连接，各阶段按丢弃策略施加背压
+"""
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from app.ai.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# 丢弃策略
+DROP_OLDEST = 'drop_oldest'    # 队列满时丢弃最旧的元素，生产方永不阻塞（适用于视频帧）
+DROP_NEWEST = 'drop_newest'    # 队列满时丢弃新元素
+BLOCK = 'block'                # 队列满时阻塞生产方（适用于持久化），超时后丢弃
+
+class StageQueue:
+    """有界阶段队列，记录深度、丢弃数和排队等待时间
+
+    指定key（如按摄像头取键）时，DROP_OLDEST只在同一个键内丢弃：单个键排队数达到per_key_maxsize时丢该键最旧的元素，
+    队列整体满时丢排队最多的键最旧的元素，繁忙的摄像头不会挤掉其他摄像头的帧。
+    按键独占取出（exclusive）时，同一个键的元素在前一个处理完（done）之前不会被其他工作线程取走，键内严格按顺序处理。
+    """
+
+    def __init__(self, name: str, maxsize: int, drop_policy: str = DROP_OLDEST, block_timeout: Optional[float] = None,
+                 key: Optional[Callable[[Any], Hashable]] = None, per_key_maxsize: Optional[int] = None):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError(f'不支持的丢弃策略: {drop_policy}')
+        self.name = name
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self.key = key
+        self.per_key_maxsize = per_key_maxsize
+
+        self._items = collections.deque()
+        self._key_counts: Dict[Hashable, int] = collections.defaultdict(int)
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+        self.put_count = 0
+        self.dropped = 0
+        self.blocked_seconds = 0.0
+        self.max_depth = 0
+        self.wait_histogram = Histogram()
+
+    def _drop_oldest(self, key: Hashable = None):
+        """丢弃最旧的元素；指定key时丢该键最旧的元素（持有锁时调用）"""
+        if key is None:
+            self._forget(self._items.popleft()[1])
+        else:
+            for index, (_, queued) in enumerate(self._items):
+                if self.key(queued) == key:
+                    del self._items[index]
+                    self._forget(queued)
+                    break
+        self.dropped += 1
+
+    def _forget(self, item: Any):
+        if self.key is not None:
+            key = self.key(item)
+            self._key_counts[key] -= 1
+            if self._key_counts[key] <= 0:
+                del self._key_counts[key]
+
+    def put(self, item: Any) -> bool:
+        """放入元素，按丢弃策略处理队列已满的情况；元素被丢弃时返回False"""
+        with self._lock:
+            key = self.key(item) if self.key is not None else None
+            if (self.drop_policy == DROP_OLDEST and key is not None and self.per_key_maxsize
+                    and self._key_counts.get(key, 0) >= self.per_key_maxsize):
+                self._drop_oldest(key)
+            elif len(self._items) >= self.maxsize:
+                if self.drop_policy == DROP_OLDEST:
+                    busiest = max(self._key_counts, key=self._key_counts.get) if self._key_counts else None
+                    self._drop_oldest(busiest)
+                elif self.drop_policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                else:
+                    start = time.time()
+                    deadline = None if self.block_timeout is None else start + self.block_timeout
+                    while len(self._items) >= self.maxsize:
+                        remaining = None if deadline is None else deadline - time.time()
+                        if remaining is not None and remaining <= 0:
+                            self.blocked_seconds += time.time() - start
+                            self.dropped += 1
+                            return False
+                        self._not_full.wait(remaining)
+                    self.blocked_seconds += time.time() - start
+
+            self._items.append((time.time(), item))
+            if key is not None:
+                self._key_counts[key] += 1
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """取出一个元素，超时返回None"""
+        batch = self.get_batch(1, timeout)
+        return batch[0] if batch else None
+
+    def get_batch(self, max_items: int, timeout: Optional[float] = None, exclusive: bool = False) -> List[Any]:
+        """等待至少一个元素，然后最多取出max_items个
+
+        exclusive为True时跳过键正在处理中的元素，取出的每个键都标记为处理中，处理完后必须调用done()
+        """
+        with self._lock:
+            if not self._items or (exclusive and not self._has_available()):
+                self._not_empty.wait(timeout)
+            now = time.time()
+            batch = []
+            if exclusive and self.key is not None:
+                index = 0
+                while index < len(self._items) and len(batch) < max_items:
+                    enqueue_time, item = self._items[index]
+                    key = self.key(item)
+                    if key in self._in_flight:
+                        index += 1
+                        continue
+                    del self._items[index]
+                    self._forget(item)
+                    self._in_flight.add(key)
+                    self.wait_histogram.observe((now - enqueue_time) * 1000)
+                    batch.append(item)
+            else:
+                while self._items and len(batch) < max_items:
+                    enqueue_time, item = self._items.popleft()
+                    self._forget(item)
+                    self.wait_histogram.observe((now - enqueue_time) * 1000)
+                    batch.append(item)
+            if batch:
+                self._not_full.notify(len(batch))
+            return batch
+
+    def _has_available(self) -> bool:
+        if self.key is None:
+            return bool(self._items)
+        return any(self.key(item) not in self._in_flight for _, item in self._items)
+
+    def done(self, items: List[Any]):
+        """按键独占取出的元素处理完毕，其键上排队的元素可以被取走"""
+        if self.key is None:
+            return
+        with self._lock:
+            for item in items:
+                self._in_flight.discard(self.key(item))
+            self._not_empty.notify_all()
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'policy': self.drop_policy,
+            'depth': len(self._items),
+            'maxsize': self.maxsize,
+            'maxDepth': self.max_depth,
+            'keys': len(self._key_counts),
+            'put': self.put_count,
+            'dropped': self.dropped,
+            'blockedSeconds': round(self.blocked_seconds, 3),
+            'waitMs': self.wait_histogram.snapshot()
+        }
+
+class PipelineStage:
+    """流水线阶段
+
+    工作线程从输入队列取元素交给handler处理，handler返回非None结果时放入输出队列。
+    batch_size>1时handler一次收到一个列表（如批量写库）。
+    start()传入Flask应用时，handler在该应用的上下文中执行（数据库会话、模型查询）。
+    ordered为True时按输入队列的键独占取出：同一个键（摄像头）的元素依次处理，不同键之间仍由多个工作线程并行。
+    """
+
+    def __init__(self, name: str, input_queue: StageQueue, handler: Callable[[Any], Any],
+                 output_queue: Optional[StageQueue] = None, workers: int = 1, batch_size: int = 1,
+                 ordered: bool = False):
+        self.name = name
+        self.input_queue = input_queue
+        self.handler = handler
+        self.output_queue = output_queue
+        self.workers = workers
+        self.batch_size = batch_size
+        self.ordered = ordered and input_queue.key is not None
+
+        self.app = None
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+        self.processed = 0
+        self.errors = 0
+        self.process_histogram = Histogram()
+
+    def start(self, app=None):
+        """启动工作线程（重复调用无副作用）"""
+        with self._lock:
+            if app is not None:
+                self.app = app
+            if self._threads:
+                return
+            self._stop_event.clear()
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f'stage-{self.name}-{index}')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5):
+        """停止工作线程"""
+        self._stop_event.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout=timeout)
+            self._threads.clear()
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            batch = self.input_queue.get_batch(self.batch_size, timeout=0.5, exclusive=self.ordered)
+            if not batch:
+                continue
+
+            start = time.time()
+            try:
+                with self.app.app_context() if self.app is not None else contextlib.nullcontext():
+                    result = self.handler(batch if self.batch_size > 1 else batch[0])
+                if result is not None and self.output_queue is not None:
+                    self.output_queue.put(result)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f'流水线阶段 {self.name} 处理失败: {str(e)}')
+            finally:
+                if self.ordered:
+                    self.input_queue.done(batch)
+                self.processed += len(batch)
+                self.process_histogram.observe((time.time() - start) * 1000)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'workers': self.workers,
+            'ordered': self.ordered,
+            'processed': self.processed,
+            'errors': self.errors,
+            'processMs': self.process_histogram.snapshot(),
+            'input': self.input_queue.get_stats()
+        }
@@ -0,0 +1,207 @@
+"""
+检测结果后处理工具
+检测器原始输出的向量化解码、NMS，以及紧凑的结构化数组检测结果
+"""
+
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence
+
+# 一帧的检测结果：结构化数组，每行一个检测框（xyxy像素坐标）
+DETECTION_DTYPE = np.dtype([
+    ('bbox', np.float32, (4,)),
+    ('confidence', np.float32),
+    ('class_id', np.int32)
+])
+
+# 候选框不超过该数量时一次算出两两重叠度矩阵，避免逐框重复计算
+_NMS_MATRIX_LIMIT = 2048
+
+def empty_detections() -> np.ndarray:
+    """空检测结果"""
+    return np.empty(0, dtype=DETECTION_DTYPE)
+
+def make_detections(boxes: np.ndarray, confidences: np.ndarray, class_ids: np.ndarray) -> np.ndarray:
+    """由xyxy检测框、置信度和类别下标组装检测结果"""
+    detections = np.empty(len(boxes), dtype=DETECTION_DTYPE)
+    detections['bbox'] = boxes
+    detections['confidence'] = confidences
+    detections['class_id'] = class_ids
+    return detections
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """两组xyxy检测框的两两重叠度矩阵，形状(len(boxes_a), len(boxes_b))"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0).astype(np.float32)
+
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.5,
+                        classes: Optional[np.ndarray] = None, match_metric: str = 'iou',
+                        max_detections: Optional[int] = None) -> np.ndarray:
+    """非极大值抑制
+
+    Args:
+        boxes: (N, 4) xyxy 检测框
+        scores: (N,) 置信度
+        iou_threshold: 重叠度超过该值的低分框被抑制
+        classes: (N,) 整数类别，提供时只在同类之间抑制
+        match_metric: 'iou' 交并比；'ios' 交集占较小框的比例（适合合并被切片截断的框）
+        max_detections: 最多保留的框数
+
+    Returns:
+        保留框的下标，按置信度从高到低排列
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes = np.asarray(boxes, dtype=np.float32)
+    if classes is not None:
+        # 按类别平移到互不重叠的坐标区间，一次完成各类别的抑制
+        boxes = boxes + (np.asarray(classes, dtype=np.float32) * (boxes.max() + 1))[:, None]
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(scores, kind='stable')[::-1]
+
+    if len(order) <= _NMS_MATRIX_LIMIT:
+        return _greedy_matrix_nms(boxes[order], areas[order], order, iou_threshold, match_metric, max_detections)
+
+    keep = []
+    while order.size > 0:
+        index = order[0]
+        keep.append(index)
+        if max_detections is not None and len(keep) >= max_detections:
+            break
+
+        rest = order[1:]
+        width = np.maximum(np.minimum(x2[index], x2[rest]) - np.maximum(x1[index], x1[rest]), 0)
+        height = np.maximum(np.minimum(y2[index], y2[rest]) - np.maximum(y1[index], y1[rest]), 0)
+        intersection = width * height
+        if match_metric == 'ios':
+            overlap = intersection / np.maximum(np.minimum(areas[index], areas[rest]), 1e-9)
+        else:
+            overlap = intersection / np.maximum(areas[index] + areas[rest] - intersection, 1e-9)
+        order = rest[overlap <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+def _greedy_matrix_nms(boxes: np.ndarray, areas: np.ndarray, order: np.ndarray, iou_threshold: float,
+                       match_metric: str, max_detections: Optional[int]) -> np.ndarray:
+    """按置信度排好序的框一次算出重叠度矩阵，再按顺序贪心抑制（结果与逐框计算相同）"""
+    top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:4], boxes[None, :, 2:4])
+    size = np.clip(bottom_right - top_left, 0, None)
+    intersection = size[..., 0] * size[..., 1]
+    if match_metric == 'ios':
+        overlap = intersection / np.maximum(np.minimum(areas[:, None], areas[None, :]), 1e-9)
+    else:
+        overlap = intersection / np.maximum(areas[:, None] + areas[None, :] - intersection, 1e-9)
+    suppress = overlap > iou_threshold
+
+    count = len(order)
+    alive = np.ones(count, dtype=bool)
+    keep = []
+    for i in range(count):
+        if not alive[i]:
+            continue
+        keep.append(i)
+        if max_detections is not None and len(keep) >= max_detections:
+            break
+        alive[i + 1:] &= ~suppress[i, i + 1:]
+    return order[np.asarray(keep, dtype=np.int64)]
+
+def decode_yolo(output: np.ndarray, conf_threshold: float = 0.25, iou_threshold: float = 0.45,
+                max_detections: int = 100, max_candidates: int = 3000, head: str = 'auto') -> List[np.ndarray]:
+    """解码YOLO检测头的原始输出，逐帧做置信度过滤、按类别NMS和top-k
+
+    Args:
+        output: YOLOv5 输出 (B, N, 5+C)：cx, cy, w, h, 目标置信度, 各类别置信度；
+                YOLOv8 输出 (B, 4+C, N)：cx, cy, w, h, 各类别置信度（无目标置信度）
+        conf_threshold: 置信度阈值
+        iou_threshold: NMS重叠度阈值
+        max_detections: 每帧最多保留的检测框数
+        max_candidates: 进入NMS的最多候选框数（按置信度取前若干个）
+        head: 'yolov5'、'yolov8'，或 'auto'（通道维小于框数维时按YOLOv8处理）
+
+    Returns:
+        每帧一个结构化数组（DETECTION_DTYPE），坐标为模型输入坐标，按置信度从高到低排列
+    """
+    output = np.asarray(output)
+    if output.ndim == 2:
+        output = output[None]
+    if output.ndim != 3:
+        raise ValueError(f'无法识别的检测输出形状: {output.shape}')
+
+    if head == 'auto':
+        head = 'yolov8' if output.shape[1] < output.shape[2] else 'yolov5'
+    if head not in ('yolov5', 'yolov8'):
+        raise ValueError(f'不支持的检测头: {head}')
+    class_offset = 4 if head == 'yolov8' else 5
+    channels = output.shape[1] if head == 'yolov8' else output.shape[2]
+    if channels <= class_offset:
+        raise ValueError(f'检测输出缺少类别维度: {output.shape}')
+
+    results = []
+    for rows in output:
+        # 统一为(通道, 候选框)视图：YOLOv8原样即是，各通道在内存中连续，按通道取最大值最快
+        rows = rows if head == 'yolov8' else rows.T
+        if head == 'yolov5':
+            # 先用目标置信度粗筛，类别置信度只对少量候选计算
+            candidates = np.flatnonzero(rows[4] >= conf_threshold)
+            class_scores = rows[5:, candidates]
+            class_ids = class_scores.argmax(axis=0)
+            confidences = class_scores[class_ids, np.arange(len(candidates))] * rows[4, candidates]
+        else:
+            confidences = rows[4:].max(axis=0)
+            candidates = np.flatnonzero(confidences >= conf_threshold)
+            confidences = confidences[candidates]
+            class_ids = rows[4:, candidates].argmax(axis=0)
+
+        selected = confidences >= conf_threshold
+        candidates, confidences, class_ids = candidates[selected], confidences[selected], class_ids[selected]
+        if len(candidates) > max_candidates:
+            top = np.argpartition(confidences, -max_candidates)[-max_candidates:]
+            candidates, confidences, class_ids = candidates[top], confidences[top], class_ids[top]
+        if len(candidates) == 0:
+            results.append(empty_detections())
+            continue
+
+        centers = rows[:4, candidates]
+        boxes = np.empty((len(candidates), 4), dtype=np.float32)
+        boxes[:, 0] = centers[0] - centers[2] / 2
+        boxes[:, 1] = centers[1] - centers[3] / 2
+        boxes[:, 2] = centers[0] + centers[2] / 2
+        boxes[:, 3] = centers[1] + centers[3] / 2
+
+        keep = non_max_suppression(boxes, confidences, iou_threshold, classes=class_ids, max_detections=max_detections)
+        results.append(make_detections(boxes[keep], confidences[keep], class_ids[keep]))
+    return results
+
+def filter_detections(detections: np.ndarray, conf_threshold: float, max_detections: Optional[int] = None) -> np.ndarray:
+    """按置信度过滤并只保留置信度最高的若干个检测框"""
+    detections = detections[detections['confidence'] >= conf_threshold]
+    if max_detections is not None and len(detections) > max_detections:
+        order = np.argsort(-detections['confidence'], kind='stable')[:max_detections]
+        detections = detections[order]
+    return detections
+
+def detections_to_dicts(detections: np.ndarray, class_names: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """转换为接口和数据库使用的预测字典列表"""
+    class_names = class_names or []
+    boxes = detections['bbox'].tolist()
+    confidences = detections['confidence'].tolist()
+    return [
+        {
+            'class': class_names[class_id] if 0 <= class_id < len(class_names) else str(class_id),
+            'confidence': confidence,
+            'bbox': box
+        }
+        for box, confidence, class_id in zip(boxes, confidences, detections['class_id'].tolist())
+    ]
@@ -0,0 +1,182 @@
+"""
+推理预处理
+等比缩放加灰边填充（letterbox）、BGR→RGB、HWC→CHW、归一化一次写入复用的批次缓冲区，
+并记录缩放和填充参数，供检测框从模型输入坐标换算回原图坐标
+"""
+
+import cv2
+import numpy as np
+import threading
+from typing import List, Any, Optional, Tuple
+
+# YOLO系列训练时使用的填充灰度
+LETTERBOX_PAD_VALUE = 114
+
+class LetterboxInfo:
+    """单帧的缩放和填充参数"""
+
+    __slots__ = ('scale_x', 'scale_y', 'pad_x', 'pad_y', 'image_width', 'image_height')
+
+    def __init__(self, scale_x: float, scale_y: float, pad_x: int, pad_y: int, image_width: int, image_height: int):
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.pad_x = pad_x
+        self.pad_y = pad_y
+        self.image_width = image_width
+        self.image_height = image_height
+
+    def to_image(self, boxes: np.ndarray) -> np.ndarray:
+        """把(N, 4+)的xyxy检测框从模型输入坐标换算回原图坐标（原地修改并裁剪到图像范围内）"""
+        boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - self.pad_x) / self.scale_x, 0, self.image_width)
+        boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - self.pad_y) / self.scale_y, 0, self.image_height)
+        return boxes
+
+    def restore_detections(self, detections: np.ndarray) -> np.ndarray:
+        """把结构化检测结果（DETECTION_DTYPE）的bbox原地换算回原图坐标"""
+        if len(detections) and (self.scale_x != 1 or self.scale_y != 1 or self.pad_x or self.pad_y):
+            detections['bbox'] = self.to_image(detections['bbox'])
+        return detections
+
+class Preprocessor:
+    """模型输入预处理器
+
+    每个模型一个实例。批次缓冲区按线程复用（多个推理线程可同时使用同一模型），
+    返回的批次是缓冲区视图，在同一线程下一次调用前有效。
+    每帧只经过一次缩放和一次“换通道+转置+归一化”写入，不产生中间的float副本。
+
+    Args:
+        size: 模型输入尺寸(宽, 高)，None表示使用原图尺寸（同一批次的帧尺寸必须一致）
+        layout: 'nchw'（ONNX/PyTorch）或 'nhwc'（TensorFlow）
+        dtype: np.float32 写入归一化到0-1的数据；np.uint8 写入原始像素，由模型内部完成归一化
+        swap_rb: 是否把OpenCV的BGR转换为RGB
+        letterbox: 等比缩放并填充；False时直接拉伸到输入尺寸
+    """
+
+    def __init__(self, size: Optional[Tuple[int, int]] = None, layout: str = 'nchw', dtype=np.float32,
+                 swap_rb: bool = True, letterbox: bool = True, pad_value: int = LETTERBOX_PAD_VALUE):
+        if layout not in ('nchw', 'nhwc'):
+            raise ValueError(f'不支持的输入布局: {layout}')
+        self.size = size
+        self.layout = layout
+        self.dtype = np.dtype(dtype)
+        self.swap_rb = swap_rb
+        self.letterbox = letterbox
+        self.pad_value = pad_value
+        self._normalize = np.float32(1.0 / 255.0) if self.dtype.kind == 'f' else None
+        self._local = threading.local()
+
+    @classmethod
+    def for_model(cls, model, loaded_model: Any = None) -> 'Preprocessor':
+        """按模型记录和已加载的模型对象创建预处理器
+
+        ONNX模型输入声明为uint8时写入原始像素（归一化已融合进模型）；
+        未配置input_size时使用ONNX模型声明的固定输入尺寸。
+        """
+        size = None
+        if model.input_size:
+            size = tuple(map(int, model.input_size.split('x')))
+
+        dtype = np.float32
+        if model.framework == 'onnx' and loaded_model is not None and hasattr(loaded_model, 'get_inputs'):
+            model_input = loaded_model.get_inputs()[0]
+            if getattr(model_input, 'type', None) == 'tensor(uint8)':
+                dtype = np.uint8
+            shape = getattr(model_input, 'shape', None)
+            if size is None and shape and len(shape) == 4 and all(isinstance(dim, int) for dim in shape[2:]):
+                size = (shape[3], shape[2])
+
+        layout = 'nhwc' if model.framework == 'tensorflow' else 'nchw'
+        return cls(size=size, layout=layout, dtype=dtype)
+
+    def _geometry(self, image_height: int, image_width: int, width: int, height: int) -> Tuple[int, int, int, int]:
+        """缩放后尺寸和左上填充量：(缩放宽, 缩放高, 左填充, 上填充)"""
+        if not self.letterbox:
+            return width, height, 0, 0
+        scale = min(width / image_width, height / image_height)
+        resized_width = min(width, max(1, int(round(image_width * scale))))
+        resized_height = min(height, max(1, int(round(image_height * scale))))
+        return resized_width, resized_height, (width - resized_width) // 2, (height - resized_height) // 2
+
+    def _batch_buffer(self, batch_size: int, width: int, height: int) -> np.ndarray:
+        """取得本线程的批次缓冲区，容量不足或尺寸变化时重新分配"""
+        local = self._local
+        buffer = getattr(local, 'buffer', None)
+        if buffer is None or len(buffer) < batch_size or local.size != (width, height):
+            shape = (batch_size, 3, height, width) if self.layout == 'nchw' else (batch_size, height, width, 3)
+            buffer = np.empty(shape, dtype=self.dtype)
+            local.buffer = buffer
+            local.size = (width, height)
+            # 各槽位上次写入的画面区域，区域不变时填充边无需重写
+            local.regions = [None] * batch_size
+            local.scratch = {}
+        return buffer
+
+    def _resize(self, image: np.ndarray, width: int, height: int) -> np.ndarray:
+        """缩放到本线程按尺寸复用的缓冲区中"""
+        if image.shape[1] == width and image.shape[0] == height:
+            return image
+        scratch = self._local.scratch
+        target = scratch.get((width, height))
+        if target is None:
+            target = np.empty((height, width, 3), dtype=np.uint8)
+            scratch[(width, height)] = target
+        return cv2.resize(image, (width, height), dst=target, interpolation=cv2.INTER_LINEAR)
+
+    def _fill_padding(self, slot: np.ndarray, region: Tuple[int, int, int, int]):
+        """只写入画面区域以外的填充边"""
+        x, y, w, h = region
+        value = self.pad_value * self._normalize if self._normalize else self.pad_value
+        if self.layout == 'nchw':
+            slot[:, :y] = value
+            slot[:, y + h:] = value
+            slot[:, y:y + h, :x] = value
+            slot[:, y:y + h, x + w:] = value
+        else:
+            slot[:y] = value
+            slot[y + h:] = value
+            slot[y:y + h, :x] = value
+            slot[y:y + h, x + w:] = value
+
+    def __call__(self, images: List[np.ndarray]) -> Tuple[np.ndarray, List[LetterboxInfo]]:
+        """预处理一个批次，返回(批次数组, 每帧的缩放填充参数)"""
+        if self.size is not None:
+            width, height = self.size
+        else:
+            height, width = images[0].shape[:2]
+
+        buffer = self._batch_buffer(len(images), width, height)
+        regions = self._local.regions
+        infos = []
+        for index, image in enumerate(images):
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            image_height, image_width = image.shape[:2]
+            if self.size is None and (image_width, image_height) != (width, height):
+                raise ValueError('未配置输入尺寸的模型，同一批次的帧尺寸必须一致')
+
+            resized_width, resized_height, pad_x, pad_y = self._geometry(image_height, image_width, width, height)
+            resized = self._resize(image, resized_width, resized_height)
+            pixels = resized[..., ::-1] if self.swap_rb else resized
+
+            slot = buffer[index]
+            region = (pad_x, pad_y, resized_width, resized_height)
+            if regions[index] != region:
+                self._fill_padding(slot, region)
+                regions[index] = region
+
+            if self.layout == 'nchw':
+                target = slot[:, pad_y:pad_y + resized_height, pad_x:pad_x + resized_width]
+                pixels = pixels.transpose(2, 0, 1)
+            else:
+                target = slot[pad_y:pad_y + resized_height, pad_x:pad_x + resized_width]
+
+            if self._normalize:
+                np.multiply(pixels, self._normalize, out=target, casting='unsafe')
+            else:
+                np.copyto(target, pixels)
+
+            # 按取整后的实际缩放尺寸计算比例，换算回原图时没有累积误差
+            infos.append(LetterboxInfo(resized_width / image_width, resized_height / image_height,
+                                       pad_x, pad_y, image_width, image_height))
+
+        return buffer[:len(images)], infos
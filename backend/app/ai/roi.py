@@ -0,0 +1,108 @@
+"""
+感兴趣区域（ROI）
+按摄像头配置的多边形裁剪、遮罩待检测画面，并把检测框映射回整帧坐标
+"""
+
+import cv2
+import numpy as np
+import logging
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+class RegionOfInterest:
+    """感兴趣区域
+
+    多边形顶点使用相对坐标（0-1），与解码分辨率无关。
+    推理前先裁剪到所有多边形的外接矩形，再把矩形内多边形以外的像素置零，
+    这样缩放到模型输入尺寸时道路部分占用更多分辨率。
+    裁剪框和遮罩按帧尺寸缓存，每帧只有一次切片和一次按位与。
+    """
+
+    def __init__(self, polygons: Sequence[Sequence[Sequence[float]]]):
+        self.polygons = self.parse(polygons)
+        self._layouts: Dict[Tuple[int, int], Tuple[Tuple[int, int, int, int], Optional[np.ndarray]]] = {}
+
+    @staticmethod
+    def parse(polygons: Sequence[Sequence[Sequence[float]]]) -> List[np.ndarray]:
+        """校验多边形配置，格式为 [[[x, y], ...], ...]，坐标取值0-1"""
+        if not isinstance(polygons, (list, tuple)):
+            raise ValueError('ROI多边形必须是列表')
+
+        parsed = []
+        for polygon in polygons:
+            points = np.asarray(polygon, dtype=np.float32)
+            if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+                raise ValueError('ROI多边形至少需要3个 [x, y] 顶点')
+            if points.min() < 0 or points.max() > 1:
+                raise ValueError('ROI坐标必须是0-1之间的相对坐标')
+            parsed.append(points)
+        return parsed
+
+    @classmethod
+    def from_polygons(cls, polygons: Optional[Sequence]) -> Optional['RegionOfInterest']:
+        """根据摄像头配置创建ROI，未配置或配置无效时返回None（使用整帧）"""
+        if not polygons:
+            return None
+        try:
+            return cls(polygons)
+        except ValueError as e:
+            logger.warning(f'忽略无效的ROI配置: {str(e)}')
+            return None
+
+    def _layout(self, height: int, width: int) -> Tuple[Tuple[int, int, int, int], Optional[np.ndarray]]:
+        """计算并缓存某一帧尺寸下的裁剪框和遮罩"""
+        layout = self._layouts.get((height, width))
+        if layout is not None:
+            return layout
+
+        scale = np.array([width, height], dtype=np.float32)
+        pixel_polygons = [np.round(polygon * scale).astype(np.int32) for polygon in self.polygons]
+        points = np.concatenate(pixel_polygons)
+        x0, y0 = np.clip(points.min(axis=0), 0, [width - 1, height - 1])
+        x1, y1 = np.clip(points.max(axis=0) + 1, 1, [width, height])
+        box = (int(x0), int(y0), int(x1), int(y1))
+
+        mask = np.zeros((box[3] - box[1], box[2] - box[0]), dtype=np.uint8)
+        cv2.fillPoly(mask, [polygon - np.array([box[0], box[1]], dtype=np.int32) for polygon in pixel_polygons], 255)
+        # 多边形恰好铺满裁剪框（矩形ROI）时无需遮罩，直接返回切片视图
+        if cv2.countNonZero(mask) == mask.size:
+            mask = None
+
+        layout = (box, mask)
+        self._layouts[(height, width)] = layout
+        return layout
+
+    def apply(self, frame: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """裁剪并遮罩帧，返回(待检测图像, 裁剪偏移(x, y))"""
+        (x0, y0, x1, y1), mask = self._layout(frame.shape[0], frame.shape[1])
+        crop = frame[y0:y1, x0:x1]
+        if mask is not None:
+            crop = cv2.bitwise_and(crop, crop, mask=mask)
+        return crop, (x0, y0)
+
+    def map_predictions(self, predictions: List[Dict[str, Any]], offset: Tuple[int, int],
+                        frame_shape: Tuple[int, ...]) -> List[Dict[str, Any]]:
+        """把裁剪图像上的检测框平移回整帧坐标，并丢弃中心点落在ROI以外的检测"""
+        _, mask = self._layout(frame_shape[0], frame_shape[1])
+        offset_x, offset_y = offset
+        mapped = []
+        for prediction in predictions:
+            bbox = prediction.get('bbox')
+            if not bbox or len(bbox) < 4:
+                mapped.append(prediction)
+                continue
+
+            if mask is not None:
+                center_x = int(np.clip((bbox[0] + bbox[2]) / 2, 0, mask.shape[1] - 1))
+                center_y = int(np.clip((bbox[1] + bbox[3]) / 2, 0, mask.shape[0] - 1))
+                if not mask[center_y, center_x]:
+                    continue
+
+            prediction = dict(prediction)
+            prediction['bbox'] = [
+                bbox[0] + offset_x, bbox[1] + offset_y,
+                bbox[2] + offset_x, bbox[3] + offset_y
+            ]
+            mapped.append(prediction)
+        return mapped
@@ -0,0 +1,397 @@
+"""
+多进程解码与共享内存帧传输
+摄像头分配到多个解码进程，解码和缩放后的帧写入共享内存环形缓冲，不经过pickle；
+推理端只在取用某一帧时从共享内存复制一次（按分析帧率，而不是解码帧率）
+"""
+
+import cv2
+import numpy as np
+import logging
+import multiprocessing as mp
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Any, Optional, Tuple, List
+
+logger = logging.getLogger(__name__)
+
+# 头部字段：最新帧编号、流结束标志、解码进程心跳时间（毫秒）、保留
+HEADER_LATEST = 0
+HEADER_ENDED = 1
+HEADER_HEARTBEAT = 2
+HEADER_FIELDS = 4
+
+class SharedFrameRing:
+    """共享内存环形帧缓冲
+
+    内存布局：int64头部 + 每个槽位的帧编号 + 槽位帧数据。
+    写端先把槽位编号置为-1再写数据，写完后更新槽位编号和最新帧编号；
+    读端复制槽位后再核对槽位编号，复制期间被写端覆盖则重读（顺序锁），交出去的帧不会再被解码进程改写。
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, frame_shape: Tuple[int, int, int], slots: int, owner: bool):
+        self.shm = shm
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self.owner = owner
+
+        meta_count = HEADER_FIELDS + slots
+        self.header = np.ndarray((meta_count,), dtype=np.int64, buffer=shm.buf)
+        self.slot_ids = self.header[HEADER_FIELDS:]
+        self.frames = np.ndarray(
+            (slots,) + self.frame_shape,
+            dtype=np.uint8,
+            buffer=shm.buf,
+            offset=meta_count * 8
+        )
+
+    @staticmethod
+    def required_size(frame_shape: Tuple[int, int, int], slots: int) -> int:
+        """计算所需的共享内存大小"""
+        return (HEADER_FIELDS + slots) * 8 + slots * int(np.prod(frame_shape))
+
+    @classmethod
+    def create(cls, frame_shape: Tuple[int, int, int], slots: int = 8) -> 'SharedFrameRing':
+        """创建新的共享内存缓冲（主进程持有）"""
+        shm = shared_memory.SharedMemory(create=True, size=cls.required_size(frame_shape, slots))
+        ring = cls(shm, frame_shape, slots, owner=True)
+        ring.header[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, frame_shape: Tuple[int, int, int], slots: int) -> 'SharedFrameRing':
+        """在解码进程中挂载已有的共享内存"""
+        # spawn出的子进程与主进程共用资源跟踪器，由主进程unlink时统一注销
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, frame_shape, slots, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def latest_id(self) -> int:
+        return int(self.header[HEADER_LATEST])
+
+    @property
+    def ended(self) -> bool:
+        return bool(self.header[HEADER_ENDED])
+
+    def begin_write(self) -> Tuple[int, np.ndarray]:
+        """取得下一帧的编号和可写槽位"""
+        frame_id = self.latest_id + 1
+        slot = (frame_id - 1) % self.slots
+        self.slot_ids[slot] = -1
+        return frame_id, self.frames[slot]
+
+    def commit_write(self, frame_id: int):
+        """提交已写完的帧"""
+        self.slot_ids[(frame_id - 1) % self.slots] = frame_id
+        self.header[HEADER_LATEST] = frame_id
+        self.header[HEADER_HEARTBEAT] = int(time.time() * 1000)
+
+    def mark_ended(self):
+        """标记流结束"""
+        self.header[HEADER_ENDED] = 1
+
+    def read_latest(self, after_id: int = 0, retries: int = 3) -> Tuple[int, Optional[np.ndarray]]:
+        """复制最新帧，没有比after_id更新的帧时返回None
+
+        共享内存上的视图在写端绕回该槽位后就会被覆盖，而帧要经过调度队列、推理和回调，
+        所以交出的是一份完整的副本；复制途中槽位被改写时重读最新帧。
+        """
+        for _ in range(retries):
+            frame_id = self.latest_id
+            if frame_id <= after_id:
+                return frame_id, None
+            slot = (frame_id - 1) % self.slots
+            if self.slot_ids[slot] != frame_id:
+                continue
+            frame = self.frames[slot].copy()
+            if self.is_valid(frame_id):
+                return frame_id, frame
+        return after_id, None
+
+    def is_valid(self, frame_id: int) -> bool:
+        """检查槽位中仍是frame_id这一帧（未被写端覆盖或正在改写）"""
+        return self.slot_ids[(frame_id - 1) % self.slots] == frame_id
+
+    def close(self):
+        """释放共享内存，持有方同时删除"""
+        self.header = self.slot_ids = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # 仍有外部视图引用共享内存，映射在视图释放后由GC回收
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+def _decode_camera(camera_id: str, stream_url: str, shm_name: str, frame_shape: Tuple[int, int, int],
+                   slots: int, stop_event: threading.Event):
+    """解码进程内的单摄像头解码线程"""
+    ring = None
+    cap = None
+    try:
+        ring = SharedFrameRing.attach(shm_name, frame_shape, slots)
+        cap = cv2.VideoCapture(stream_url)
+        if not cap.isOpened():
+            logger.error(f'无法打开视频流: {stream_url}')
+            return
+
+        height, width = frame_shape[:2]
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                logger.warning(f'无法读取帧: {camera_id}')
+                break
+
+            frame_id, slot = ring.begin_write()
+            if frame.shape == slot.shape:
+                np.copyto(slot, frame)
+            else:
+                # 直接缩放到共享内存槽位中
+                cv2.resize(frame, (width, height), dst=slot)
+            ring.commit_write(frame_id)
+
+    except Exception as e:
+        logger.error(f'解码进程处理摄像头 {camera_id} 失败: {str(e)}')
+    finally:
+        if cap is not None:
+            cap.release()
+        if ring is not None:
+            ring.mark_ended()
+            ring.close()
+
+def _decode_worker_main(command_queue):
+    """解码进程入口"""
+    cameras: Dict[str, Tuple[threading.Thread, threading.Event]] = {}
+    while True:
+        command = command_queue.get()
+        op = command[0]
+
+        if op == 'add':
+            _, camera_id, stream_url, shm_name, frame_shape, slots = command
+            stop_event = threading.Event()
+            thread = threading.Thread(
+                target=_decode_camera,
+                args=(camera_id, stream_url, shm_name, frame_shape, slots, stop_event),
+                name=f'decode-{camera_id}'
+            )
+            thread.daemon = True
+            thread.start()
+            cameras[camera_id] = (thread, stop_event)
+
+        elif op == 'remove':
+            entry = cameras.pop(command[1], None)
+            if entry:
+                entry[1].set()
+                entry[0].join(timeout=5)
+
+        elif op == 'stop':
+            for thread, stop_event in cameras.values():
+                stop_event.set()
+            for thread, stop_event in cameras.values():
+                thread.join(timeout=5)
+            break
+
+class SharedFrameSource:
+    """共享内存帧源，接口与LatestFrameGrabber一致"""
+
+    def __init__(self, pool: 'DecodeWorkerPool', camera_id: str, stream_url: str, frame_shape: Tuple[int, int, int]):
+        self.pool = pool
+        self.camera_id = camera_id
+        self.stream_url = stream_url
+        self.frame_shape = frame_shape
+        self.ring: Optional[SharedFrameRing] = None
+        self.worker_index = None
+        self.poll_interval = 0.005
+
+        self.frames_dropped = 0
+        self.start_time = 0.0
+        self.last_read_time = 0.0
+        self._last_read_id = 0
+        self._stopped = False
+
+    def start(self) -> bool:
+        """分配共享内存并交给解码进程"""
+        try:
+            self.ring = SharedFrameRing.create(self.frame_shape, self.pool.ring_slots)
+            self.worker_index = self.pool._assign(self)
+            self.start_time = time.time()
+            return True
+        except Exception as e:
+            logger.error(f'启动共享内存帧源失败: {str(e)}')
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+            return False
+
+    def stop(self, timeout: float = 5):
+        """通知解码进程停止并回收共享内存"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.pool._release(self)
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    @property
+    def ended(self) -> bool:
+        return self._stopped or self.ring is None or self.ring.ended or not self.worker_alive
+
+    @property
+    def worker_alive(self) -> bool:
+        """解码进程是否还在运行（进程崩溃时不会设置环形缓冲的结束标志）"""
+        return self.pool.is_worker_alive(self.worker_index)
+
+    @property
+    def frames_read(self) -> int:
+        return self.ring.latest_id if self.ring is not None else 0
+
+    def read(self, after_id: int = 0, timeout: Optional[float] = None) -> Tuple[int, Optional[np.ndarray]]:
+        """等待并返回最新帧的副本；解码进程已退出时抛出RuntimeError，由监管器重连"""
+        deadline = None if timeout is None else time.time() + timeout
+        while not self._stopped and self.ring is not None:
+            frame_id, frame = self.ring.read_latest(after_id)
+            if frame is not None:
+                # 跳过的帧编号即为丢帧
+                if frame_id > self._last_read_id + 1:
+                    self.frames_dropped += frame_id - self._last_read_id - 1
+                self._last_read_id = frame_id
+                self.last_read_time = self.ring.header[HEADER_HEARTBEAT] / 1000.0
+                return frame_id, frame
+            if self.ring.ended:
+                break
+            if not self.worker_alive:
+                raise RuntimeError(f'摄像头 {self.camera_id} 的解码进程已退出')
+            if deadline is not None and time.time() >= deadline:
+                break
+            time.sleep(self.poll_interval)
+        return self.frames_read, None
+
+    def peek(self) -> Tuple[int, Optional[np.ndarray], float]:
+        """不等待、不标记消费地取最新帧的副本"""
+        if self.ring is None:
+            return 0, None, 0.0
+        frame_id, frame = self.ring.read_latest(0)
+        return frame_id, frame, self.ring.header[HEADER_HEARTBEAT] / 1000.0
+
+    def is_alive(self) -> bool:
+        return not self.ended
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取帧源统计"""
+        elapsed = time.time() - self.start_time if self.start_time else 0
+        heartbeat = self.ring.header[HEADER_HEARTBEAT] / 1000.0 if self.ring is not None else 0
+        return {
+            'frames_read': self.frames_read,
+            'frames_dropped': self.frames_dropped,
+            'decode_fps': round(self.frames_read / elapsed, 2) if elapsed > 0 else 0,
+            'frame_age': round(time.time() - heartbeat, 3) if heartbeat else None,
+            'alive': self.is_alive(),
+            'worker': self.worker_index
+        }
+
+class DecodeWorkerPool:
+    """解码进程池
+
+    每个进程内为分到的摄像头各起一个解码线程，解码和缩放在子进程中完成，不占用主进程GIL。
+    解码进程崩溃后，其上的帧源读帧时报错交给监管器重连，重新分配时先拉起新的解码进程。
+    """
+
+    def __init__(self, num_workers: int, ring_slots: int = 8):
+        self.num_workers = num_workers
+        self.ring_slots = ring_slots
+        self._context = mp.get_context('spawn')
+        self._processes: List[Any] = []
+        self._queues: List[Any] = []
+        self._assignments: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动解码进程"""
+        with self._lock:
+            if self._processes:
+                return
+            for index in range(self.num_workers):
+                process, command_queue = self._spawn(index)
+                self._processes.append(process)
+                self._queues.append(command_queue)
+            logger.info(f'已启动 {self.num_workers} 个解码进程')
+
+    def _spawn(self, index: int):
+        command_queue = self._context.Queue()
+        process = self._context.Process(
+            target=_decode_worker_main,
+            args=(command_queue,),
+            name=f'decode-worker-{index}'
+        )
+        process.daemon = True
+        process.start()
+        return process, command_queue
+
+    def open(self, camera_id: str, stream_url: str, width: int, height: int) -> SharedFrameSource:
+        """为摄像头创建共享内存帧源（调用start后开始解码）"""
+        self.start()
+        return SharedFrameSource(self, camera_id, stream_url, (int(height), int(width), 3))
+
+    def _assign(self, source: SharedFrameSource) -> int:
+        """把摄像头分配给负载最小的解码进程"""
+        with self._lock:
+            loads = [0] * self.num_workers
+            for index in self._assignments.values():
+                loads[index] += 1
+            index = loads.index(min(loads))
+            if not self._processes[index].is_alive():
+                logger.warning(f'解码进程 {index} 已退出（退出码 {self._processes[index].exitcode}），重新启动')
+                self._processes[index], self._queues[index] = self._spawn(index)
+                # 原进程上的摄像头由各自的帧源报错后重新分配
+                self._assignments = {camera_id: i for camera_id, i in self._assignments.items() if i != index}
+            self._assignments[source.camera_id] = index
+            self._queues[index].put((
+                'add', source.camera_id, source.stream_url,
+                source.ring.name, source.frame_shape, source.ring.slots
+            ))
+            return index
+
+    def _release(self, source: SharedFrameSource):
+        """从解码进程移除摄像头"""
+        with self._lock:
+            index = self._assignments.pop(source.camera_id, None)
+            if index is not None and index < len(self._queues):
+                self._queues[index].put(('remove', source.camera_id))
+
+    def is_worker_alive(self, index: Optional[int]) -> bool:
+        return index is not None and index < len(self._processes) and self._processes[index].is_alive()
+
+    def stop(self):
+        """停止所有解码进程"""
+        with self._lock:
+            for command_queue in self._queues:
+                command_queue.put(('stop',))
+            for process in self._processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+            self._processes.clear()
+            self._queues.clear()
+            self._assignments.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取进程池状态"""
+        return {
+            'workers': [
+                {
+                    'index': index,
+                    'pid': process.pid,
+                    'alive': process.is_alive(),
+                    'cameras': [cid for cid, i in self._assignments.items() if i == index]
+                }
+                for index, process in enumerate(self._processes)
+            ]
+        }
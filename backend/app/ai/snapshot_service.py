@@ -0,0 +1,166 @@
+"""
+摄像头快照服务
+优先复用正在处理的解码流水线（视频处理器或视频流接口）的最新帧，否则使用短时复用的抓帧句柄，JPEG结果按TTL缓存
+"""
+
+import cv2
+import numpy as np
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from app.ai.frame_grabber import LatestFrameGrabber, GrabberRegistry, grabber_registry
+
+logger = logging.getLogger(__name__)
+
+class SnapshotService:
+    """快照服务
+
+    多个看板同时请求同一摄像头缩略图时，TTL内只解码、编码一次；
+    按摄像头加锁，并发请求等待同一次编码结果。
+    """
+
+    def __init__(self, grabbers: Optional[GrabberRegistry] = None, cache_ttl: float = 2.0, handle_idle_ttl: float = 30.0,
+                 open_timeout: float = 10.0, jpeg_quality: int = 80):
+        # 正在运行的流水线登记的抓帧句柄
+        self.grabbers = grabbers or grabber_registry
+        self.cache_ttl = cache_ttl
+        self.handle_idle_ttl = handle_idle_ttl
+        self.open_timeout = open_timeout
+        self.jpeg_quality = jpeg_quality
+
+        self._cache: Dict[Tuple[str, Optional[int]], Tuple[bytes, float]] = {}
+        self._handles: Dict[str, Tuple[LatestFrameGrabber, float]] = {}
+        self._camera_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._janitor = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def _camera_lock(self, camera_id: str) -> threading.Lock:
+        with self._lock:
+            return self._camera_locks.setdefault(camera_id, threading.Lock())
+
+    def get_frame(self, camera_id: str, stream_url: Optional[str] = None) -> Optional[np.ndarray]:
+        """获取摄像头当前帧（返回副本）"""
+        with self._camera_lock(camera_id):
+            frame, _ = self._latest_frame(camera_id, stream_url)
+            return None if frame is None else frame.copy()
+
+    def _latest_frame(self, camera_id: str, stream_url: Optional[str]) -> Tuple[Optional[np.ndarray], str]:
+        """取最新帧及其来源：pipeline为正在处理的流水线，pool为复用句柄
+
+        调用方需持有该摄像头的锁，保证同一摄像头只创建一个复用句柄
+        """
+        # 1. 正在处理的摄像头直接复用解码流水线的最新帧
+        grabber = self.grabbers.get(camera_id)
+        if grabber is not None:
+            _, frame, _ = grabber.peek()
+            if frame is not None:
+                return frame, 'pipeline'
+
+        if not stream_url:
+            return None, 'none'
+
+        # 2. 复用短时抓帧句柄，避免每次重新握手等待关键帧
+        with self._lock:
+            entry = self._handles.get(camera_id)
+        handle = entry[0] if entry else None
+        if handle is None or handle.ended or handle.stream_url != stream_url:
+            if handle is not None:
+                handle.stop()
+            handle = LatestFrameGrabber(camera_id, stream_url)
+            if not handle.start():
+                return None, 'none'
+
+        with self._lock:
+            self._handles[camera_id] = (handle, time.time())
+        self._ensure_janitor()
+
+        _, frame, _ = handle.peek()
+        if frame is None:
+            _, frame = handle.read(timeout=self.open_timeout)
+        return frame, 'pool'
+
+    def get_jpeg(self, camera_id: str, stream_url: Optional[str] = None,
+                 max_width: Optional[int] = None) -> Optional[bytes]:
+        """获取JPEG快照，TTL内的重复请求直接返回缓存"""
+        key = (camera_id, max_width)
+        cached = self._cache.get(key)
+        if cached and time.time() - cached[1] < self.cache_ttl:
+            self.hits += 1
+            return cached[0]
+
+        with self._camera_lock(camera_id):
+            # 等锁期间可能已有其他请求完成编码
+            cached = self._cache.get(key)
+            if cached and time.time() - cached[1] < self.cache_ttl:
+                self.hits += 1
+                return cached[0]
+
+            self.misses += 1
+            frame, _ = self._latest_frame(camera_id, stream_url)
+            if frame is None:
+                return None
+
+            if max_width and frame.shape[1] > max_width:
+                height = int(frame.shape[0] * max_width / frame.shape[1])
+                frame = cv2.resize(frame, (max_width, height), interpolation=cv2.INTER_AREA)
+
+            ok, encoded = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if not ok:
+                logger.error(f'快照编码失败: {camera_id}')
+                return None
+
+            data = encoded.tobytes()
+            self._cache[key] = (data, time.time())
+            return data
+
+    def _ensure_janitor(self):
+        """启动空闲句柄回收线程"""
+        with self._lock:
+            if self._janitor is not None:
+                return
+            self._janitor = threading.Thread(target=self._janitor_loop, name='snapshot-janitor')
+            self._janitor.daemon = True
+            self._janitor.start()
+
+    def _janitor_loop(self):
+        """回收空闲句柄和过期缓存，没有句柄时退出"""
+        while True:
+            time.sleep(min(self.handle_idle_ttl, 5.0))
+            now = time.time()
+            with self._lock:
+                idle = [cid for cid, (_, last_used) in self._handles.items() if now - last_used > self.handle_idle_ttl]
+                handles = [self._handles.pop(cid)[0] for cid in idle]
+                for key in [k for k, (_, ts) in self._cache.items() if now - ts > self.cache_ttl]:
+                    del self._cache[key]
+                exiting = not self._handles
+                if exiting:
+                    self._janitor = None
+            for handle in handles:
+                handle.stop()
+            if exiting:
+                break
+
+    def close(self):
+        """关闭所有复用句柄"""
+        with self._lock:
+            handles = [handle for handle, _ in self._handles.values()]
+            self._handles.clear()
+            self._cache.clear()
+        for handle in handles:
+            handle.stop()
+
+    def get_stats(self) -> Dict[str, int]:
+        """获取缓存命中统计"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'pooled_handles': len(self._handles),
+            'cached_snapshots': len(self._cache)
+        }
+
+# 全局快照服务实例
+snapshot_service = SnapshotService()
@@ -0,0 +1,261 @@
+"""
+视频流水线监管器
+基于asyncio统一管理所有摄像头流水线：断线指数退避重连、单节点并发上限、状态变迁记录
+"""
+
+import os
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 流水线状态
+STATE_QUEUED = 'queued'        # 等待并发名额
+STATE_RUNNING = 'running'      # 正在运行
+STATE_BACKOFF = 'backoff'      # 断线后等待重连
+STATE_FAILED = 'failed'        # 超过最大重试次数
+STATE_STOPPED = 'stopped'      # 已停止
+
+class CameraPipeline:
+    """单个摄像头流水线的监管记录"""
+
+    def __init__(self, camera_id: str, group: str, runner: Callable[[threading.Event], None]):
+        self.camera_id = camera_id
+        self.group = group
+        self.runner = runner
+        self.state = STATE_QUEUED
+        self.stop_event = threading.Event()
+        self.done = threading.Event()
+        self.wakeup: Optional[asyncio.Event] = None
+
+        self.attempts = 0
+        self.restarts = 0
+        self.last_error = None
+        self.next_retry = None
+        self.started_at = None
+        self.registered_at = time.time()
+        self.transitions = deque(maxlen=20)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'cameraId': self.camera_id,
+            'group': self.group,
+            'state': self.state,
+            'attempts': self.attempts,
+            'restarts': self.restarts,
+            'lastError': self.last_error,
+            'nextRetry': self.next_retry,
+            'startedAt': self.started_at,
+            'transitions': list(self.transitions)
+        }
+
+class StreamSupervisor:
+    """流水线监管器
+
+    asyncio事件循环运行在独立线程中，每条流水线一个监管协程；
+    流水线本身是阻塞的解码/分析函数，在受限线程池中执行。
+    runner(stop_event)返回或抛异常即视为流断开，按指数退避（带抖动）重启；
+    连续稳定运行stable_after秒后退避次数清零，避免抖动摄像头在紧密循环里反复重连。
+    """
+
+    def __init__(self, max_pipelines: int = 32, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 stable_after: float = 60.0, max_attempts: Optional[int] = None):
+        self.max_pipelines = max_pipelines
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.max_attempts = max_attempts
+
+        self.pipelines: Dict[Tuple[str, str], CameraPipeline] = {}
+        self._listeners: List[Callable[[CameraPipeline, str, str, str], None]] = []
+        self._executor = ThreadPoolExecutor(max_workers=max_pipelines, thread_name_prefix='pipeline')
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """启动事件循环线程"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run_loop():
+                    asyncio.set_event_loop(loop)
+                    self._slots = asyncio.Semaphore(self.max_pipelines)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                thread = threading.Thread(target=run_loop, name='stream-supervisor')
+                thread.daemon = True
+                thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def add_listener(self, listener: Callable[[CameraPipeline, str, str, str], None]):
+        """注册状态变迁回调 listener(pipeline, old_state, new_state, reason)"""
+        self._listeners.append(listener)
+
+    def register(self, camera_id: str, runner: Callable[[threading.Event], None], group: str = 'analysis') -> bool:
+        """登记并启动一条流水线，已存在时返回False"""
+        key = (group, camera_id)
+        with self._lock:
+            existing = self.pipelines.get(key)
+            if existing is not None and not existing.done.is_set():
+                return False
+            pipeline = CameraPipeline(camera_id, group, runner)
+            self.pipelines[key] = pipeline
+
+        loop = self._ensure_loop()
+        asyncio.run_coroutine_threadsafe(self._start(pipeline), loop)
+        return True
+
+    def unregister(self, camera_id: str, group: str = 'analysis', timeout: float = 5) -> bool:
+        """停止并移除一条流水线，等待运行中的runner退出"""
+        with self._lock:
+            pipeline = self.pipelines.pop((group, camera_id), None)
+        if pipeline is None:
+            return False
+
+        pipeline.stop_event.set()
+        if self._loop is not None and pipeline.wakeup is not None:
+            self._loop.call_soon_threadsafe(pipeline.wakeup.set)
+        pipeline.done.wait(timeout)
+        return True
+
+    def is_registered(self, camera_id: str, group: str = 'analysis') -> bool:
+        pipeline = self.pipelines.get((group, camera_id))
+        return pipeline is not None and not pipeline.done.is_set()
+
+    def get_pipeline(self, camera_id: str, group: str = 'analysis') -> Optional[CameraPipeline]:
+        return self.pipelines.get((group, camera_id))
+
+    def get_states(self, group: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取流水线状态列表"""
+        return [
+            pipeline.to_dict()
+            for (pipeline_group, _), pipeline in list(self.pipelines.items())
+            if group is None or pipeline_group == group
+        ]
+
+    def get_summary(self) -> Dict[str, Any]:
+        """获取各状态的流水线数量"""
+        counts: Dict[str, int] = {}
+        for pipeline in list(self.pipelines.values()):
+            counts[pipeline.state] = counts.get(pipeline.state, 0) + 1
+        return {
+            'maxPipelines': self.max_pipelines,
+            'total': len(self.pipelines),
+            'states': counts
+        }
+
+    def _transition(self, pipeline: CameraPipeline, state: str, reason: str = ''):
+        """记录状态变迁"""
+        old_state = pipeline.state
+        pipeline.state = state
+        pipeline.transitions.append({
+            'time': time.time(),
+            'from': old_state,
+            'to': state,
+            'reason': reason
+        })
+        logger.info(f'流水线 {pipeline.group}:{pipeline.camera_id} {old_state} -> {state} {reason}')
+        for listener in self._listeners:
+            try:
+                listener(pipeline, old_state, state, reason)
+            except Exception as e:
+                logger.error(f'流水线状态回调失败: {str(e)}')
+
+    def _backoff_delay(self, attempts: int) -> float:
+        """指数退避时间，带±20%抖动避免同时重连"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempts))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _start(self, pipeline: CameraPipeline):
+        pipeline.wakeup = asyncio.Event()
+        if pipeline.stop_event.is_set():
+            pipeline.wakeup.set()
+        asyncio.ensure_future(self._supervise(pipeline))
+
+    async def _acquire_slot(self, pipeline: CameraPipeline) -> bool:
+        """等待并发名额，等待期间收到停止请求则返回False"""
+        if self._slots.locked():
+            self._transition(pipeline, STATE_QUEUED, f'已达并发上限 {self.max_pipelines}')
+
+        acquire = asyncio.ensure_future(self._slots.acquire())
+        wakeup = asyncio.ensure_future(pipeline.wakeup.wait())
+        await asyncio.wait({acquire, wakeup}, return_when=asyncio.FIRST_COMPLETED)
+        wakeup.cancel()
+
+        if pipeline.stop_event.is_set():
+            if acquire.done() and not acquire.cancelled():
+                self._slots.release()
+            else:
+                acquire.cancel()
+            return False
+        return True
+
+    async def _supervise(self, pipeline: CameraPipeline):
+        """监管协程：运行、断线退避、重启"""
+        loop = asyncio.get_running_loop()
+        try:
+            while not pipeline.stop_event.is_set():
+                if not await self._acquire_slot(pipeline):
+                    break
+
+                started = time.time()
+                pipeline.started_at = started
+                self._transition(pipeline, STATE_RUNNING, f'第 {pipeline.restarts + 1} 次启动')
+                try:
+                    await loop.run_in_executor(self._executor, pipeline.runner, pipeline.stop_event)
+                    pipeline.last_error = None
+                except Exception as e:
+                    pipeline.last_error = str(e)
+                    logger.error(f'流水线 {pipeline.group}:{pipeline.camera_id} 异常退出: {str(e)}')
+                finally:
+                    self._slots.release()
+
+                if pipeline.stop_event.is_set():
+                    break
+
+                # 稳定运行过一段时间则重新从最短退避开始
+                if time.time() - started >= self.stable_after:
+                    pipeline.attempts = 0
+                pipeline.attempts += 1
+                pipeline.restarts += 1
+
+                if self.max_attempts is not None and pipeline.attempts > self.max_attempts:
+                    self._transition(pipeline, STATE_FAILED, f'重试 {self.max_attempts} 次后放弃')
+                    return
+
+                delay = self._backoff_delay(pipeline.attempts - 1)
+                pipeline.next_retry = time.time() + delay
+                self._transition(pipeline, STATE_BACKOFF, f'{pipeline.last_error or "流已断开"}，{delay:.1f}秒后重连')
+                try:
+                    await asyncio.wait_for(pipeline.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                pipeline.next_retry = None
+
+            self._transition(pipeline, STATE_STOPPED, '已停止')
+        finally:
+            pipeline.done.set()
+
+    def shutdown(self, timeout: float = 5):
+        """停止所有流水线"""
+        for group, camera_id in list(self.pipelines.keys()):
+            self.unregister(camera_id, group, timeout)
+
+# 全局流水线监管器实例
+stream_supervisor = StreamSupervisor(
+    max_pipelines=int(os.environ.get('STREAM_MAX_PIPELINES', 32)),
+    backoff_base=float(os.environ.get('STREAM_BACKOFF_BASE', 1.0)),
+    backoff_max=float(os.environ.get('STREAM_BACKOFF_MAX', 60.0))
+)
@@ -0,0 +1,156 @@
+"""
+测试视频源
+生成确定性的合成视频，或循环播放本地文件，用于无摄像头、无网络环境下的基准测试
+"""
+
+import cv2
+import numpy as np
+import time
+from typing import Any, Dict
+from urllib.parse import urlparse, parse_qs
+
+# 测试视频源地址前缀
+SYNTHETIC_SCHEME = 'synthetic://'
+LOOP_SCHEME = 'loop://'
+
+def is_test_source(stream_url: str) -> bool:
+    """是否为测试视频源地址"""
+    return stream_url.startswith((SYNTHETIC_SCHEME, LOOP_SCHEME))
+
+def _query_options(query: str) -> Dict[str, str]:
+    return {key: values[-1] for key, values in parse_qs(query).items()}
+
+def open_test_source(stream_url: str):
+    """按地址打开测试视频源
+
+    synthetic://?width=1280&height=720&fps=25&objects=8&seed=0&realtime=1
+    loop:///path/to/video.mp4?realtime=1
+    """
+    parsed = urlparse(stream_url)
+    options = _query_options(parsed.query)
+    realtime = options.get('realtime', '1') != '0'
+    if stream_url.startswith(LOOP_SCHEME):
+        return LoopingFileCapture(parsed.netloc + parsed.path, realtime=realtime)
+    return SyntheticCapture(
+        width=int(options.get('width', 1280)),
+        height=int(options.get('height', 720)),
+        fps=float(options.get('fps', 25)),
+        objects=int(options.get('objects', 8)),
+        seed=int(options.get('seed', 0)),
+        realtime=realtime
+    )
+
+class _Pacer:
+    """按帧率节拍输出帧"""
+
+    def __init__(self, fps: float, realtime: bool):
+        self.interval = 1.0 / fps if fps > 0 else 0
+        self.realtime = realtime
+        self.start = time.time()
+
+    def wait(self, index: int):
+        if self.realtime and self.interval:
+            delay = self.start + index * self.interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+class SyntheticCapture:
+    """合成视频源（cv2.VideoCapture接口）
+
+    渐变背景上若干彩色方块匀速运动、碰边反弹；同一seed生成的帧序列完全相同，
+    方块位置由帧序号直接算出，与读取时机无关。
+    """
+
+    def __init__(self, width: int = 1280, height: int = 720, fps: float = 25, objects: int = 8,
+                 seed: int = 0, realtime: bool = True, max_frames: int = 0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.max_frames = max_frames
+        self.index = 0
+        self._opened = True
+        self._pacer = _Pacer(fps, realtime)
+
+        rng = np.random.default_rng(seed)
+        gradient_x = np.linspace(40, 160, width, dtype=np.float32)
+        gradient_y = np.linspace(0, 60, height, dtype=np.float32)[:, None]
+        background = np.empty((height, width, 3), dtype=np.uint8)
+        background[..., 0] = (gradient_x + gradient_y).astype(np.uint8)
+        background[..., 1] = (gradient_x * 0.8 + gradient_y).astype(np.uint8)
+        background[..., 2] = 90
+        self._background = background
+
+        self._sizes = np.stack([
+            rng.integers(max(4, width // 40), max(5, width // 8), objects),
+            rng.integers(max(4, height // 40), max(5, height // 8), objects)
+        ], axis=1)
+        self._origins = rng.uniform(0, 1, (objects, 2)) * [width, height]
+        self._velocities = rng.uniform(-1, 1, (objects, 2)) * [width, height] / max(fps, 1) / 4
+        self._colors = rng.integers(0, 256, (objects, 3), dtype=np.uint8)
+
+    def _positions(self, index: int) -> np.ndarray:
+        """第index帧各方块左上角坐标（在可用范围内往返）"""
+        limits = np.maximum(np.array([self.width, self.height]) - self._sizes, 1)
+        travel = np.mod(self._origins + self._velocities * index, 2 * limits)
+        return np.where(travel <= limits, travel, 2 * limits - travel).astype(np.int64)
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def read(self):
+        if not self._opened or (self.max_frames and self.index >= self.max_frames):
+            return False, None
+        self._pacer.wait(self.index)
+
+        frame = self._background.copy()
+        for (x, y), (w, h), color in zip(self._positions(self.index), self._sizes, self._colors):
+            frame[y:y + h, x:x + w] = color
+        self.index += 1
+        return True, frame
+
+    def get(self, prop: int) -> float:
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_COUNT: self.max_frames
+        }.get(prop, 0)
+
+    def set(self, prop: int, value: Any) -> bool:
+        return False
+
+    def release(self):
+        self._opened = False
+
+class LoopingFileCapture:
+    """循环播放本地视频文件（cv2.VideoCapture接口），按文件帧率输出"""
+
+    def __init__(self, path: str, realtime: bool = True):
+        self._cap = cv2.VideoCapture(path)
+        self.index = 0
+        fps = self._cap.get(cv2.CAP_PROP_FPS) if self._cap.isOpened() else 0
+        self._pacer = _Pacer(fps or 25, realtime)
+
+    def isOpened(self) -> bool:
+        return self._cap.isOpened()
+
+    def read(self):
+        ret, frame = self._cap.read()
+        if not ret:
+            # 播放到结尾后回到开头
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._cap.read()
+            if not ret:
+                return False, None
+        self._pacer.wait(self.index)
+        self.index += 1
+        return True, frame
+
+    def get(self, prop: int) -> float:
+        return self._cap.get(prop)
+
+    def set(self, prop: int, value: Any) -> bool:
+        return self._cap.set(prop, value)
+
+    def release(self):
+        self._cap.release()
@@ -0,0 +1,75 @@
+"""
+切片推理工具
+高分辨率画面切成相互重叠的小块分别检测，再合并各切片的检测框
+"""
+
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from app.ai.postprocess import non_max_suppression
+
+def tile_origins(length: int, tile: int, overlap: float) -> List[int]:
+    """计算一个方向上各切片的起点，最后一块与边缘对齐"""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+def make_tiles(image: np.ndarray, tile_width: int, tile_height: int,
+               overlap: float = 0.2) -> Tuple[List[np.ndarray], List[Tuple[int, int]]]:
+    """把图像切成重叠切片（切片是原图的视图，不复制像素），返回(切片列表, 左上角坐标列表)"""
+    height, width = image.shape[:2]
+    tiles = []
+    origins = []
+    for y in tile_origins(height, tile_height, overlap):
+        for x in tile_origins(width, tile_width, overlap):
+            tiles.append(image[y:y + tile_height, x:x + tile_width])
+            origins.append((x, y))
+    return tiles, origins
+
+def merge_tile_predictions(tile_predictions: List[List[Dict[str, Any]]], origins: List[Tuple[int, int]],
+                           iou_threshold: float = 0.5, match_metric: str = 'ios') -> List[Dict[str, Any]]:
+    """把各切片的检测框平移回原图坐标，按类别做跨切片NMS去重"""
+    predictions = []
+    boxes = []
+    for tile_result, (offset_x, offset_y) in zip(tile_predictions, origins):
+        for prediction in tile_result:
+            bbox = prediction.get('bbox')
+            if not bbox or len(bbox) < 4:
+                continue
+            box = [bbox[0] + offset_x, bbox[1] + offset_y, bbox[2] + offset_x, bbox[3] + offset_y]
+            prediction = dict(prediction)
+            prediction['bbox'] = box
+            predictions.append(prediction)
+            boxes.append(box)
+
+    if not predictions:
+        return []
+
+    scores = np.array([p.get('confidence', 0) for p in predictions], dtype=np.float32)
+    _, classes = np.unique([str(p.get('class')) for p in predictions], return_inverse=True)
+    keep = non_max_suppression(np.array(boxes, dtype=np.float32), scores, iou_threshold,
+                               classes=classes, match_metric=match_metric)
+    return [predictions[i] for i in keep]
+
+def tiling_options(config: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """从摄像头analysis_config读取切片推理参数，未开启时返回None
+
+    配置项：tiled_inference（是否开启）、tile_size（"宽x高"或边长，默认模型输入尺寸）、
+    tile_overlap（重叠比例）、tile_include_full（是否额外检测整帧缩略图以保留大目标）
+    """
+    config = config or {}
+    if not config.get('tiled_inference'):
+        return None
+
+    options = {
+        'overlap': float(config.get('tile_overlap', 0.2)),
+        'include_full': bool(config.get('tile_include_full', True))
+    }
+    tile_size = config.get('tile_size')
+    if isinstance(tile_size, str) and 'x' in tile_size:
+        options['tile_size'] = tuple(map(int, tile_size.split('x')))
+    elif tile_size:
+        options['tile_size'] = (int(tile_size), int(tile_size))
+    return options
@@ -0,0 +1,423 @@
+"""
+多目标跟踪
+IoU + 卡尔曼滤波的轻量跟踪器（ByteTrack式两阶段关联，纯numpy实现），按摄像头维护持久的轨迹ID。
+检测器只需每秒运行几次，中间帧由卡尔曼模型外推轨迹位置；轨迹结束时输出一条汇总记录，每辆车写一行数据库
+"""
+
+import os
+import logging
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Set, Tuple
+import numpy as np
+from app.ai.postprocess import box_iou
+
+logger = logging.getLogger(__name__)
+
+# 跟踪默认参数，可被摄像头analysis_config覆盖
+TRACKER_DEFAULTS = {
+    # 默认关闭，摄像头analysis_config设置 "tracking": true 后才改为按detect_fps检测（否则保持每10帧分析一次）
+    'tracking': os.environ.get('TRACKING_ENABLED', 'false').lower() == 'true',
+    # 开启跟踪时检测器每秒运行的次数，其余帧只外推轨迹
+    'detect_fps': float(os.environ.get('TRACKER_DETECT_FPS', 3)),
+    # 轨迹外推（中间帧）的最高帧率，0表示每个解码帧都外推
+    'track_fps': float(os.environ.get('TRACKER_TRACK_FPS', 10)),
+    # 高于该置信度的检测框参与第一轮关联并可以新建轨迹，低置信度框只用于延续已有轨迹
+    'track_high_threshold': 0.5,
+    'track_low_threshold': 0.1,
+    'track_new_threshold': 0.6,
+    'track_match_iou': 0.3,
+    # 新轨迹还没有速度估计，与检测框关联时两边的框向外扩展宽高的该比例后再算IoU（Buffered IoU），
+    # 低检测帧率下快速移动的车辆相邻两次检测的框可能不重叠
+    'track_buffer': 0.5,
+    # 新轨迹连续匹配多少次后确认
+    'track_min_hits': 2,
+    # 丢失多久（秒）后结束轨迹
+    'track_max_lost_seconds': float(os.environ.get('TRACKER_MAX_LOST_SECONDS', 2.0))
+}
+
+# 轨迹状态
+TENTATIVE = 'tentative'
+CONFIRMED = 'confirmed'
+LOST = 'lost'
+
+# 每条轨迹保留的轨迹点数量上限
+MAX_PATH_POINTS = 200
+
+# 卡尔曼滤波噪声，均为相对目标高度的比例：检测框测量噪声取DeepSORT的1/20；
+# 过程噪声和新轨迹的初始速度不确定度按秒计（DeepSORT逐帧取值按30fps换算）
+_STD_MEASUREMENT = 1.0 / 20
+_STD_PROCESS_POSITION = 0.25
+_STD_PROCESS_VELOCITY = 1.0
+_STD_INITIAL_VELOCITY = 2.0
+_MEASUREMENT = np.hstack([np.eye(4), np.zeros((4, 4))]).astype(np.float64)
+
+def tracker_options(config: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """合并默认参数和摄像头analysis_config中的跟踪参数，未开启跟踪时返回None"""
+    options = dict(TRACKER_DEFAULTS)
+    options.update({key: value for key, value in (config or {}).items() if key in TRACKER_DEFAULTS})
+    if not options['tracking'] or options['detect_fps'] <= 0:
+        return None
+    return options
+
+def _xyxy_to_state(boxes: np.ndarray) -> np.ndarray:
+    """xyxy -> (中心x, 中心y, 宽, 高)"""
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2,
+                     boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]], axis=1)
+
+def _state_to_xyxy(means: np.ndarray) -> np.ndarray:
+    """(中心x, 中心y, 宽, 高, ...) -> xyxy"""
+    half_w = np.maximum(means[:, 2], 0) / 2
+    half_h = np.maximum(means[:, 3], 0) / 2
+    return np.stack([means[:, 0] - half_w, means[:, 1] - half_h, means[:, 0] + half_w, means[:, 1] + half_h], axis=1)
+
+def _buffered(boxes: np.ndarray, scale: float) -> np.ndarray:
+    """xyxy框四边各向外扩展宽/高的scale倍"""
+    pad_w = (boxes[:, 2] - boxes[:, 0]) * scale
+    pad_h = (boxes[:, 3] - boxes[:, 1]) * scale
+    return np.stack([boxes[:, 0] - pad_w, boxes[:, 1] - pad_h, boxes[:, 2] + pad_w, boxes[:, 3] + pad_h], axis=1)
+
+def _greedy_match(iou: np.ndarray, threshold: float) -> List[Tuple[int, int]]:
+    """按重叠度从高到低贪心一对一匹配（行: 轨迹，列: 检测框）"""
+    if iou.size == 0:
+        return []
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols], kind='stable')
+    matched_rows, matched_cols, matches = set(), set(), []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row in matched_rows or col in matched_cols:
+            continue
+        matched_rows.add(row)
+        matched_cols.add(col)
+        matches.append((row, col))
+    return matches
+
+class Track:
+    """单条轨迹的元数据；位置和速度的滤波状态由跟踪器按数组统一保存"""
+
+    __slots__ = ('track_id', 'state', 'hits', 'class_votes', 'confidence_sum', 'confidence',
+                 'first_seen', 'last_seen', 'path')
+
+    def __init__(self, track_id: int, class_name: str, confidence: float, timestamp: float):
+        self.track_id = track_id
+        self.state = TENTATIVE
+        self.hits = 1
+        self.class_votes: Dict[str, float] = {class_name: confidence}
+        self.confidence_sum = confidence
+        self.confidence = confidence
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.path = deque(maxlen=MAX_PATH_POINTS)
+
+    @property
+    def class_name(self) -> str:
+        """按置信度加权投票的类别（同一辆车在car/truck之间跳变时取主要类别）"""
+        return max(self.class_votes.items(), key=lambda item: item[1])[0]
+
+    def observe(self, class_name: str, confidence: float, timestamp: float):
+        self.hits += 1
+        self.class_votes[class_name] = self.class_votes.get(class_name, 0.0) + confidence
+        self.confidence_sum += confidence
+        self.confidence = confidence
+        self.last_seen = timestamp
+
+class MultiObjectTracker:
+    """单个摄像头（单个检测模型）的多目标跟踪器
+
+    卡尔曼状态为(中心x, 中心y, 宽, 高)及其速度（像素/秒），按实际时间间隔外推，
+    检测器帧率变化或丢帧时轨迹速度不变。所有轨迹的均值和协方差保存在数组中，外推和更新一次完成。
+    update()在检测帧调用，按时间顺序推进滤波状态，时间早于当前状态的调用按当前时间处理；
+    predict()在中间帧调用，只从最近一次检测修正后的状态外推位置，不改变滤波状态，
+    抓帧线程在检测帧还在排队时外推也不会影响之后的关联。两者线程安全。
+    """
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None):
+        self.options = dict(TRACKER_DEFAULTS)
+        self.options.update(options or {})
+        self.tracks: List[Track] = []
+        self.means = np.zeros((0, 8))
+        self.covariances = np.zeros((0, 8, 8))
+        self.time: Optional[float] = None
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+        self.tracks_created = 0
+        self.tracks_finished = 0
+
+    def _predict(self, timestamp: float):
+        """把全部轨迹外推到timestamp"""
+        if self.time is None:
+            self.time = timestamp
+            return
+        dt = timestamp - self.time
+        if dt <= 0:
+            return
+        self.time = timestamp
+        if not self.tracks:
+            return
+
+        transition = np.eye(8)
+        transition[:4, 4:] = np.eye(4) * dt
+        heights = np.maximum(self.means[:, 3], 1.0)
+        std = np.concatenate([np.repeat((_STD_PROCESS_POSITION * heights)[:, None], 4, axis=1),
+                              np.repeat((_STD_PROCESS_VELOCITY * heights)[:, None], 4, axis=1)], axis=1) * np.sqrt(dt)
+        self.means = self.means @ transition.T
+        self.covariances = transition @ self.covariances @ transition.T
+        self.covariances[:, np.arange(8), np.arange(8)] += std ** 2
+
+    def _correct(self, indices: np.ndarray, measurements: np.ndarray):
+        """用检测框修正选定轨迹的卡尔曼状态"""
+        means = self.means[indices]
+        covariances = self.covariances[indices]
+        heights = np.maximum(measurements[:, 3], 1.0)
+        noise = np.zeros((len(indices), 4, 4))
+        noise[:, np.arange(4), np.arange(4)] = np.repeat((_STD_MEASUREMENT * heights)[:, None], 4, axis=1) ** 2
+
+        projected = covariances[:, :4, :4] + noise
+        cross = covariances[:, :, :4]
+        # K = P Hᵀ S⁻¹，S对称，解 S Kᵀ = (P Hᵀ)ᵀ
+        gain = np.linalg.solve(projected, cross.transpose(0, 2, 1)).transpose(0, 2, 1)
+        innovation = measurements - means[:, :4]
+        self.means[indices] = means + np.einsum('nij,nj->ni', gain, innovation)
+        self.covariances[indices] = covariances - gain @ _MEASUREMENT @ covariances
+
+    def _new_tracks(self, boxes: np.ndarray, confidences: np.ndarray, classes: List[str], timestamp: float):
+        measurements = _xyxy_to_state(boxes)
+        heights = np.maximum(measurements[:, 3], 1.0)
+        means = np.hstack([measurements, np.zeros((len(boxes), 4))])
+        std = np.concatenate([np.repeat((2 * _STD_MEASUREMENT * heights)[:, None], 4, axis=1),
+                              np.repeat((_STD_INITIAL_VELOCITY * heights)[:, None], 4, axis=1)], axis=1)
+        covariances = np.zeros((len(boxes), 8, 8))
+        covariances[:, np.arange(8), np.arange(8)] = std ** 2
+
+        self.means = np.vstack([self.means, means])
+        self.covariances = np.concatenate([self.covariances, covariances])
+        for confidence, class_name in zip(confidences.tolist(), classes):
+            self.tracks.append(Track(self._next_id, class_name, confidence, timestamp))
+            self._next_id += 1
+            self.tracks_created += 1
+
+    def _remove(self, keep: np.ndarray) -> List[Track]:
+        """删除keep为False的轨迹，返回被删除的轨迹"""
+        removed = [track for track, kept in zip(self.tracks, keep) if not kept]
+        self.tracks = [track for track, kept in zip(self.tracks, keep) if kept]
+        self.means = self.means[keep]
+        self.covariances = self.covariances[keep]
+        return removed
+
+    def _record_path(self, timestamp: float):
+        boxes = _state_to_xyxy(self.means)
+        for track, box in zip(self.tracks, boxes.tolist()):
+            track.path.append((timestamp, (box[0] + box[2]) / 2, (box[1] + box[3]) / 2))
+
+    def update(self, predictions: List[Dict[str, Any]], timestamp: Optional[float] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """用一帧的检测结果更新轨迹
+
+        Args:
+            predictions: 检测结果字典列表（class / confidence / bbox为xyxy像素坐标）
+            timestamp: 帧时间（秒），默认当前时间
+
+        Returns:
+            (带trackId的检测结果, 本次结束的轨迹汇总)；未确认的新轨迹上的检测框不带trackId
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        options = self.options
+        boxes = np.array([p['bbox'] for p in predictions], dtype=np.float64).reshape(-1, 4)
+        confidences = np.array([p.get('confidence', 0.0) for p in predictions], dtype=np.float64)
+        classes = [str(p.get('class')) for p in predictions]
+
+        with self._lock:
+            self._predict(timestamp)
+            timestamp = self.time
+            assigned = np.full(len(predictions), -1)
+            matched_tracks = np.zeros(len(self.tracks), dtype=bool)
+
+            track_boxes = _state_to_xyxy(self.means)
+            iou = box_iou(track_boxes, boxes).astype(np.float64)
+            states = np.array([track.state for track in self.tracks])
+            tentative = states == TENTATIVE
+            if tentative.any() and len(boxes) and options['track_buffer'] > 0:
+                iou[tentative] = box_iou(_buffered(track_boxes[tentative], options['track_buffer']),
+                                         _buffered(boxes, options['track_buffer']))
+            high = confidences >= options['track_high_threshold']
+            low = (confidences >= options['track_low_threshold']) & ~high
+
+            # 第一轮：已确认和丢失中的轨迹 <-> 高置信度检测框
+            # 第二轮：仍未匹配的已确认轨迹 <-> 低置信度检测框（被遮挡、模糊的目标），阈值更严格
+            # 第三轮：新轨迹 <-> 剩余高置信度检测框（扩展框IoU）
+            rounds = (
+                (np.isin(states, (CONFIRMED, LOST)), high, options['track_match_iou']),
+                (states == CONFIRMED, low, 0.5),
+                (tentative, high, options['track_match_iou'])
+            )
+            for track_mask, detection_mask, threshold in rounds:
+                rows = np.nonzero(track_mask & ~matched_tracks)[0]
+                cols = np.nonzero(detection_mask & (assigned < 0))[0]
+                if not len(rows) or not len(cols):
+                    continue
+                for row, col in _greedy_match(iou[np.ix_(rows, cols)], threshold):
+                    matched_tracks[rows[row]] = True
+                    assigned[cols[col]] = rows[row]
+
+            detected = np.nonzero(assigned >= 0)[0]
+            if len(detected):
+                self._correct(assigned[detected], _xyxy_to_state(boxes[detected]))
+                for index in detected.tolist():
+                    track = self.tracks[assigned[index]]
+                    track.observe(classes[index], float(confidences[index]), timestamp)
+                    if track.state == LOST or (track.state == TENTATIVE and track.hits >= options['track_min_hits']):
+                        track.state = CONFIRMED
+
+            results = []
+            for index, prediction in enumerate(predictions):
+                result = dict(prediction)
+                if assigned[index] >= 0 and self.tracks[assigned[index]].state == CONFIRMED:
+                    result['trackId'] = self.tracks[assigned[index]].track_id
+                results.append(result)
+
+            # 未匹配的轨迹：新轨迹直接丢弃，已确认的标记为丢失，丢失超时的结束
+            keep = np.ones(len(self.tracks), dtype=bool)
+            for index, track in enumerate(self.tracks):
+                if matched_tracks[index]:
+                    continue
+                if track.state == TENTATIVE:
+                    keep[index] = False
+                else:
+                    track.state = LOST
+                    if timestamp - track.last_seen > options['track_max_lost_seconds']:
+                        keep[index] = False
+            finished = [self._summary(track) for track in self._remove(keep) if track.state != TENTATIVE]
+            self.tracks_finished += len(finished)
+
+            # 未匹配的高置信度检测框建立新轨迹
+            new = np.nonzero((assigned < 0) & (confidences >= options['track_new_threshold']))[0]
+            if len(new):
+                self._new_tracks(boxes[new], confidences[new], [classes[i] for i in new.tolist()], timestamp)
+            self._record_path(timestamp)
+
+        return results, finished
+
+    def predict(self, timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """中间帧：返回已确认轨迹外推到timestamp的位置（只读）"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            dt = max(0.0, timestamp - self.time) if self.time is not None else 0.0
+            means = self.means.copy()
+            means[:, :4] += means[:, 4:] * dt
+            return self._active_tracks(means)
+
+    def get_tracks(self) -> List[Dict[str, Any]]:
+        """已确认轨迹在最近一次检测时的状态"""
+        with self._lock:
+            return self._active_tracks(self.means)
+
+    def _active_tracks(self, means: np.ndarray) -> List[Dict[str, Any]]:
+        boxes = _state_to_xyxy(means).tolist()
+        velocities = means[:, 4:6].tolist()
+        return [
+            {
+                'trackId': track.track_id,
+                'class': track.class_name,
+                'confidence': track.confidence,
+                'bbox': box,
+                'velocity': velocity,
+                # 位置由卡尔曼模型外推（中间帧，或最近一次检测没有匹配的检测框）
+                'predicted': means is not self.means or track.last_seen != self.time,
+                'state': track.state
+            }
+            for track, box, velocity in zip(self.tracks, boxes, velocities)
+            if track.state != TENTATIVE
+        ]
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """结束全部轨迹（摄像头停止时），返回已确认轨迹的汇总"""
+        with self._lock:
+            finished = [self._summary(track) for track in self.tracks if track.state != TENTATIVE]
+            self.tracks_finished += len(finished)
+            self._remove(np.zeros(len(self.tracks), dtype=bool))
+            return finished
+
+    def _summary(self, track: Track) -> Dict[str, Any]:
+        """轨迹汇总：类别、平均置信度、首末出现时间和轨迹点（中心像素坐标）"""
+        return {
+            'trackId': track.track_id,
+            'class': track.class_name,
+            'confidence': track.confidence_sum / track.hits,
+            'hits': track.hits,
+            'firstSeen': track.first_seen,
+            'lastSeen': track.last_seen,
+            # 只保留到最后一次检测为止的轨迹点，丢失后的外推位置不可靠
+            'path': [point for point in track.path if point[0] <= track.last_seen]
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        states = [track.state for track in self.tracks]
+        return {
+            'active': states.count(CONFIRMED),
+            'lost': states.count(LOST),
+            'tentative': states.count(TENTATIVE),
+            'created': self.tracks_created,
+            'finished': self.tracks_finished
+        }
+
+class TrackerRegistry:
+    """按(摄像头, 模型)管理跟踪器
+
+    摄像头的流停止后（remove_camera）不再为其新建跟踪器，直到流重新启动（open_camera）；
+    停止前已排队或正在推理的帧到达时，get返回None，不会重新建出无人结束的跟踪器。
+    """
+
+    def __init__(self):
+        self.trackers: Dict[Tuple[str, str], MultiObjectTracker] = {}
+        self.stopped_cameras: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def open_camera(self, camera_id: str):
+        """摄像头的流（重新）启动，允许新建跟踪器"""
+        with self._lock:
+            self.stopped_cameras.discard(camera_id)
+
+    def get(self, camera_id: str, model_id: str,
+            options: Optional[Dict[str, Any]] = None) -> Optional[MultiObjectTracker]:
+        """获取跟踪器，不存在时新建；摄像头的流已停止时返回None"""
+        key = (camera_id, model_id)
+        with self._lock:
+            tracker = self.trackers.get(key)
+            if tracker is None:
+                if camera_id in self.stopped_cameras:
+                    return None
+                tracker = self.trackers[key] = MultiObjectTracker(options)
+            return tracker
+
+    def camera_trackers(self, camera_id: str) -> Dict[str, MultiObjectTracker]:
+        with self._lock:
+            return {model_id: tracker for (camera, model_id), tracker in self.trackers.items() if camera == camera_id}
+
+    def predict(self, camera_id: str, timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """外推摄像头全部跟踪器的轨迹（中间帧）"""
+        tracks = []
+        for model_id, tracker in self.camera_trackers(camera_id).items():
+            for track in tracker.predict(timestamp):
+                track['modelId'] = model_id
+                tracks.append(track)
+        return tracks
+
+    def remove_camera(self, camera_id: str) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """流停止时移除摄像头的跟踪器，返回[(模型ID, 结束的轨迹汇总)]"""
+        with self._lock:
+            self.stopped_cameras.add(camera_id)
+            keys = [key for key in self.trackers if key[0] == camera_id]
+            trackers = [(key[1], self.trackers.pop(key)) for key in keys]
+        return [(model_id, tracker.flush()) for model_id, tracker in trackers]
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            items = list(self.trackers.items())
+        stats: Dict[str, Dict[str, Any]] = {}
+        for (camera_id, model_id), tracker in items:
+            stats.setdefault(camera_id, {})[model_id] = tracker.get_stats()
+        return stats
+
+# 全局跟踪器注册表实例
+tracker_registry = TrackerRegistry()
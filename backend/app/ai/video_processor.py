@@ -2,68 +2,106 @@
 视频处理器
 """
 
-import cv2
+import os
 import numpy as np
 import logging
 import threading
 import time
-from typing import Callable, Optional, Dict, Any
+from concurrent.futures import Future
+from typing import Callable, Optional, Dict, Any, List
 from app.ai.model_manager import model_manager
+from app.ai.inference_scheduler import inference_scheduler
+from app.ai.metrics import pipeline_metrics
+from app.ai.frame_grabber import LatestFrameGrabber, grabber_registry
+from app.ai.shm_decoder import DecodeWorkerPool
+from app.ai.motion_gate import MotionGate
+from app.ai.roi import RegionOfInterest
+from app.ai.tiling import tiling_options
+from app.ai.tracker import tracker_registry, tracker_options
+from app.ai.ffmpeg_capture import FFmpegCapture, decode_size
+from app.ai.synthetic_source import is_test_source, open_test_source
+from app.ai.stream_supervisor import StreamSupervisor, stream_supervisor, STATE_RUNNING
 from app.models.camera import Camera
 from app.models.ai_model import AIModel
+from app.ai.model_registry import model_registry
 
 logger = logging.getLogger(__name__)
 
+# 默认采集后端：opencv 或 ffmpeg，可被摄像头analysis_config的capture_backend覆盖
+CAPTURE_BACKEND = os.environ.get('CAPTURE_BACKEND', 'opencv')
+
+# 运动门控默认参数，可被摄像头analysis_config覆盖
+MOTION_GATE_DEFAULTS = {
+    'motion_threshold': float(os.environ.get('MOTION_GATE_THRESHOLD', 0.005)),
+    'motion_max_skip_seconds': float(os.environ.get('MOTION_GATE_MAX_SKIP_SECONDS', 10))
+}
+
 class VideoProcessor:
     """视频处理器"""
     
-    def __init__(self):
-        self.active_processors = {}
-        self.stop_events = {}
+    def __init__(self, decode_workers: int = 0, supervisor: Optional[StreamSupervisor] = None,
+                 model_provider: Optional[Callable[[], List[AIModel]]] = None,
+                 variant_selector: Optional[Callable[[str], str]] = None):
+        self.supervisor = supervisor or stream_supervisor
+        # 提供当前参与分析的检测模型，默认使用模型注册表缓存的活跃检测模型快照（不逐帧查库）
+        self.model_provider = model_provider or model_registry.get_detection_models
+        # 原模型ID -> 实际执行推理的模型ID（选中的低精度版本）
+        self.variant_selector = variant_selector or model_registry.select_variant
+        self.grabbers: Dict[str, Any] = {}
+        self.motion_gates: Dict[str, MotionGate] = {}
+        # decode_workers>0时摄像头解码分摊到多个子进程，经共享内存传帧
+        self.decode_pool = DecodeWorkerPool(decode_workers) if decode_workers > 0 else None
     
-    def start_processing(self, camera_id: str, callback: Optional[Callable] = None):
-        """开始处理视频流"""
+    def start_processing(self, camera_id: str, callback: Optional[Callable] = None,
+                         track_callback: Optional[Callable] = None):
+        """开始处理视频流（由监管器负责断线重连和并发上限）
+        
+        callback(camera_id, frame, predictions)在有检测结果时调用；开启跟踪时检测结果带trackId，
+        track_callback(camera_id, model_id, tracks)在轨迹结束（丢失超时或流停止）时调用。
+        """
         try:
             camera = Camera.query.get(camera_id)
             if not camera:
                 logger.error(f'摄像头不存在: {camera_id}')
                 return False
             
-            if camera_id in self.active_processors:
+            if self.supervisor.is_registered(camera_id):
                 logger.warning(f'摄像头 {camera_id} 已在处理中')
                 return True
             
-            # 创建停止事件
-            self.stop_events[camera_id] = threading.Event()
-            
-            # 启动处理线程
-            thread = threading.Thread(
-                target=self._process_video_stream,
-                args=(camera_id, camera.stream_url, camera.stream_type, callback)
+            self.start_stream(
+                camera_id, camera.stream_url, camera.stream_type, callback,
+                resolution=(camera.resolution_width, camera.resolution_height),
+                analysis_config=camera.get_analysis_config(),
+                roi=RegionOfInterest.from_polygons(camera.get_roi_polygons()),
+                track_callback=track_callback
             )
-            thread.daemon = True
-            thread.start()
-            
-            self.active_processors[camera_id] = thread
-            logger.info(f'开始处理摄像头 {camera_id} 的视频流')
             return True
             
         except Exception as e:
             logger.error(f'启动视频处理失败: {str(e)}')
             return False
     
+    def start_stream(self, camera_id: str, stream_url: str, stream_type: str, callback: Optional[Callable] = None,
+                     resolution: Optional[tuple] = None, analysis_config: Optional[Dict[str, Any]] = None,
+                     roi: Optional[RegionOfInterest] = None, track_callback: Optional[Callable] = None) -> bool:
+        """按给定参数登记流水线（不查询数据库），已在处理中时返回False"""
+        registered = self.supervisor.register(
+            camera_id,
+            lambda stop_event: self._process_video_stream(
+                camera_id, stream_url, stream_type, callback, resolution, analysis_config, stop_event, roi,
+                track_callback
+            )
+        )
+        if registered:
+            logger.info(f'开始处理摄像头 {camera_id} 的视频流')
+        return registered
+    
     def stop_processing(self, camera_id: str):
         """停止处理视频流"""
         try:
-            if camera_id in self.stop_events:
-                self.stop_events[camera_id].set()
-            
-            if camera_id in self.active_processors:
-                self.active_processors[camera_id].join(timeout=5)
-                del self.active_processors[camera_id]
-            
-            if camera_id in self.stop_events:
-                del self.stop_events[camera_id]
+            self.supervisor.unregister(camera_id)
+            pipeline_metrics.remove(camera_id)
             
             logger.info(f'停止处理摄像头 {camera_id} 的视频流')
             return True
@@ -72,63 +110,185 @@ class VideoProcessor:
             logger.error(f'停止视频处理失败: {str(e)}')
             return False
     
-    def _process_video_stream(self, camera_id: str, stream_url: str, stream_type: str, callback: Optional[Callable]):
-        """处理视频流"""
+    def _create_frame_source(self, camera_id: str, stream_url: str, resolution: Optional[tuple],
+                             analysis_config: Optional[Dict[str, Any]] = None):
+        """创建帧源：进程内抓帧线程（OpenCV或FFmpeg管道解码），或解码进程池的共享内存帧源"""
+        config = analysis_config or {}
+        if is_test_source(stream_url):
+            # 合成视频或循环播放的本地文件，用于基准测试
+            return LatestFrameGrabber(camera_id, stream_url, capture_factory=open_test_source)
+        if config.get('hls_output'):
+            # 合并采集：同一个FFmpeg进程既输出HLS又输出分析用的原始帧
+            width, height = decode_size(config, resolution)
+            fps = config.get('decode_fps')
+            return LatestFrameGrabber(
+                camera_id, stream_url,
+                capture_factory=lambda url: self._open_combined_capture(camera_id, url, width, height, fps)
+            )
+        if config.get('capture_backend', CAPTURE_BACKEND) == 'ffmpeg':
+            # FFmpeg解码时直接缩放、抽帧
+            width, height = decode_size(config, resolution)
+            fps = config.get('decode_fps')
+            return LatestFrameGrabber(
+                camera_id, stream_url,
+                capture_factory=lambda url: FFmpegCapture(url, width, height, fps)
+            )
+        if self.decode_pool is not None and resolution:
+            width, height = resolution
+            return self.decode_pool.open(camera_id, stream_url, width, height)
+        return LatestFrameGrabber(camera_id, stream_url)
+    
+    def _open_combined_capture(self, camera_id: str, stream_url: str, width: int, height: int,
+                               fps: Optional[float]) -> FFmpegCapture:
+        """打开合并采集进程，并登记到流转换器以便HLS状态查询和停止"""
+        from core.stream_converter import stream_converter
+        
+        # 已有单独的HLS转换时由合并进程接管，避免重复拉流
+        if camera_id in stream_converter.active_conversions:
+            stream_converter.stop_conversion(camera_id)
+        
+        capture = FFmpegCapture(
+            stream_url, width, height, fps,
+            extra_outputs=stream_converter.hls_output_args(camera_id),
+            on_release=lambda process: stream_converter.release_process(camera_id, process)
+        )
+        if capture.process is not None:
+            stream_converter.register_process(camera_id, capture.process, stream_url, mode='combined')
+        return capture
+    
+    def _process_video_stream(self, camera_id: str, stream_url: str, stream_type: str, callback: Optional[Callable],
+                              resolution: Optional[tuple] = None, analysis_config: Optional[Dict[str, Any]] = None,
+                              stop_event: Optional[threading.Event] = None, roi: Optional[RegionOfInterest] = None,
+                              track_callback: Optional[Callable] = None):
+        """处理视频流，流结束或出错时返回/抛出，由监管器决定是否重连"""
+        grabber = None
         try:
-            # 创建视频捕获器
-            cap = cv2.VideoCapture(stream_url)
-            if not cap.isOpened():
-                logger.error(f'无法打开视频流: {stream_url}')
-                return
+            # 运动门控：画面无变化时跳过检测
+            motion_gate = MotionGate.from_config(analysis_config, MOTION_GATE_DEFAULTS)
+            self.motion_gates[camera_id] = motion_gate
+            # 高分辨率摄像头可开启切片推理
+            tiling = tiling_options(analysis_config)
+            # 开启跟踪时检测结果关联到轨迹，流（重新）启动后允许新建跟踪器
+            tracking = tracker_options(analysis_config)
+            tracker_registry.open_camera(camera_id)
             
-            frame_count = 0
+            # 独立线程/进程抓帧，分析端只拉取最新帧
+            grabber = self._create_frame_source(camera_id, stream_url, resolution, analysis_config)
+            if not grabber.start():
+                raise RuntimeError(f'无法打开视频流: {stream_url}')
+            self.grabbers[camera_id] = grabber
+            grabber_registry.register(camera_id, grabber)
+            metrics = pipeline_metrics.camera(camera_id)
+            metrics.on_connect()
+            
+            stop_event = stop_event or threading.Event()
+            last_frame_id = 0
             last_analysis_time = 0
-            analysis_interval = 1.0  # 每秒分析一次
+            # 默认每秒分析一次（开启跟踪时每秒detect_fps次），analysis_interval为0时有新帧就分析
+            default_interval = 1.0 / tracking['detect_fps'] if tracking else 1.0
+            analysis_interval = float((analysis_config or {}).get('analysis_interval', default_interval))
             
-            while not self.stop_events.get(camera_id, threading.Event()).is_set():
-                ret, frame = cap.read()
-                if not ret:
-                    logger.warning(f'无法读取帧: {camera_id}')
+            while not stop_event.is_set():
+                # 等到下一次分析时间再取帧
+                wait_time = last_analysis_time + analysis_interval - time.time()
+                if wait_time > 0 and stop_event.wait(wait_time):
                     break
                 
-                frame_count += 1
-                current_time = time.time()
-                
-                # 定期进行AI分析
-                if current_time - last_analysis_time >= analysis_interval:
-                    self._analyze_frame(camera_id, frame, callback)
-                    last_analysis_time = current_time
+                frame_id, frame = grabber.read(after_id=last_frame_id, timeout=max(analysis_interval, 1.0))
+                metrics.update_source(grabber.frames_read, grabber.frames_dropped)
+                if frame is None:
+                    if grabber.ended:
+                        break
+                    continue
                 
-                # 控制帧率
-                time.sleep(0.033)  # 约30fps
+                last_frame_id = frame_id
+                last_analysis_time = time.time()
+                if not motion_gate.should_analyze(frame, last_analysis_time):
+                    metrics.frames_skipped += 1
+                    continue
+                self._analyze_frame(camera_id, frame, callback, grabber.last_read_time, roi, tiling,
+                                    tracking, track_callback)
             
-            cap.release()
             logger.info(f'摄像头 {camera_id} 的视频流处理结束')
             
         except Exception as e:
             logger.error(f'处理视频流失败: {str(e)}')
+            raise
         finally:
-            if camera_id in self.active_processors:
-                del self.active_processors[camera_id]
+            if grabber is not None:
+                grabber_registry.unregister(camera_id, grabber)
+                grabber.stop()
+            self.grabbers.pop(camera_id, None)
+            self.motion_gates.pop(camera_id, None)
+            self._finish_tracks(camera_id, track_callback)
     
-    def _analyze_frame(self, camera_id: str, frame: np.ndarray, callback: Optional[Callable]):
-        """分析视频帧"""
+    def _finish_tracks(self, camera_id: str, track_callback: Optional[Callable]):
+        """流停止时结束摄像头的全部轨迹，交给track_callback"""
         try:
+            for model_id, finished in tracker_registry.remove_camera(camera_id):
+                if finished and track_callback:
+                    track_callback(camera_id, model_id, finished)
+        except Exception as e:
+            logger.error(f'结束摄像头轨迹失败: {camera_id}: {str(e)}')
+    
+    def _analyze_frame(self, camera_id: str, frame: np.ndarray, callback: Optional[Callable],
+                       frame_time: Optional[float] = None, roi: Optional[RegionOfInterest] = None,
+                       tiling: Optional[Dict[str, Any]] = None, tracking: Optional[Dict[str, Any]] = None,
+                       track_callback: Optional[Callable] = None):
+        """分析视频帧，frame_time为帧解码完成的时间，用于统计端到端延迟（开启跟踪时也作为轨迹时间）"""
+        try:
+            metrics = pipeline_metrics.camera(camera_id)
+            
+            # 只把ROI裁剪区域送去推理，检测框再映射回整帧坐标
+            image, offset = roi.apply(frame) if roi else (frame, None)
+            
             # 获取活跃的检测模型
-            detection_models = AIModel.get_detection_models()
+            detection_models = self.model_provider()
             
             all_predictions = []
+            futures = []
             
             for model in detection_models:
-                if not model_manager.is_model_loaded(model.id):
-                    if not model_manager.load_model(model.id):
+                # 选中了低精度版本时只加载和调用该版本，原模型不必留在内存中
+                target_id = self.variant_selector(model.id)
+                if not model_manager.is_model_loaded(target_id):
+                    if not model_manager.load_model(target_id):
                         continue
                 
-                # 执行预测
-                predictions = model_manager.predict(model.id, frame)
-                
+                submit_time = time.time()
+                if tiling:
+                    # 切片本身已组成一个批次，直接交给模型管理器
+                    future = Future()
+                    try:
+                        future.set_result(model_manager.predict_tiled(target_id, image, **tiling))
+                    except Exception as e:
+                        future.set_exception(e)
+                else:
+                    # 提交到调度器，与其他摄像头的帧合并批量推理
+                    future = inference_scheduler.submit(target_id, image, camera_id)
+                futures.append((model.id, submit_time, future))
+            
+            for model_id, submit_time, future in futures:
+                try:
+                    predictions = future.result()
+                except Exception as e:
+                    # 一个模型推理失败不影响其他模型的结果
+                    logger.error(f'模型 {model_id} 推理失败: {str(e)}')
+                    continue
+                metrics.observe_inference(model_id, (time.time() - submit_time) * 1000)
+                if predictions and roi:
+                    predictions = roi.map_predictions(predictions, offset, frame.shape)
+                if tracking:
+                    # 没有检测结果的帧也要更新，丢失超时的轨迹在此结束
+                    tracker = tracker_registry.get(camera_id, model_id, tracking)
+                    if tracker is None:
+                        continue
+                    predictions, finished = tracker.update(predictions or [], frame_time)
+                    if finished and track_callback:
+                        track_callback(camera_id, model_id, finished)
                 if predictions:
                     all_predictions.extend(predictions)
+            metrics.observe_analyzed(frame_time)
             
             # 如果有预测结果，调用回调函数
             if all_predictions and callback:
@@ -138,20 +298,18 @@ class VideoProcessor:
             logger.error(f'分析帧失败: {str(e)}')
     
     def capture_frame(self, camera_id: str) -> Optional[np.ndarray]:
-        """捕获当前帧"""
+        """捕获当前帧（复用正在处理的流水线或快照服务的抓帧句柄）"""
         try:
+            from app.ai.snapshot_service import snapshot_service
+            
+            if grabber_registry.get(camera_id) is not None:
+                return snapshot_service.get_frame(camera_id)
+            
             camera = Camera.query.get(camera_id)
             if not camera:
                 return None
             
-            cap = cv2.VideoCapture(camera.stream_url)
-            if not cap.isOpened():
-                return None
-            
-            ret, frame = cap.read()
-            cap.release()
-            
-            return frame if ret else None
+            return snapshot_service.get_frame(camera_id, camera.stream_url)
             
         except Exception as e:
             logger.error(f'捕获帧失败: {str(e)}')
@@ -159,17 +317,35 @@ class VideoProcessor:
     
     def get_processing_status(self, camera_id: str) -> Dict[str, Any]:
         """获取处理状态"""
-        return {
-            'is_processing': camera_id in self.active_processors,
-            'thread_alive': camera_id in self.active_processors and self.active_processors[camera_id].is_alive()
+        pipeline = self.supervisor.get_pipeline(camera_id)
+        status = {
+            'is_processing': self.supervisor.is_registered(camera_id),
+            'thread_alive': pipeline is not None and pipeline.state == STATE_RUNNING,
+            'pipeline': pipeline.to_dict() if pipeline else None
         }
+        grabber = self.grabbers.get(camera_id)
+        if grabber:
+            status['grabber'] = grabber.get_stats()
+        motion_gate = self.motion_gates.get(camera_id)
+        if motion_gate:
+            status['motion_gate'] = motion_gate.get_stats()
+        trackers = tracker_registry.get_stats().get(camera_id)
+        if trackers:
+            status['tracking'] = trackers
+        metrics = pipeline_metrics.snapshot(camera_id)
+        status['metrics'] = next((m for m in metrics if m['group'] == 'analysis'), None)
+        return status
+    
+    def get_motion_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各摄像头运动门控的跳过比例"""
+        return {camera_id: gate.get_stats() for camera_id, gate in list(self.motion_gates.items())}
     
     def get_all_processing_status(self) -> Dict[str, Dict[str, Any]]:
         """获取所有处理状态"""
         return {
             camera_id: self.get_processing_status(camera_id)
-            for camera_id in self.active_processors.keys()
+            for camera_id in [state['cameraId'] for state in self.supervisor.get_states('analysis')]
         }
 
 # 全局视频处理器实例
-video_processor = VideoProcessor()
+video_processor = VideoProcessor(decode_workers=int(os.environ.get('DECODE_WORKER_PROCESSES', 0)))
@@ -92,13 +92,25 @@ class AIModel(db.Model):
         """设置性能指标"""
         self.performance_metrics = json.dumps(metrics)
     
+    def is_variant(self):
+        """是否为另一个模型的低精度版本（performance_metrics.variant记录了原模型）"""
+        metrics = self.get_performance_metrics()
+        variant = metrics.get('variant') if isinstance(metrics, dict) else None
+        return isinstance(variant, dict) and bool(variant.get('parentId'))
+    
     @classmethod
-    def get_active_models(cls, model_type=None):
-        """获取活跃模型"""
+    def get_active_models(cls, model_type=None, include_variants=False):
+        """获取活跃模型
+        
+        低精度版本与原模型类型相同，但不单独参与分析（由模型注册表替原模型选用），默认不返回
+        """
         query = cls.query.filter_by(is_active=True)
         if model_type:
             query = query.filter_by(model_type=model_type)
-        return query.all()
+        models = query.all()
+        if include_variants:
+            return models
+        return [model for model in models if not model.is_variant()]
     
     @classmethod
     def get_detection_models(cls):
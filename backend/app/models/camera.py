@@ -24,6 +24,8 @@ class Camera(db.Model):
     direction = db.Column(db.Float, default=0)  # 朝向角度
     is_recording = db.Column(db.Boolean, default=False)
     last_heartbeat = db.Column(db.DateTime)
+    analysis_config = db.Column(db.Text)  # JSON格式的分析流水线配置（运动门控阈值等）
+    roi_polygons = db.Column(db.Text)  # JSON格式的感兴趣区域多边形（相对坐标）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -85,10 +87,38 @@ class Camera(db.Model):
             'direction': self.direction,
             'isRecording': self.is_recording,
             'lastHeartbeat': self.last_heartbeat.isoformat() if self.last_heartbeat else None,
+            'analysisConfig': self.get_analysis_config(),
+            'roiPolygons': self.get_roi_polygons(),
             'createdAt': self.created_at.isoformat(),
             'updatedAt': self.updated_at.isoformat()
         }
     
+    def get_analysis_config(self):
+        """获取分析流水线配置"""
+        if self.analysis_config:
+            try:
+                return json.loads(self.analysis_config)
+            except:
+                return {}
+        return {}
+    
+    def set_analysis_config(self, config):
+        """设置分析流水线配置"""
+        self.analysis_config = json.dumps(config)
+    
+    def get_roi_polygons(self):
+        """获取感兴趣区域多边形"""
+        if self.roi_polygons:
+            try:
+                return json.loads(self.roi_polygons)
+            except:
+                return []
+        return []
+    
+    def set_roi_polygons(self, polygons):
+        """设置感兴趣区域多边形"""
+        self.roi_polygons = json.dumps(polygons or [])
+    
     def update_heartbeat(self):
         """更新心跳时间"""
         self.last_heartbeat = datetime.utcnow()
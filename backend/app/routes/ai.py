@@ -2,13 +2,19 @@
 AI模型相关API
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models.ai_model import AIModel, ModelPrediction
 from app.models.camera import Camera
 from app.models.vehicle import Vehicle, VehicleAlert
 from app.models.alert import Alert
+from app.ai.inference_scheduler import inference_scheduler
+from app.ai.model_manager import model_manager
+from app.ai.model_registry import model_registry, ModelSnapshot, variant_info
+from app.ai.batch_analyzer import batch_analyzer, VIDEO_EXTENSIONS
+from app.ai.model_benchmark import ModelBenchmark, benchmark_service, benchmark_summary
+from app.ai.model_variants import VariantBuilder, variant_service, PRECISIONS
 from datetime import datetime
 import logging
 import os
@@ -106,6 +112,7 @@ def create_model():
         
         db.session.add(model)
         db.session.commit()
+        model_registry.refresh()
         
         return jsonify({
             'message': 'AI模型创建成功',
@@ -155,10 +162,14 @@ def update_model(model_id):
         
         model.updated_at = datetime.utcnow()
         db.session.commit()
+        # 同步分析线程使用的模型缓存，已加载的模型按新记录推理
+        model_registry.refresh()
+        model_manager.update_model_info(ModelSnapshot.from_model(model))
         
         return jsonify({
             'message': 'AI模型更新成功',
-            'model': model.to_dict()
+            'model': model.to_dict(),
+            'swap': model_manager.get_swap_status(model_id)
         }), 200
         
     except Exception as e:
@@ -181,16 +192,181 @@ def activate_model(model_id):
         model.is_active = True
         model.updated_at = datetime.utcnow()
         db.session.commit()
+        model_registry.refresh()
+        # 已加载的模型只在模型文件或框架变化时后台加载并预热新版本，在批次之间切换，运行中的分析不中断；
+        # 未加载的模型在首次推理时加载
+        model_manager.update_model_info(ModelSnapshot.from_model(model))
         
         return jsonify({
             'message': '模型激活成功',
-            'model': model.to_dict()
+            'model': model.to_dict(),
+            'swap': model_manager.get_swap_status(model_id)
         }), 200
         
     except Exception as e:
         logger.error(f'激活模型失败: {str(e)}')
         return jsonify({'error': '激活模型失败'}), 500
 
+@ai_bp.route('/models/<model_id>/rollback', methods=['POST'])
+@jwt_required()
+def rollback_model(model_id):
+    """回滚到热切换前的模型版本（旧版本在宽限期内仍在内存中，立即生效）"""
+    try:
+        model = AIModel.query.get(model_id)
+        if not model:
+            return jsonify({'error': '模型不存在'}), 404
+        
+        previous = model_manager.rollback_model(model_id)
+        if previous is None:
+            return jsonify({'error': '没有可回滚的版本'}), 409
+        
+        # 数据库记录同步为回滚后的版本
+        model.model_path = previous.model_path
+        model.framework = previous.framework
+        model.config_path = previous.config_path
+        model.version = previous.version
+        model.input_size = previous.input_size
+        model.classes = previous.classes
+        model.updated_at = datetime.utcnow()
+        db.session.commit()
+        model_registry.refresh()
+        
+        return jsonify({
+            'message': '模型已回滚',
+            'model': model.to_dict(),
+            'swap': model_manager.get_swap_status(model_id)
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'回滚模型失败: {str(e)}')
+        return jsonify({'error': '回滚模型失败'}), 500
+
+@ai_bp.route('/models/<model_id>/benchmark', methods=['POST'])
+@jwt_required()
+def benchmark_model(model_id):
+    """在本机后台运行模型基准测试，结果写入模型的performanceMetrics.benchmark"""
+    try:
+        model = AIModel.query.get(model_id)
+        if not model:
+            return jsonify({'error': '模型不存在'}), 404
+        if not os.path.exists(model.model_path):
+            return jsonify({'error': '模型文件不存在'}), 400
+        
+        data = request.get_json(silent=True) or {}
+        for key in ('batchSizes', 'threads'):
+            values = data.get(key)
+            if values is not None and (not isinstance(values, list) or
+                                       not all(isinstance(value, int) and value > 0 for value in values)):
+                return jsonify({'error': f'{key}必须是正整数列表'}), 400
+        input_sizes = data.get('inputSizes')
+        if input_sizes is not None and (not isinstance(input_sizes, list) or
+                                        not all(isinstance(size, str) and len(size.split('x')) == 2 and
+                                                all(part.isdigit() for part in size.split('x')) for size in input_sizes)):
+            return jsonify({'error': 'inputSizes必须是形如640x640的尺寸列表'}), 400
+        iterations = data.get('iterations', 30)
+        if not isinstance(iterations, int) or iterations < 1:
+            return jsonify({'error': 'iterations必须是正整数'}), 400
+        
+        benchmark = ModelBenchmark(
+            batch_sizes=data.get('batchSizes'),
+            input_sizes=input_sizes,
+            thread_counts=data.get('threads'),
+            iterations=iterations
+        )
+        if not benchmark_service.start(current_app._get_current_object(), model_id, benchmark):
+            return jsonify({'error': '已有基准测试正在进行'}), 409
+        
+        return jsonify({
+            'message': '基准测试已开始',
+            'status': benchmark_service.status.get(model_id)
+        }), 202
+        
+    except Exception as e:
+        logger.error(f'启动基准测试失败: {str(e)}')
+        return jsonify({'error': '启动基准测试失败'}), 500
+
+@ai_bp.route('/models/<model_id>/benchmark', methods=['GET'])
+@jwt_required()
+def get_model_benchmark(model_id):
+    """获取基准测试进度和最近一次结果"""
+    try:
+        model = AIModel.query.get(model_id)
+        if not model:
+            return jsonify({'error': '模型不存在'}), 404
+        
+        return jsonify({
+            'status': benchmark_service.status.get(model_id),
+            'benchmark': (model.get_performance_metrics() or {}).get('benchmark')
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取基准测试结果失败: {str(e)}')
+        return jsonify({'error': '获取基准测试结果失败'}), 500
+
+@ai_bp.route('/models/<model_id>/variants', methods=['POST'])
+@jwt_required()
+def create_model_variants(model_id):
+    """后台生成模型的低精度版本（ONNX导出、FP16、INT8动态/静态量化），评估精度后登记为关联版本"""
+    try:
+        model = AIModel.query.get(model_id)
+        if not model:
+            return jsonify({'error': '模型不存在'}), 404
+        if variant_info(model):
+            return jsonify({'error': '不能从低精度版本再生成版本'}), 400
+        if not os.path.exists(model.model_path):
+            return jsonify({'error': '模型文件不存在'}), 400
+        
+        data = request.get_json(silent=True) or {}
+        precisions = data.get('precisions')
+        if precisions is not None and (not isinstance(precisions, list) or
+                                       not all(precision in PRECISIONS for precision in precisions)):
+            return jsonify({'error': f'precisions必须是以下取值的列表: {", ".join(PRECISIONS)}'}), 400
+        calibration_frames = data.get('calibrationFrames', 64)
+        if not isinstance(calibration_frames, int) or calibration_frames < 1:
+            return jsonify({'error': 'calibrationFrames必须是正整数'}), 400
+        
+        builder = VariantBuilder(
+            precisions=precisions,
+            validation_dir=data.get('validationDir'),
+            calibration_frames=calibration_frames,
+            calibration_dir=data.get('calibrationDir')
+        )
+        if not variant_service.start(current_app._get_current_object(), model_id, builder):
+            return jsonify({'error': '已有模型版本生成任务正在进行'}), 409
+        
+        return jsonify({
+            'message': '模型版本生成已开始',
+            'status': variant_service.status.get(model_id)
+        }), 202
+        
+    except Exception as e:
+        logger.error(f'启动模型版本生成失败: {str(e)}')
+        return jsonify({'error': '启动模型版本生成失败'}), 500
+
+@ai_bp.route('/models/<model_id>/variants', methods=['GET'])
+@jwt_required()
+def get_model_variants(model_id):
+    """获取模型的低精度版本、生成进度，以及调度器当前选用的版本"""
+    try:
+        model = AIModel.query.get(model_id)
+        if not model:
+            return jsonify({'error': '模型不存在'}), 404
+        
+        variants = [
+            candidate.to_dict() for candidate in AIModel.query.filter_by(framework='onnx').all()
+            if (variant_info(candidate) or {}).get('parentId') == model_id
+        ]
+        
+        return jsonify({
+            'variants': variants,
+            'selected': model_registry.select_variant(model_id),
+            'status': variant_service.status.get(model_id)
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取模型版本失败: {str(e)}')
+        return jsonify({'error': '获取模型版本失败'}), 500
+
 @ai_bp.route('/models/<model_id>/deactivate', methods=['POST'])
 @jwt_required()
 def deactivate_model(model_id):
@@ -203,6 +379,8 @@ def deactivate_model(model_id):
         model.is_active = False
         model.updated_at = datetime.utcnow()
         db.session.commit()
+        model_registry.refresh()
+        model_manager.unload_model(model_id)
         
         return jsonify({
             'message': '模型停用成功',
@@ -213,6 +391,42 @@ def deactivate_model(model_id):
         logger.error(f'停用模型失败: {str(e)}')
         return jsonify({'error': '停用模型失败'}), 500
 
+@ai_bp.route('/models/<model_id>/pin', methods=['POST'])
+@jwt_required()
+def pin_model(model_id):
+    """固定模型，使其常驻内存不被淘汰"""
+    try:
+        model = AIModel.query.get(model_id)
+        if not model:
+            return jsonify({'error': '模型不存在'}), 404
+        
+        model_manager.pin_model(model_id)
+        
+        return jsonify({
+            'message': '模型已固定',
+            'modelId': model_id
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'固定模型失败: {str(e)}')
+        return jsonify({'error': '固定模型失败'}), 500
+
+@ai_bp.route('/models/<model_id>/unpin', methods=['POST'])
+@jwt_required()
+def unpin_model(model_id):
+    """取消固定模型"""
+    try:
+        model_manager.unpin_model(model_id)
+        
+        return jsonify({
+            'message': '已取消固定',
+            'modelId': model_id
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'取消固定模型失败: {str(e)}')
+        return jsonify({'error': '取消固定模型失败'}), 500
+
 @ai_bp.route('/predict', methods=['POST'])
 @jwt_required()
 def predict():
@@ -409,15 +623,210 @@ def get_ai_stats():
             db.func.avg(ModelPrediction.processing_time)
         ).scalar() or 0
         
+        # 活跃模型在本机的基准测试结果（未测试的模型为None）
+        benchmarks = {
+            model.id: benchmark_summary(model.get_performance_metrics())
+            for model in AIModel.query.filter_by(is_active=True).all()
+        }
+        
         return jsonify({
             'totalModels': total_models,
             'activeModels': active_models,
             'typeStats': dict(type_stats),
             'frameworkStats': dict(framework_stats),
             'recentPredictions': recent_predictions,
-            'avgProcessingTime': round(avg_processing_time, 3)
+            'avgProcessingTime': round(avg_processing_time, 3),
+            'benchmarks': benchmarks
         }), 200
         
     except Exception as e:
         logger.error(f'获取AI统计失败: {str(e)}')
         return jsonify({'error': '获取AI统计失败'}), 500
+
+@ai_bp.route('/scheduler/stats', methods=['GET'])
+@jwt_required()
+def get_scheduler_stats():
+    """获取推理调度器统计（批大小、排队等待直方图）"""
+    try:
+        return jsonify({
+            'batchWindowMs': inference_scheduler.batch_window * 1000,
+            'maxBatchSize': inference_scheduler.max_batch_size,
+            'models': inference_scheduler.get_stats()
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取推理调度器统计失败: {str(e)}')
+        return jsonify({'error': '获取推理调度器统计失败'}), 500
+
+@ai_bp.route('/model-cache/stats', methods=['GET'])
+@jwt_required()
+def get_model_cache_stats():
+    """获取模型缓存的内存占用、命中/未命中/淘汰计数"""
+    try:
+        stats = model_manager.get_cache_stats()
+        stats['registry'] = model_registry.get_stats()
+        return jsonify(stats), 200
+        
+    except Exception as e:
+        logger.error(f'获取模型缓存统计失败: {str(e)}')
+        return jsonify({'error': '获取模型缓存统计失败'}), 500
+
+@ai_bp.route('/model-cache/warmup', methods=['POST'])
+@jwt_required()
+def warmup_models():
+    """后台预热模型（默认预热所有固定模型），进度见模型缓存统计"""
+    try:
+        data = request.get_json(silent=True) or {}
+        model_ids = data.get('modelIds')
+        if model_ids is not None and not isinstance(model_ids, list):
+            return jsonify({'error': 'modelIds必须是列表'}), 400
+        runs = data.get('runs')
+        if runs is not None and (not isinstance(runs, int) or runs < 1):
+            return jsonify({'error': 'runs必须是正整数'}), 400
+        
+        if not model_manager.start_warmup(current_app._get_current_object(), model_ids, runs):
+            return jsonify({'error': '模型预热正在进行'}), 409
+        
+        return jsonify({
+            'message': '模型预热已开始',
+            'modelIds': model_ids if model_ids is not None else sorted(model_manager.pinned)
+        }), 202
+        
+    except Exception as e:
+        logger.error(f'启动模型预热失败: {str(e)}')
+        return jsonify({'error': '启动模型预热失败'}), 500
+
+@ai_bp.route('/batch-analysis', methods=['POST'])
+@jwt_required()
+def create_batch_analysis():
+    """提交录像文件批量分析任务"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        video_file = data.get('videoPath')
+        camera_id = data.get('cameraId')
+        if not all([video_file, camera_id]):
+            return jsonify({'error': '缺少必填参数'}), 400
+        
+        # 只允许分析上传目录内的录像文件
+        upload_dir = os.path.realpath(os.environ.get('UPLOAD_FOLDER', 'uploads'))
+        video_path = os.path.realpath(os.path.join(upload_dir, video_file))
+        if not video_path.startswith(upload_dir + os.sep):
+            return jsonify({'error': '视频路径无效'}), 400
+        if not video_path.lower().endswith(VIDEO_EXTENSIONS):
+            return jsonify({'error': '不支持的视频格式'}), 400
+        if not os.path.exists(video_path):
+            return jsonify({'error': '视频文件不存在'}), 404
+        
+        camera = Camera.query.get(camera_id)
+        if not camera:
+            return jsonify({'error': '摄像头不存在'}), 404
+        
+        # 未指定模型时使用所有活跃的检测模型
+        if data.get('modelIds') is not None:
+            model_ids = data['modelIds']
+            if not isinstance(model_ids, list) or not model_ids or \
+                    not all(isinstance(model_id, str) and model_id for model_id in model_ids):
+                return jsonify({'error': 'modelIds必须是非空的模型ID列表'}), 400
+            model_ids = list(dict.fromkeys(model_ids))
+            found = {model.id for model in AIModel.query.filter(AIModel.id.in_(model_ids)).all()}
+            missing = [model_id for model_id in model_ids if model_id not in found]
+            if missing:
+                return jsonify({'error': f'模型不存在: {", ".join(missing)}'}), 400
+        else:
+            model_ids = [model.id for model in AIModel.get_detection_models()]
+            if not model_ids:
+                return jsonify({'error': '没有可用的检测模型'}), 400
+        
+        options = {}
+        for field, option in (('workers', 'workers'), ('batchSize', 'batch_size')):
+            if data.get(field) is None:
+                continue
+            value = data[field]
+            if isinstance(value, bool) or not isinstance(value, (int, str)):
+                return jsonify({'error': f'{field}必须是正整数'}), 400
+            try:
+                value = int(value)
+            except ValueError:
+                return jsonify({'error': f'{field}必须是正整数'}), 400
+            if value < 1:
+                return jsonify({'error': f'{field}必须是正整数'}), 400
+            options[option] = value
+
+        if data.get('sampleFps') is not None:
+            sample_fps = data['sampleFps']
+            if isinstance(sample_fps, bool) or not isinstance(sample_fps, (int, float, str)):
+                return jsonify({'error': 'sampleFps必须是正数'}), 400
+            try:
+                sample_fps = float(sample_fps)
+            except ValueError:
+                return jsonify({'error': 'sampleFps必须是正数'}), 400
+            if not sample_fps > 0 or sample_fps == float('inf'):
+                return jsonify({'error': 'sampleFps必须是正数'}), 400
+            options['sample_fps'] = sample_fps
+
+        if data.get('startTime'):
+            if not isinstance(data['startTime'], str):
+                return jsonify({'error': 'startTime必须是ISO 8601格式的时间'}), 400
+            try:
+                options['start_time'] = datetime.fromisoformat(data['startTime'].replace('Z', '+00:00'))
+            except ValueError:
+                return jsonify({'error': 'startTime必须是ISO 8601格式的时间'}), 400
+
+        job = batch_analyzer.submit(current_app._get_current_object(), video_path, camera_id, model_ids, **options)
+        
+        return jsonify({
+            'message': '批量分析任务已提交',
+            'job': job.get_status()
+        }), 202
+        
+    except Exception as e:
+        logger.error(f'提交批量分析任务失败: {str(e)}')
+        return jsonify({'error': '提交批量分析任务失败'}), 500
+
+@ai_bp.route('/batch-analysis', methods=['GET'])
+@jwt_required()
+def get_batch_analysis_jobs():
+    """获取批量分析任务列表"""
+    try:
+        return jsonify({
+            'jobs': batch_analyzer.list_jobs()
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取批量分析任务失败: {str(e)}')
+        return jsonify({'error': '获取批量分析任务失败'}), 500
+
+@ai_bp.route('/batch-analysis/<job_id>', methods=['GET'])
+@jwt_required()
+def get_batch_analysis_job(job_id):
+    """获取批量分析任务进度和吞吐量"""
+    try:
+        job = batch_analyzer.get(job_id)
+        if not job:
+            return jsonify({'error': '任务不存在'}), 404
+        
+        return jsonify({
+            'job': job.get_status()
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取批量分析任务失败: {str(e)}')
+        return jsonify({'error': '获取批量分析任务失败'}), 500
+
+@ai_bp.route('/batch-analysis/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_batch_analysis_job(job_id):
+    """取消批量分析任务"""
+    try:
+        if not batch_analyzer.cancel(job_id):
+            return jsonify({'error': '任务不存在或已结束'}), 400
+        
+        return jsonify({
+            'message': '任务已取消',
+            'jobId': job_id
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'取消批量分析任务失败: {str(e)}')
+        return jsonify({'error': '取消批量分析任务失败'}), 500
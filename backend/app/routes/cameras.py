@@ -7,6 +7,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models.camera import Camera
 from app.models.alert import Alert
+from app.ai.roi import RegionOfInterest
 from datetime import datetime
 import logging
 
@@ -97,6 +98,18 @@ def create_camera():
         if 'resolution' in data:
             camera.resolution = data['resolution']
         
+        # 设置分析配置
+        if 'analysisConfig' in data:
+            camera.set_analysis_config(data['analysisConfig'])
+        
+        # 设置感兴趣区域
+        if 'roiPolygons' in data:
+            try:
+                RegionOfInterest.parse(data['roiPolygons'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            camera.set_roi_polygons(data['roiPolygons'])
+        
         db.session.add(camera)
         db.session.commit()
         
@@ -147,6 +160,14 @@ def update_camera(camera_id):
             camera.fps = data['fps']
         if 'direction' in data:
             camera.direction = data['direction']
+        if 'analysisConfig' in data:
+            camera.set_analysis_config(data['analysisConfig'])
+        if 'roiPolygons' in data:
+            try:
+                RegionOfInterest.parse(data['roiPolygons'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            camera.set_roi_polygons(data['roiPolygons'])
         
         camera.updated_at = datetime.utcnow()
         db.session.commit()
@@ -2,27 +2,71 @@
 视频流处理API
 """
 
-from flask import Blueprint, request, jsonify, Response
+from flask import Blueprint, request, jsonify, Response, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models.camera import Camera
-from app.models.ai_model import AIModel, ModelPrediction
-import cv2
+from app.models.ai_model import ModelPrediction
+from app.ai.frame_grabber import LatestFrameGrabber, grabber_registry
+from app.ai.motion_gate import MotionGate
+from app.ai.roi import RegionOfInterest
+from app.ai.video_processor import MOTION_GATE_DEFAULTS
+from app.ai.snapshot_service import snapshot_service
+from app.ai.stream_supervisor import stream_supervisor
+from app.ai.pipeline import StageQueue, PipelineStage, DROP_OLDEST, BLOCK
+from app.ai.metrics import pipeline_metrics
+from app.ai.model_registry import model_registry
+from app.ai.tracker import tracker_registry, tracker_options
 import numpy as np
 import base64
 import io
 from PIL import Image
 import logging
+import math
 import threading
 import time
+import os
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 streams_bp = Blueprint('streams', __name__)
 
-# 全局变量存储活跃的流
+# 全局变量存储活跃的流（线程由流水线监管器统一管理）
 active_streams = {}
-stream_threads = {}
+
+def _on_pipeline_transition(pipeline, old_state, new_state, reason):
+    """同步监管器中流水线的状态"""
+    if pipeline.group != 'stream':
+        return
+    stream_info = active_streams.get(pipeline.camera_id)
+    if stream_info is not None:
+        stream_info['status'] = new_state
+        stream_info['restarts'] = pipeline.restarts
+        stream_info['last_error'] = pipeline.last_error
+
+stream_supervisor.add_listener(_on_pipeline_transition)
+
+# 抓帧线程 -> 帧队列（满时丢同一摄像头的最旧帧）-> 推理 -> 持久化队列（满时阻塞推理）-> 批量写库
+# 数据库变慢只会拖慢持久化和推理，不会阻塞视频读取
+frame_queue = StageQueue(
+    'frames', int(os.environ.get('PIPELINE_FRAME_QUEUE_SIZE', 64)), DROP_OLDEST,
+    key=lambda item: item[0],
+    per_key_maxsize=int(os.environ.get('PIPELINE_FRAME_QUEUE_PER_CAMERA', 4))
+)
+persist_queue = StageQueue(
+    'persist', int(os.environ.get('PIPELINE_PERSIST_QUEUE_SIZE', 256)), BLOCK,
+    block_timeout=float(os.environ.get('PIPELINE_PERSIST_BLOCK_TIMEOUT', 30))
+)
+inference_stage = PipelineStage(
+    'inference', frame_queue, lambda item: analyze_frame(*item), persist_queue,
+    workers=int(os.environ.get('PIPELINE_INFERENCE_WORKERS', 2)),
+    # 同一摄像头的帧按顺序逐帧推理，跟踪器按时间顺序收到检测结果
+    ordered=True
+)
+persist_stage = PipelineStage(
+    'persist', persist_queue, lambda batch: persist_predictions(batch), batch_size=32
+)
 
 @streams_bp.route('/test-connection', methods=['POST'])
 @jwt_required()
@@ -95,24 +139,35 @@ def start_stream(camera_id):
         if not camera:
             return jsonify({'error': '摄像头不存在'}), 404
         
-        if camera_id in active_streams:
+        if stream_supervisor.is_registered(camera_id, group='stream'):
             return jsonify({'message': '流已在运行中'}), 200
         
-        # 启动流处理线程
-        thread = threading.Thread(
-            target=process_stream,
-            args=(camera_id, camera.stream_url, camera.stream_type)
-        )
-        thread.daemon = True
-        thread.start()
-        
-        stream_threads[camera_id] = thread
         active_streams[camera_id] = {
-            'status': 'running',
+            'status': 'queued',
             'start_time': time.time(),
-            'frame_count': 0
+            'frame_count': 0,
+            'dropped_frames': 0,
+            'restarts': 0,
+            'last_error': None,
+            'motion_gate': None
         }
         
+        # 阶段工作线程不在请求中运行，使用当前应用的上下文访问数据库
+        app = current_app._get_current_object()
+        inference_stage.start(app)
+        persist_stage.start(app)
+        
+        # 交给监管器启动，断线后自动退避重连
+        stream_url = camera.stream_url
+        stream_type = camera.stream_type
+        analysis_config = camera.get_analysis_config()
+        roi = RegionOfInterest.from_polygons(camera.get_roi_polygons())
+        stream_supervisor.register(
+            camera_id,
+            lambda stop_event: process_stream(camera_id, stream_url, stream_type, analysis_config, stop_event, roi),
+            group='stream'
+        )
+        
         return jsonify({
             'message': '流处理已启动',
             'cameraId': camera_id
@@ -130,13 +185,9 @@ def stop_stream(camera_id):
         if camera_id not in active_streams:
             return jsonify({'error': '流未运行'}), 400
         
-        # 停止流处理
-        active_streams[camera_id]['status'] = 'stopping'
-        
-        # 等待线程结束
-        if camera_id in stream_threads:
-            stream_threads[camera_id].join(timeout=5)
-            del stream_threads[camera_id]
+        # 停止流处理并等待线程结束
+        stream_supervisor.unregister(camera_id, group='stream')
+        pipeline_metrics.remove(camera_id, group='stream')
         
         del active_streams[camera_id]
         
@@ -165,6 +216,10 @@ def get_stream_status(camera_id):
             'status': stream_info['status'],
             'startTime': stream_info['start_time'],
             'frameCount': stream_info['frame_count'],
+            'droppedFrames': stream_info.get('dropped_frames', 0),
+            'restarts': stream_info.get('restarts', 0),
+            'lastError': stream_info.get('last_error'),
+            'motionGate': stream_info.get('motion_gate'),
             'uptime': time.time() - stream_info['start_time']
         }), 200
         
@@ -172,83 +227,227 @@ def get_stream_status(camera_id):
         logger.error(f'获取流状态失败: {str(e)}')
         return jsonify({'error': '获取流状态失败'}), 500
 
-def process_stream(camera_id, stream_url, stream_type):
-    """处理视频流"""
+def process_stream(camera_id, stream_url, stream_type, analysis_config=None, stop_event=None, roi=None):
+    """处理视频流，流结束时返回、出错时抛出，由监管器决定是否重连"""
+    grabber = None
+    stop_event = stop_event or threading.Event()
     try:
         logger.info(f'开始处理摄像头 {camera_id} 的流')
         
-        # 根据流类型创建不同的捕获器
-        if stream_type == 'rtmp':
-            cap = cv2.VideoCapture(stream_url)
-        elif stream_type == 'hls':
-            cap = cv2.VideoCapture(stream_url)
-        elif stream_type == 'http':
-            cap = cv2.VideoCapture(stream_url)
-        else:
-            logger.error(f'不支持的流类型: {stream_type}')
-            return
+        if stream_type not in ('rtmp', 'hls', 'http'):
+            raise ValueError(f'不支持的流类型: {stream_type}')
         
-        if not cap.isOpened():
-            logger.error(f'无法打开流: {stream_url}')
-            return
+        # 独立线程抓帧，只保留最新一帧，避免分析积压的旧帧
+        grabber = LatestFrameGrabber(camera_id, stream_url)
+        if not grabber.start():
+            raise RuntimeError(f'无法打开流: {stream_url}')
+        # 登记后快照接口直接复用这一路的最新帧
+        grabber_registry.register(camera_id, grabber)
         
-        frame_count = 0
+        # 开启跟踪时检测器按detect_fps运行，中间帧由跟踪器外推轨迹；否则每10帧进行一次AI分析
+        tracking = tracker_options(analysis_config)
+        tracker_registry.open_camera(camera_id)
+        analysis_every = 1 if tracking else 10
+        detect_interval = 1.0 / tracking['detect_fps'] if tracking else 0.0
+        track_interval = 1.0 / tracking['track_fps'] if tracking and tracking['track_fps'] > 0 else 0.0
+        last_detect_time = last_track_time = 0.0
+        motion_gate = MotionGate.from_config(analysis_config, MOTION_GATE_DEFAULTS)
+        last_frame_id = 0
+        metrics = pipeline_metrics.camera(camera_id, group='stream')
+        metrics.on_connect()
         
-        while active_streams.get(camera_id, {}).get('status') == 'running':
-            ret, frame = cap.read()
-            if not ret:
-                logger.warning(f'无法读取帧: {camera_id}')
-                break
+        # 重连后帧计数接着累计
+        stream_info = active_streams.get(camera_id) or {}
+        base_frames = stream_info.get('frame_count', 0)
+        base_dropped = stream_info.get('dropped_frames', 0)
+        
+        while not stop_event.is_set():
+            frame_id, frame = grabber.read(after_id=last_frame_id + analysis_every - 1, timeout=1.0)
+            metrics.update_source(grabber.frames_read, grabber.frames_dropped)
             
-            frame_count += 1
-            active_streams[camera_id]['frame_count'] = frame_count
+            stream_info = active_streams.get(camera_id)
+            if stream_info is not None:
+                stream_info['frame_count'] = base_frames + grabber.frames_read
+                stream_info['dropped_frames'] = base_dropped + grabber.frames_dropped
             
-            # 每10帧进行一次AI分析
-            if frame_count % 10 == 0:
-                analyze_frame(camera_id, frame)
+            if frame is None:
+                if grabber.ended:
+                    logger.warning(f'无法读取帧: {camera_id}')
+                    break
+                continue
             
-            # 控制帧率
-            time.sleep(0.033)  # 约30fps
+            last_frame_id = frame_id
+            frame_time = grabber.last_read_time
+            
+            if tracking:
+                if frame_time - last_detect_time < detect_interval:
+                    # 两次检测之间只外推轨迹（只读，不改变跟踪器状态，不影响排队中的检测帧）
+                    if frame_time - last_track_time >= track_interval:
+                        last_track_time = frame_time
+                        tracks = tracker_registry.predict(camera_id, frame_time)
+                        if stream_info is not None:
+                            stream_info['tracks'] = len(tracks)
+                    continue
+                last_detect_time = frame_time
+            
+            # 画面无明显变化时跳过检测
+            should_analyze = motion_gate.should_analyze(frame)
+            if stream_info is not None:
+                stream_info['motion_gate'] = motion_gate.get_stats()
+            if should_analyze:
+                frame_queue.put((camera_id, frame, frame_time, roi, tracking))
+            else:
+                metrics.frames_skipped += 1
         
-        cap.release()
         logger.info(f'摄像头 {camera_id} 的流处理已停止')
         
     except Exception as e:
         logger.error(f'处理流失败: {str(e)}')
+        raise
     finally:
-        if camera_id in active_streams:
-            active_streams[camera_id]['status'] = 'stopped'
+        if grabber is not None:
+            grabber_registry.unregister(camera_id, grabber)
+            grabber.stop()
+        flush_tracks(camera_id)
+
+def flush_tracks(camera_id):
+    """结束摄像头的全部轨迹，交给持久化阶段写库
+
+    之后推理阶段处理到该摄像头停止前排队的帧时不会再新建跟踪器（见TrackerRegistry）
+    """
+    try:
+        results = [
+            {
+                'camera_id': camera_id,
+                'model_id': model_id,
+                'predictions': [],
+                'finished_tracks': finished,
+                'tracking': True,
+                'processing_time': 0.0
+            }
+            for model_id, finished in tracker_registry.remove_camera(camera_id)
+            if finished
+        ]
+        if results:
+            persist_queue.put(results)
+    except Exception as e:
+        logger.error(f'结束摄像头轨迹失败: {camera_id}: {str(e)}')
 
-def analyze_frame(camera_id, frame):
-    """分析视频帧"""
+def analyze_frame(camera_id, frame, frame_time=None, roi=None, tracking=None):
+    """分析视频帧（推理阶段），返回待持久化的预测结果"""
     try:
-        # 获取活跃的检测模型
-        detection_models = AIModel.get_detection_models()
+        metrics = pipeline_metrics.camera(camera_id, group='stream')
+        
+        # 只检测ROI裁剪区域，检测框再映射回整帧坐标
+        image, offset = roi.apply(frame) if roi else (frame, None)
+        # 获取活跃的检测模型（进程内缓存，不逐帧查库）
+        detection_models = model_registry.get_detection_models()
         
+        results = []
         for model in detection_models:
             # 这里应该调用实际的AI模型进行检测
             # 现在使用模拟结果
-            predictions = simulate_detection(frame, model)
+            start_time = time.time()
+            predictions = simulate_detection(image, model)
+            if predictions and roi:
+                predictions = roi.map_predictions(predictions, offset, frame.shape)
+            metrics.observe_inference(model.id, (time.time() - start_time) * 1000)
+            
+            # 检测框关联到轨迹（带上trackId），并取出本帧结束的轨迹
+            finished = []
+            if tracking:
+                tracker = tracker_registry.get(camera_id, model.id, tracking)
+                if tracker is None:
+                    # 流已停止、轨迹已结束，停止前排队的剩余帧直接丢弃
+                    continue
+                predictions, finished = tracker.update(predictions, frame_time)
             
-            if predictions:
-                # 保存预测结果
+            if predictions or finished:
+                results.append({
+                    'camera_id': camera_id,
+                    'model_id': model.id,
+                    'predictions': predictions,
+                    'finished_tracks': finished,
+                    'tracking': bool(tracking),
+                    'processing_time': time.time() - start_time
+                })
+        
+        metrics.observe_analyzed(frame_time)
+        return results or None
+        
+    except Exception as e:
+        logger.error(f'分析帧失败: {str(e)}')
+        return None
+
+def persist_predictions(batch):
+    """批量保存预测结果（持久化阶段），一批只提交一次事务
+
+    开启跟踪的摄像头不逐帧写检测结果，只在轨迹结束时每条轨迹写一行汇总
+    """
+    records = [result for results in batch for result in results]
+    try:
+        cameras = {}
+        for result in records:
+            predictions = result['predictions']
+            if predictions and not result.get('tracking'):
                 prediction = ModelPrediction(
-                    model_id=model.id,
-                    camera_id=camera_id,
+                    model_id=result['model_id'],
+                    camera_id=result['camera_id'],
                     prediction_type='detection',
                     confidence=max([p.get('confidence', 0) for p in predictions]),
-                    processing_time=0.1  # 模拟处理时间
+                    processing_time=result['processing_time']
                 )
                 prediction.set_predictions(predictions)
-                
                 db.session.add(prediction)
-                db.session.commit()
-                
-                # 检查是否检测到可疑行为
-                check_suspicious_behavior(camera_id, predictions)
+            
+            if result.get('finished_tracks'):
+                camera_id = result['camera_id']
+                if camera_id not in cameras:
+                    cameras[camera_id] = Camera.query.get(camera_id)
+                persist_tracks(result['model_id'], camera_id, cameras[camera_id], result['finished_tracks'])
         
-    except Exception as e:
-        logger.error(f'分析帧失败: {str(e)}')
+        db.session.commit()
+        
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    # 检查是否检测到可疑行为
+    for result in records:
+        if result['predictions']:
+            check_suspicious_behavior(result['camera_id'], result['predictions'])
+
+def persist_tracks(model_id, camera_id, camera, tracks):
+    """每条结束的轨迹写一行model_predictions（prediction_type为tracking），内容为轨迹汇总
+
+    没有车牌识别，不关联车辆记录。方向为摄像头朝向加上画面中首末轨迹点的走向（粗略估计）；
+    摄像头analysis_config配置了meters_per_pixel（画面每像素对应的米数）时才计算速度（km/h）。
+    """
+    meters_per_pixel = (camera.get_analysis_config() or {}).get('meters_per_pixel') if camera is not None else None
+    camera_direction = (camera.direction or 0) if camera is not None else 0
+    for track in tracks:
+        speed = direction = None
+        path = track['path']
+        if len(path) >= 2:
+            (start_time, start_x, start_y), (end_time, end_x, end_y) = path[0], path[-1]
+            dx, dy = end_x - start_x, end_y - start_y
+            # 画面正上方为0度，顺时针（图像y轴向下）
+            heading = math.degrees(math.atan2(dx, -dy))
+            direction = round((camera_direction + heading) % 360, 1)
+            if meters_per_pixel and end_time > start_time:
+                speed = round(math.hypot(dx, dy) / (end_time - start_time) * float(meters_per_pixel) * 3.6, 1)
+        
+        summary = dict(track, speed=speed, direction=direction,
+                       path=[[round(t, 3), round(x, 1), round(y, 1)] for t, x, y in path])
+        prediction = ModelPrediction(
+            model_id=model_id,
+            camera_id=camera_id,
+            prediction_type='tracking',
+            confidence=track['confidence'],
+            timestamp=datetime.utcfromtimestamp(track['firstSeen'])
+        )
+        prediction.set_predictions([summary])
+        db.session.add(prediction)
 
 def simulate_detection(frame, model):
     """模拟目标检测"""
@@ -293,20 +492,29 @@ def check_suspicious_behavior(camera_id, predictions):
     except Exception as e:
         logger.error(f'检查可疑行为失败: {str(e)}')
 
-@streams_bp.route('/capture/<camera_id>', methods=['POST'])
+@streams_bp.route('/capture/<camera_id>', methods=['GET', 'POST'])
 @jwt_required()
 def capture_frame(camera_id):
-    """捕获当前帧"""
+    """捕获当前帧，GET返回JPEG图片，POST返回base64编码的JSON"""
     try:
         camera = Camera.query.get(camera_id)
         if not camera:
             return jsonify({'error': '摄像头不存在'}), 404
         
-        # 这里应该从实际的流中捕获帧
-        # 现在返回模拟响应
+        max_width = request.args.get('max_width', type=int)
+        image = snapshot_service.get_jpeg(camera_id, camera.stream_url, max_width=max_width)
+        if image is None:
+            return jsonify({'error': '无法获取摄像头画面'}), 503
+        
+        if request.method == 'GET':
+            response = Response(image, mimetype='image/jpeg')
+            response.headers['Cache-Control'] = f'max-age={int(snapshot_service.cache_ttl)}'
+            return response
+        
         return jsonify({
-            'message': '帧捕获功能开发中',
-            'cameraId': camera_id
+            'cameraId': camera_id,
+            'image': 'data:image/jpeg;base64,' + base64.b64encode(image).decode('ascii'),
+            'timestamp': time.time()
         }), 200
         
     except Exception as e:
@@ -325,3 +533,85 @@ def get_active_streams():
     except Exception as e:
         logger.error(f'获取活跃流列表失败: {str(e)}')
         return jsonify({'error': '获取活跃流列表失败'}), 500
+
+@streams_bp.route('/supervisor', methods=['GET'])
+@jwt_required()
+def get_supervisor_status():
+    """获取流水线监管器状态（各流水线状态及最近的状态变迁）"""
+    try:
+        return jsonify({
+            'summary': stream_supervisor.get_summary(),
+            'pipelines': stream_supervisor.get_states(request.args.get('group'))
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取流水线监管状态失败: {str(e)}')
+        return jsonify({'error': '获取流水线监管状态失败'}), 500
+
+@streams_bp.route('/pipeline', methods=['GET'])
+@jwt_required()
+def get_pipeline_stats():
+    """获取流水线各阶段的队列深度、丢弃数和等待时间"""
+    try:
+        return jsonify({
+            'stages': [inference_stage.get_stats(), persist_stage.get_stats()]
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取流水线统计失败: {str(e)}')
+        return jsonify({'error': '获取流水线统计失败'}), 500
+
+@streams_bp.route('/metrics', methods=['GET'])
+@jwt_required()
+def get_pipeline_metrics():
+    """获取各摄像头的解码/分析帧率、推理延迟分位数、丢帧和重连次数"""
+    try:
+        return jsonify({
+            'cameras': pipeline_metrics.snapshot()
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取流水线指标失败: {str(e)}')
+        return jsonify({'error': '获取流水线指标失败'}), 500
+
+@streams_bp.route('/metrics/<camera_id>', methods=['GET'])
+@jwt_required()
+def get_camera_metrics(camera_id):
+    """获取单个摄像头的流水线指标"""
+    try:
+        metrics = pipeline_metrics.snapshot(camera_id)
+        if not metrics:
+            return jsonify({'error': '摄像头没有运行中的流水线'}), 404
+        
+        return jsonify({
+            'cameraId': camera_id,
+            'pipelines': metrics
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取摄像头指标失败: {str(e)}')
+        return jsonify({'error': '获取摄像头指标失败'}), 500
+
+@streams_bp.route('/tracks/<camera_id>', methods=['GET'])
+@jwt_required()
+def get_camera_tracks(camera_id):
+    """获取摄像头当前的目标轨迹（已确认和丢失中的轨迹）"""
+    try:
+        trackers = tracker_registry.camera_trackers(camera_id)
+        if not trackers:
+            return jsonify({'error': '摄像头没有开启跟踪的流水线'}), 404
+        
+        return jsonify({
+            'cameraId': camera_id,
+            'models': {
+                model_id: {
+                    'tracks': tracker.get_tracks(),
+                    'stats': tracker.get_stats()
+                }
+                for model_id, tracker in trackers.items()
+            }
+        }), 200
+        
+    except Exception as e:
+        logger.error(f'获取摄像头轨迹失败: {str(e)}')
+        return jsonify({'error': '获取摄像头轨迹失败'}), 500
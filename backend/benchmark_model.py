@@ -0,0 +1,85 @@
+"""
+模型推理基准测试脚本
+按批次大小、输入尺寸和计算线程数扫描单个模型文件在本机的延迟分位数、吞吐量和峰值内存，无需数据库；
+要把结果写入模型记录的performanceMetrics，使用 POST /api/ai/models/<id>/benchmark
+
+示例:
+    python benchmark_model.py --model models/yolov8n.onnx
+    python benchmark_model.py --model models/yolov8n.onnx --batch-sizes 1,4,8 --input-sizes 640x640,480x480 --threads 2,4
+"""
+
+import argparse
+import json
+import logging
+import os
+from app.ai.model_benchmark import ModelBenchmark
+from app.ai.model_registry import ModelSnapshot
+
+FRAMEWORKS = {'.onnx': 'onnx', '.pt': 'pytorch', '.pth': 'pytorch', '.h5': 'tensorflow', '.keras': 'tensorflow'}
+
+def parse_list(value: str, cast=int) -> list:
+    return [cast(item.strip()) for item in value.split(',') if item.strip()] if value else None
+
+def print_report(report: dict):
+    """打印结果表格"""
+    print(f"{'输入尺寸':>10} {'线程':>5} {'批次':>5} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'单帧(ms)':>9} {'吞吐fps':>9} {'峰值RSS(MB)':>12}")
+    for r in report['results']:
+        if 'error' in r:
+            print(f"{str(r['inputSize']):>10} {str(r['threads']):>5} {r['batchSize']:>5}  失败: {r['error']}")
+            continue
+        latency = r['latencyMs']
+        print(f"{str(r['inputSize']):>10} {str(r['threads']):>5} {r['batchSize']:>5} {latency['p50']:>9} {latency['p95']:>9} "
+              f"{latency['p99']:>9} {r['perFrameMs']:>9} {r['throughputFps']:>9} {r['peakRssMb']:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description='模型推理基准测试')
+    parser.add_argument('--model', required=True, help='模型文件路径')
+    parser.add_argument('--framework', help='模型框架（onnx/pytorch/tensorflow），默认按扩展名判断')
+    parser.add_argument('--name', help='模型名称（PyTorch模型名称含yolo时按Ultralytics加载）')
+    parser.add_argument('--config', help='模型配置文件（JSON）路径')
+    parser.add_argument('--input-sizes', help='逗号分隔的输入尺寸，如 640x640,480x480；默认使用模型声明的尺寸')
+    parser.add_argument('--batch-sizes', default='1,2,4,8', help='逗号分隔的批次大小')
+    parser.add_argument('--threads', help='逗号分隔的计算线程数，默认1、2、4…直到CPU核数')
+    parser.add_argument('--iterations', type=int, default=30, help='每个组合的计时推理次数')
+    parser.add_argument('--warmup', type=int, default=3, help='每个组合计时前的预热推理次数')
+    parser.add_argument('--frame-size', default='1280x720', help='测试帧尺寸')
+    parser.add_argument('--json', help='结果写入JSON文件')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    framework = args.framework or FRAMEWORKS.get(os.path.splitext(args.model)[1].lower())
+    if framework is None:
+        parser.error('无法按扩展名判断模型框架，请指定 --framework')
+
+    model = ModelSnapshot(
+        id='benchmark-model',
+        name=args.name or os.path.basename(args.model),
+        model_type='detection',
+        framework=framework,
+        model_path=args.model,
+        config_path=args.config,
+        version=None,
+        input_size=None,
+        classes=None,
+        confidence_threshold=0.5,
+        is_active=True
+    )
+    benchmark = ModelBenchmark(
+        batch_sizes=parse_list(args.batch_sizes),
+        input_sizes=parse_list(args.input_sizes, str),
+        thread_counts=parse_list(args.threads),
+        iterations=args.iterations,
+        warmup_runs=args.warmup,
+        frame_size=tuple(map(int, args.frame_size.split('x')))
+    )
+    report = benchmark.run(model)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f'结果已写入 {args.json}')
+
+if __name__ == '__main__':
+    main()
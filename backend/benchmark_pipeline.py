@@ -0,0 +1,172 @@
+"""
+视频分析流水线基准测试脚本
+用合成视频（或循环播放的本地文件）模拟N路摄像头，走VideoProcessor/ModelManager的真实处理路径，
+统计不同摄像头数量下的分析帧率、延迟分位数、CPU占用和内存，无需网络和数据库
+
+示例:
+    python benchmark_pipeline.py --cameras 1,2,4,8 --duration 20
+    python benchmark_pipeline.py --source loop:///data/sample.mp4 --onnx models/yolov8n.onnx
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+import numpy as np
+from types import SimpleNamespace
+from app.ai.metrics import Histogram, pipeline_metrics
+from app.ai.model_manager import model_manager, _resident_mb
+from app.ai.stream_supervisor import StreamSupervisor
+from app.ai.video_processor import VideoProcessor
+from app.models.ai_model import AIModel
+
+class StubSession:
+    """替代ONNX Runtime会话的桩模型
+
+    读取整个输入批次（与真实模型一样触及每个像素），再按批次等待固定时间模拟加速器推理耗时；
+    输出YOLOv8形状的检测张量（80类、8400个候选框，其中若干个超过阈值），后处理开销与真实模型一致。
+    """
+
+    def __init__(self, batch_ms: float = 5.0, detections: int = 20, classes: int = 80, anchors: int = 8400):
+        self.batch_ms = batch_ms
+        rng = np.random.default_rng(0)
+        template = np.zeros((4 + classes, anchors), dtype=np.float32)
+        template[:4] = rng.uniform(16, 624, (4, anchors))
+        template[4:, :detections] = rng.uniform(0.3, 0.95, (classes, detections))
+        self._template = template
+
+    def get_inputs(self):
+        return [SimpleNamespace(name='images')]
+
+    def run(self, output_names, feed):
+        images = feed['images']
+        images.reshape(len(images), -1).mean(axis=1)
+        if self.batch_ms > 0:
+            time.sleep(self.batch_ms / 1000.0)
+        return [np.repeat(self._template[None], len(images), axis=0)]
+
+def build_model(args) -> AIModel:
+    """登记基准测试用的检测模型（不经过数据库）"""
+    model = AIModel(
+        id='benchmark-model',
+        name='benchmark',
+        model_type='detection',
+        framework='onnx',
+        model_path=args.onnx or '',
+        input_size=args.input_size,
+        confidence_threshold=0.5,
+        is_active=True
+    )
+    loaded_model = None if args.onnx else StubSession(args.stub_ms)
+    if not model_manager.register_model(model, loaded_model):
+        raise RuntimeError('基准测试模型加载失败')
+    return model
+
+def source_url(args, index: int) -> str:
+    """第index路摄像头的视频源地址，合成视频每路使用不同的seed"""
+    if args.source:
+        return args.source
+    return (f'synthetic://?width={args.width}&height={args.height}&fps={args.fps}'
+            f'&objects={args.objects}&seed={index}')
+
+def merge_histograms(histograms) -> Histogram:
+    """合并多路摄像头的分桶直方图"""
+    merged = Histogram()
+    for histogram in histograms:
+        for i, count in enumerate(histogram.counts):
+            merged.counts[i] += count
+        merged.count += histogram.count
+        merged.total += histogram.total
+    return merged
+
+def run_level(args, model: AIModel, cameras: int) -> dict:
+    """以指定摄像头数量运行一轮测试"""
+    supervisor = StreamSupervisor(max_pipelines=cameras)
+    processor = VideoProcessor(supervisor=supervisor, model_provider=lambda: [model],
+                               variant_selector=lambda model_id: model_id)
+    analysis_config = {
+        'analysis_interval': args.analysis_interval,
+        'motion_threshold': 0
+    }
+    camera_ids = [f'bench-{i}' for i in range(cameras)]
+    for index, camera_id in enumerate(camera_ids):
+        processor.start_stream(camera_id, source_url(args, index), 'synthetic', analysis_config=analysis_config)
+
+    # 预热结束后清零指标，只统计稳定阶段
+    time.sleep(args.warmup)
+    pipeline_metrics.reset()
+    cpu_start = os.times()
+    wall_start = time.time()
+
+    time.sleep(args.duration)
+
+    cpu_end = os.times()
+    wall = time.time() - wall_start
+    cpu_seconds = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    camera_metrics = [pipeline_metrics.camera(camera_id) for camera_id in camera_ids]
+    rss_mb = _resident_mb()
+
+    for camera_id in camera_ids:
+        processor.stop_processing(camera_id)
+    supervisor.shutdown()
+
+    analyzed = sum(m.frames_analyzed for m in camera_metrics)
+    decoded = sum(m.frames_decoded for m in camera_metrics)
+    end_to_end = merge_histograms(m.end_to_end_latency for m in camera_metrics)
+    inference = merge_histograms(h for m in camera_metrics for h in m.inference_latency.values())
+    return {
+        'cameras': cameras,
+        'analyzedFps': round(analyzed / wall, 2),
+        'analyzedFpsPerCamera': round(analyzed / wall / cameras, 2),
+        'decodeFps': round(decoded / wall, 2),
+        'droppedFrames': sum(m.frames_dropped for m in camera_metrics),
+        'endToEndMs': {key: end_to_end.snapshot()[key] for key in ('p50', 'p95', 'p99', 'avg')},
+        'inferenceMs': {key: inference.snapshot()[key] for key in ('p50', 'p95', 'p99', 'avg')},
+        'cpuPercent': round(cpu_seconds / wall * 100, 1),
+        'rssMb': round(rss_mb, 1)
+    }
+
+def print_report(results):
+    """打印结果表格"""
+    header = f"{'摄像头':>6} {'分析fps':>9} {'单路fps':>8} {'解码fps':>9} {'端到端p50/p95/p99(ms)':>24} {'推理p95':>8} {'CPU%':>7} {'RSS(MB)':>8}"
+    print(header)
+    for r in results:
+        e2e = r['endToEndMs']
+        print(f"{r['cameras']:>6} {r['analyzedFps']:>9} {r['analyzedFpsPerCamera']:>8} {r['decodeFps']:>9} "
+              f"{str(e2e['p50']) + '/' + str(e2e['p95']) + '/' + str(e2e['p99']):>24} "
+              f"{str(r['inferenceMs']['p95']):>8} {r['cpuPercent']:>7} {r['rssMb']:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description='视频分析流水线基准测试')
+    parser.add_argument('--cameras', default='1,2,4,8', help='逗号分隔的摄像头数量，逐个测试')
+    parser.add_argument('--duration', type=float, default=20, help='每轮统计时长（秒）')
+    parser.add_argument('--warmup', type=float, default=3, help='每轮预热时长（秒）')
+    parser.add_argument('--source', help='视频源地址，如 loop:///path/video.mp4；默认使用合成视频')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=float, default=25)
+    parser.add_argument('--objects', type=int, default=8, help='合成视频中运动方块的数量')
+    parser.add_argument('--analysis-interval', type=float, default=0, help='分析间隔（秒），0表示有新帧就分析')
+    parser.add_argument('--onnx', help='ONNX模型路径；默认使用桩模型')
+    parser.add_argument('--input-size', default='640x640', help='模型输入尺寸')
+    parser.add_argument('--stub-ms', type=float, default=5, help='桩模型每个批次的模拟推理耗时（毫秒）')
+    parser.add_argument('--json', help='结果写入JSON文件')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    model = build_model(args)
+    results = []
+    for cameras in [int(value) for value in args.cameras.split(',') if value.strip()]:
+        print(f'测试 {cameras} 路摄像头...')
+        results.append(run_level(args, model, cameras))
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f'结果已写入 {args.json}')
+
+if __name__ == '__main__':
+    main()
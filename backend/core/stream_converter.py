@@ -49,25 +49,8 @@ class StreamConverter:
             }
         
         try:
-            # 创建流目录
-            stream_dir = os.path.join(self.output_dir, stream_id)
-            os.makedirs(stream_dir, exist_ok=True)
-            
             # 构建FFmpeg命令
-            hls_path = os.path.join(stream_dir, 'playlist.m3u8')
-            
-            ffmpeg_cmd = [
-                'ffmpeg',
-                '-i', rtmp_url,
-                '-c:v', 'libx264',
-                '-c:a', 'aac',
-                '-f', 'hls',
-                '-hls_time', '2',
-                '-hls_list_size', '10',
-                '-hls_flags', 'delete_segments',
-                '-hls_segment_filename', os.path.join(stream_dir, 'segment_%03d.ts'),
-                hls_path
-            ]
+            ffmpeg_cmd = ['ffmpeg', '-i', rtmp_url] + self.hls_output_args(stream_id)
             
             # 启动FFmpeg进程
             process = subprocess.Popen(
@@ -77,22 +60,7 @@ class StreamConverter:
                 text=True
             )
             
-            # 记录转换信息
-            self.active_conversions[stream_id] = process
-            self.conversion_status[stream_id] = {
-                'status': 'converting',
-                'start_time': datetime.now(),
-                'rtmp_url': rtmp_url,
-                'hls_url': f'/streams/{stream_id}/playlist.m3u8'
-            }
-            
-            # 启动监控线程
-            monitor_thread = threading.Thread(
-                target=self._monitor_conversion,
-                args=(stream_id, process)
-            )
-            monitor_thread.daemon = True
-            monitor_thread.start()
+            self.register_process(stream_id, process, rtmp_url)
             
             logger.info(f"开始转换流: {stream_id} from {rtmp_url}")
             
@@ -111,13 +79,75 @@ class StreamConverter:
                 'status': 'failed'
             }
     
+    def hls_output_args(self, stream_id: str) -> list:
+        """
+        构建HLS输出参数，并创建流目录
+        
+        Args:
+            stream_id: 流ID
+            
+        Returns:
+            list: 可直接拼接在FFmpeg输入参数之后的输出参数
+        """
+        stream_dir = os.path.join(self.output_dir, stream_id)
+        os.makedirs(stream_dir, exist_ok=True)
+        
+        return [
+            '-c:v', 'libx264',
+            '-c:a', 'aac',
+            '-f', 'hls',
+            '-hls_time', '2',
+            '-hls_list_size', '10',
+            '-hls_flags', 'delete_segments',
+            '-hls_segment_filename', os.path.join(stream_dir, 'segment_%03d.ts'),
+            os.path.join(stream_dir, 'playlist.m3u8')
+        ]
+    
+    def register_process(self, stream_id: str, process: subprocess.Popen, rtmp_url: str, mode: str = 'hls'):
+        """
+        登记正在输出HLS的FFmpeg进程并启动监控
+        
+        Args:
+            stream_id: 流ID
+            process: FFmpeg进程
+            rtmp_url: 源流地址
+            mode: hls为单独转换，combined为与AI分析共用同一解码进程
+        """
+        # 记录转换信息
+        self.active_conversions[stream_id] = process
+        self.conversion_status[stream_id] = {
+            'status': 'converting',
+            'mode': mode,
+            'start_time': datetime.now(),
+            'rtmp_url': rtmp_url,
+            'hls_url': f'/streams/{stream_id}/playlist.m3u8'
+        }
+        
+        # 启动监控线程
+        monitor_thread = threading.Thread(
+            target=self._monitor_conversion,
+            args=(stream_id, process)
+        )
+        monitor_thread.daemon = True
+        monitor_thread.start()
+    
+    def release_process(self, stream_id: str, process: subprocess.Popen):
+        """注销由外部持有并自行结束的FFmpeg进程，标记为已停止"""
+        if self.active_conversions.get(stream_id) is process:
+            del self.active_conversions[stream_id]
+            self.conversion_status[stream_id]['status'] = 'stopped'
+            logger.info(f"已停止流转换: {stream_id}")
+    
     def _monitor_conversion(self, stream_id: str, process: subprocess.Popen):
         """监控转换进程"""
         try:
             # 等待进程结束
             return_code = process.wait()
             
-            if return_code == 0:
+            if self.active_conversions.get(stream_id) is not process:
+                # 已被主动停止或被新进程替换，不更新状态
+                pass
+            elif return_code == 0:
                 self.conversion_status[stream_id]['status'] = 'completed'
                 logger.info(f"流转换完成: {stream_id}")
             else:
@@ -128,15 +158,16 @@ class StreamConverter:
             logger.error(f"监控流转换时出错: {e}")
             self.conversion_status[stream_id]['status'] = 'error'
         finally:
-            # 清理进程记录
-            if stream_id in self.active_conversions:
+            # 清理进程记录（可能已被同一流ID的新进程替换）
+            if self.active_conversions.get(stream_id) is process:
                 del self.active_conversions[stream_id]
     
     def stop_conversion(self, stream_id: str) -> bool:
         """停止流转换"""
         try:
             if stream_id in self.active_conversions:
-                process = self.active_conversions[stream_id]
+                # 先移除记录，监控线程据此区分主动停止与异常退出
+                process = self.active_conversions.pop(stream_id)
                 process.terminate()
                 
                 # 等待进程结束
@@ -146,7 +177,6 @@ class StreamConverter:
                     process.kill()
                     process.wait()
                 
-                del self.active_conversions[stream_id]
                 self.conversion_status[stream_id]['status'] = 'stopped'
                 
                 logger.info(f"已停止流转换: {stream_id}")
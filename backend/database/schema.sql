@@ -41,6 +41,8 @@ CREATE TABLE cameras (
     direction DECIMAL(5, 2) DEFAULT 0,
     is_recording BOOLEAN DEFAULT FALSE,
     last_heartbeat DATETIME,
+    analysis_config JSON,
+    roi_polygons JSON,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     INDEX idx_status (status),
@@ -0,0 +1,104 @@
+"""
+启动耗时分析脚本
+在全新的子进程中用 python -X importtime 逐个导入后端模块和深度学习框架，
+统计每个模块的总导入耗时和耗时最多的依赖，定位拖慢worker启动的导入
+
+示例:
+    python profile_startup.py
+    python profile_startup.py --modules app.ai.model_manager,torch --top 15 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# 默认分析的模块：后端AI模块和各深度学习框架
+DEFAULT_MODULES = [
+    'app.ai.model_manager',
+    'app.ai.video_processor',
+    'app.routes.ai',
+    'app.routes.streams',
+    'cv2',
+    'onnxruntime',
+    'torch',
+    'tensorflow',
+    'ultralytics',
+    'transformers',
+    'detectron2'
+]
+
+def profile_module(module: str, top: int) -> dict:
+    """在子进程中导入模块，解析 -X importtime 输出（单位微秒）"""
+    start = time.time()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    wall = time.time() - start
+
+    entries = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            entries.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else '导入失败'
+        return {'module': module, 'ok': False, 'error': error, 'wallSeconds': round(wall, 2)}
+
+    total_us = next((cumulative for name, _, cumulative in entries if name == module), 0)
+    slowest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+    return {
+        'module': module,
+        'ok': True,
+        'importSeconds': round(total_us / 1e6, 3),
+        # 含解释器启动的子进程总耗时
+        'wallSeconds': round(wall, 2),
+        'modulesImported': len(entries),
+        'slowest': [{'module': name, 'selfMs': round(self_us / 1000, 1), 'cumulativeMs': round(cumulative_us / 1000, 1)}
+                    for name, self_us, cumulative_us in slowest]
+    }
+
+def print_report(results):
+    """打印结果表格"""
+    print(f"{'模块':<28} {'导入耗时(s)':>11} {'进程耗时(s)':>11} {'导入模块数':>10}")
+    for r in results:
+        if not r['ok']:
+            print(f"{r['module']:<28} {'-':>11} {r['wallSeconds']:>11} {'-':>10}  {r['error']}")
+            continue
+        print(f"{r['module']:<28} {r['importSeconds']:>11} {r['wallSeconds']:>11} {r['modulesImported']:>10}")
+
+    for r in results:
+        if r['ok'] and r['slowest']:
+            print(f"\n{r['module']} 自身耗时最多的模块:")
+            for entry in r['slowest']:
+                print(f"  {entry['module']:<50} {entry['selfMs']:>9} ms  (累计 {entry['cumulativeMs']} ms)")
+
+def main():
+    parser = argparse.ArgumentParser(description='后端启动导入耗时分析')
+    parser.add_argument('--modules', help='逗号分隔的模块名，默认分析后端AI模块和各深度学习框架')
+    parser.add_argument('--top', type=int, default=10, help='每个模块列出自身耗时最多的依赖数量')
+    parser.add_argument('--json', help='结果写入JSON文件')
+    args = parser.parse_args()
+
+    modules = [m.strip() for m in args.modules.split(',') if m.strip()] if args.modules else DEFAULT_MODULES
+    results = []
+    for module in modules:
+        print(f'分析 {module}...')
+        results.append(profile_module(module, args.top))
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f'结果已写入 {args.json}')
+
+if __name__ == '__main__':
+    main()
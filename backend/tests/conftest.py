@@ -0,0 +1,9 @@
+"""
+单元测试公共配置
+"""
+
+import os
+import sys
+
+# 从任意目录运行pytest时都能导入backend下的app包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
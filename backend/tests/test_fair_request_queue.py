@@ -0,0 +1,144 @@
+"""
+按摄像头公平轮转的推理请求队列和批量调度测试
+"""
+
+import json
+import queue
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# 调度器模块会导入模型管理器、预处理和数据库模型
+pytest.importorskip('cv2')
+pytest.importorskip('flask_sqlalchemy')
+
+from app.ai.inference_scheduler import FairRequestQueue, InferenceRequest, InferenceScheduler
+
+def put_all(fair_queue, camera_id, count):
+    requests = [InferenceRequest(camera_id, np.zeros((1, 1, 3), dtype=np.uint8)) for _ in range(count)]
+    for request in requests:
+        fair_queue.put(request)
+    return requests
+
+def test_round_robin_between_cameras():
+    fair_queue = FairRequestQueue()
+    busy = put_all(fair_queue, 'cam-a', 5)
+    quiet = put_all(fair_queue, 'cam-b', 2)
+
+    order = [fair_queue.get_nowait() for _ in range(7)]
+    assert [request.camera_id for request in order] == ['cam-a', 'cam-b', 'cam-a', 'cam-b', 'cam-a', 'cam-a', 'cam-a']
+    # 同一摄像头内保持先进先出
+    assert [request for request in order if request.camera_id == 'cam-a'] == busy
+    assert [request for request in order if request.camera_id == 'cam-b'] == quiet
+
+def test_camera_joining_later_is_not_starved():
+    fair_queue = FairRequestQueue()
+    put_all(fair_queue, 'cam-a', 10)
+    fair_queue.get_nowait()
+    late = put_all(fair_queue, 'cam-b', 1)
+    fair_queue.get_nowait()
+    assert fair_queue.get_nowait() is late[0]
+
+def test_sizes_and_depth_by_camera():
+    fair_queue = FairRequestQueue()
+    put_all(fair_queue, 'cam-a', 3)
+    put_all(fair_queue, None, 1)
+
+    assert fair_queue.qsize() == 4
+    assert fair_queue.depth_by_camera() == {'cam-a': 3, 'None': 1}
+    for _ in range(4):
+        fair_queue.get_nowait()
+    assert fair_queue.qsize() == 0
+    assert fair_queue.depth_by_camera() == {}
+
+def test_get_raises_empty_on_timeout():
+    fair_queue = FairRequestQueue()
+    with pytest.raises(queue.Empty):
+        fair_queue.get_nowait()
+    with pytest.raises(queue.Empty):
+        fair_queue.get(timeout=0.01)
+
+def test_get_wakes_up_on_put():
+    fair_queue = FairRequestQueue()
+    requests = []
+    threading.Timer(0.05, lambda: requests.extend(put_all(fair_queue, 'cam-a', 1))).start()
+    assert fair_queue.get(timeout=5) is not None
+    assert len(requests) == 1
+
+class FakeManager:
+    """记录每次批量推理的帧尺寸，每帧返回自身尺寸"""
+
+    def __init__(self, max_batch=None, resizes=True, error=None):
+        self.max_batch = max_batch
+        self.resizes = resizes
+        self.error = error
+        self.calls = []
+
+    def max_batch_size(self, model_id):
+        return self.max_batch
+
+    def batch_key(self, model_id, image):
+        return () if self.resizes else image.shape
+
+    def predict_batch(self, model_id, images):
+        self.calls.append([image.shape for image in images])
+        if self.error:
+            raise self.error
+        return [[{'shape': image.shape}] for image in images]
+
+@pytest.fixture
+def make_scheduler(tmp_path):
+    """单工作线程、批处理窗口足够长的调度器，连续提交的帧进入同一批次"""
+    config_path = tmp_path / 'model.json'
+    config_path.write_text(json.dumps({'inference': {'workers': 1, 'threadsPerWorker': 1}}))
+    model = SimpleNamespace(framework='onnx', config_path=str(config_path))
+    schedulers = []
+
+    def make(manager, max_batch_size=16):
+        scheduler = InferenceScheduler(manager, batch_window=0.5, max_batch_size=max_batch_size,
+                                       model_provider=lambda model_id: model,
+                                       variant_selector=lambda model_id: model_id)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop()
+
+def frames(*sizes):
+    return [np.zeros((height, width, 3), dtype=np.uint8) for width, height in sizes]
+
+def test_frames_resized_by_preprocessing_share_a_batch(make_scheduler):
+    manager = FakeManager()
+    scheduler = make_scheduler(manager)
+    futures = [scheduler.submit('model-1', frame, f'cam-{i}') for i, frame in enumerate(frames((640, 480), (1920, 1080)))]
+
+    assert [future.result(timeout=5)[0]['shape'] for future in futures] == [(480, 640, 3), (1080, 1920, 3)]
+    assert manager.calls == [[(480, 640, 3), (1080, 1920, 3)]]
+
+def test_frames_grouped_by_shape_without_fixed_input_size(make_scheduler):
+    manager = FakeManager(resizes=False)
+    scheduler = make_scheduler(manager)
+    futures = [scheduler.submit('model-1', frame, f'cam-{i}')
+               for i, frame in enumerate(frames((640, 480), (1920, 1080), (640, 480)))]
+
+    for future in futures:
+        future.result(timeout=5)
+    assert sorted(manager.calls) == [[(480, 640, 3), (480, 640, 3)], [(1080, 1920, 3)]]
+
+def test_batch_capped_at_model_static_batch_size(make_scheduler):
+    manager = FakeManager(max_batch=2)
+    scheduler = make_scheduler(manager)
+    futures = [scheduler.submit('model-1', frame, f'cam-{i}') for i, frame in enumerate(frames(*[(64, 48)] * 5))]
+
+    assert all(len(future.result(timeout=5)) == 1 for future in futures)
+    assert sorted(len(call) for call in manager.calls) == [1, 2, 2]
+
+def test_inference_error_reaches_caller(make_scheduler):
+    scheduler = make_scheduler(FakeManager(error=RuntimeError('batch dimension mismatch')))
+    future = scheduler.submit('model-1', frames((64, 48))[0], 'cam-0')
+
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
@@ -0,0 +1,97 @@
+"""
+流水线指标测试
+"""
+
+import math
+
+from app.ai.metrics import Histogram, RateMeter, CameraMetrics, PipelineMetrics
+
+def test_empty_histogram():
+    histogram = Histogram()
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 0
+    assert snapshot['avg'] is None
+    assert snapshot['p50'] is None
+
+def test_histogram_buckets_by_upper_bound():
+    histogram = Histogram(buckets=(1, 10, 100))
+    for value in (0.5, 1, 5, 10, 50, 500):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {'le_1': 2, 'le_10': 2, 'le_100': 1, 'inf': 1}
+    assert snapshot['count'] == 6
+    assert snapshot['avg'] == round(566.5 / 6, 3)
+
+def test_histogram_percentiles():
+    histogram = Histogram(buckets=(1, 10, 100))
+    for _ in range(90):
+        histogram.observe(5)
+    for _ in range(9):
+        histogram.observe(50)
+    histogram.observe(1000)
+
+    assert histogram.percentile(50) == 10
+    assert histogram.percentile(90) == 10
+    assert histogram.percentile(99) == 100
+    assert math.isinf(histogram.percentile(100))
+
+def test_rate_meter_counts_complete_seconds():
+    meter = RateMeter(window=10)
+    meter._start = 100
+    for second in range(100, 110):
+        meter.mark(5, now=second + 0.5)
+    # 当前这一秒还没结束，不计入
+    meter.mark(100, now=110.2)
+    assert meter.rate(now=110.5) == 5.0
+    assert meter.total == 150
+
+def test_rate_meter_forgets_old_seconds():
+    meter = RateMeter(window=5)
+    meter._start = 0
+    meter.mark(10, now=1.0)
+    assert meter.rate(now=2.0) == 5.0
+    assert meter.rate(now=20.0) == 0.0
+
+def test_camera_metrics_source_counters_survive_reconnects():
+    metrics = CameraMetrics('cam-1', 'analysis')
+    metrics.on_connect()
+    metrics.update_source(frames_read=100, frames_dropped=3)
+    metrics.update_source(frames_read=150, frames_dropped=3)
+    metrics.on_connect()
+    metrics.update_source(frames_read=20, frames_dropped=1)
+
+    assert metrics.frames_decoded == 170
+    assert metrics.frames_dropped == 4
+    assert metrics.reconnects == 1
+
+def test_camera_metrics_reset_keeps_source_baseline():
+    metrics = CameraMetrics('cam-1', 'analysis')
+    metrics.on_connect()
+    metrics.update_source(frames_read=100, frames_dropped=0)
+    metrics.reset()
+    metrics.update_source(frames_read=110, frames_dropped=0)
+    assert metrics.frames_decoded == 10
+
+def test_camera_metrics_snapshot():
+    metrics = CameraMetrics('cam-1', 'analysis')
+    metrics.observe_inference('model-1', 12.0)
+    metrics.observe_analyzed()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['cameraId'] == 'cam-1'
+    assert snapshot['framesAnalyzed'] == 1
+    assert snapshot['inferenceLatencyMs']['model-1']['count'] == 1
+    assert snapshot['endToEndLatencyMs']['count'] == 0
+
+def test_pipeline_metrics_registry():
+    registry = PipelineMetrics()
+    camera = registry.camera('cam-1')
+    assert registry.camera('cam-1') is camera
+    registry.camera('cam-1', group='snapshot')
+    registry.camera('cam-2')
+
+    assert len(registry.snapshot()) == 3
+    assert len(registry.snapshot('cam-1')) == 2
+    registry.remove('cam-1')
+    assert [item['group'] for item in registry.snapshot('cam-1')] == ['snapshot']
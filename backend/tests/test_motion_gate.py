@@ -0,0 +1,71 @@
+"""
+运动门控测试
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+
+from app.ai.motion_gate import MotionGate
+
+def make_frame(value: int = 0) -> np.ndarray:
+    return np.full((360, 640, 3), value, dtype=np.uint8)
+
+def test_first_frame_is_analyzed():
+    gate = MotionGate()
+    assert gate.should_analyze(make_frame(), now=0.0)
+    assert gate.get_stats()['checks'] == 1
+
+def test_static_frames_are_skipped():
+    gate = MotionGate(max_skip_seconds=10.0)
+    gate.should_analyze(make_frame(), now=0.0)
+    assert not gate.should_analyze(make_frame(), now=1.0)
+    assert not gate.should_analyze(make_frame(), now=2.0)
+
+    stats = gate.get_stats()
+    assert stats['skipped'] == 2
+    assert stats['skip_ratio'] == round(2 / 3, 4)
+    assert stats['last_change_ratio'] == 0
+
+def test_motion_is_analyzed():
+    gate = MotionGate(threshold=0.005)
+    gate.should_analyze(make_frame(), now=0.0)
+
+    frame = make_frame()
+    frame[100:200, 200:320] = 255
+    assert gate.should_analyze(frame, now=0.5)
+    assert gate.last_change_ratio >= 0.005
+
+def test_small_change_below_pixel_threshold_is_skipped():
+    gate = MotionGate(pixel_threshold=25)
+    gate.should_analyze(make_frame(100), now=0.0)
+    assert not gate.should_analyze(make_frame(110), now=0.5)
+
+def test_forced_analysis_after_max_skip_seconds():
+    gate = MotionGate(max_skip_seconds=5.0)
+    gate.should_analyze(make_frame(), now=0.0)
+    assert not gate.should_analyze(make_frame(), now=4.0)
+    assert gate.should_analyze(make_frame(), now=5.0)
+    assert gate.get_stats()['forced'] == 1
+    # 强制分析后重新计时
+    assert not gate.should_analyze(make_frame(), now=6.0)
+
+def test_reference_only_updates_on_analysis():
+    """缓慢变化累积到超过阈值后放行"""
+    gate = MotionGate(pixel_threshold=25, max_skip_seconds=100.0)
+    gate.should_analyze(make_frame(100), now=0.0)
+    assert not gate.should_analyze(make_frame(115), now=1.0)
+    assert gate.should_analyze(make_frame(130), now=2.0)
+
+def test_zero_threshold_disables_gate():
+    gate = MotionGate(threshold=0)
+    assert all(gate.should_analyze(make_frame(), now=float(t)) for t in range(3))
+    assert gate.get_stats()['skipped'] == 0
+
+def test_from_config_overrides_defaults():
+    gate = MotionGate.from_config({'motion_threshold': 0.02, 'motion_max_skip_seconds': None},
+                                  defaults={'motion_threshold': 0.01, 'motion_max_skip_seconds': 3})
+    assert gate.threshold == 0.02
+    assert gate.max_skip_seconds == 3.0
+    assert gate.pixel_threshold == 25
@@ -0,0 +1,159 @@
+"""
+流水线阶段与有界队列测试
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.ai.pipeline import StageQueue, PipelineStage, DROP_OLDEST, DROP_NEWEST, BLOCK
+
+def camera_key(item):
+    return item[0]
+
+def test_invalid_drop_policy():
+    with pytest.raises(ValueError):
+        StageQueue('q', 4, drop_policy='unknown')
+
+def test_drop_oldest_keeps_latest_items():
+    queue = StageQueue('q', 3, DROP_OLDEST)
+    for i in range(5):
+        assert queue.put(i)
+    assert queue.get_batch(10, timeout=0) == [2, 3, 4]
+    assert queue.dropped == 2
+    assert queue.get_stats()['maxDepth'] == 3
+
+def test_drop_newest_rejects_new_items():
+    queue = StageQueue('q', 2, DROP_NEWEST)
+    assert queue.put(1) and queue.put(2)
+    assert not queue.put(3)
+    assert queue.get_batch(10, timeout=0) == [1, 2]
+    assert queue.dropped == 1
+
+def test_block_times_out_and_drops():
+    queue = StageQueue('q', 1, BLOCK, block_timeout=0.05)
+    assert queue.put(1)
+    start = time.time()
+    assert not queue.put(2)
+    assert time.time() - start >= 0.04
+    assert queue.dropped == 1
+
+def test_block_resumes_when_consumer_takes_item():
+    queue = StageQueue('q', 1, BLOCK, block_timeout=5)
+    queue.put(1)
+    threading.Timer(0.05, queue.get, kwargs={'timeout': 0}).start()
+    assert queue.put(2)
+    assert queue.get(timeout=0) == 2
+
+def test_get_times_out_on_empty_queue():
+    queue = StageQueue('q', 1)
+    assert queue.get(timeout=0.01) is None
+
+def test_per_key_drop_only_affects_same_camera():
+    queue = StageQueue('frames', 16, DROP_OLDEST, key=camera_key, per_key_maxsize=2)
+    queue.put(('cam-a', 1))
+    queue.put(('cam-b', 1))
+    for i in range(2, 6):
+        queue.put(('cam-a', i))
+
+    items = queue.get_batch(16, timeout=0)
+    assert ('cam-b', 1) in items
+    assert [item for item in items if item[0] == 'cam-a'] == [('cam-a', 4), ('cam-a', 5)]
+    assert queue.dropped == 3
+
+def test_full_keyed_queue_drops_from_busiest_camera():
+    queue = StageQueue('frames', 4, DROP_OLDEST, key=camera_key)
+    for item in [('cam-a', 1), ('cam-a', 2), ('cam-a', 3), ('cam-b', 1), ('cam-b', 2)]:
+        queue.put(item)
+    assert queue.get_batch(10, timeout=0) == [('cam-a', 2), ('cam-a', 3), ('cam-b', 1), ('cam-b', 2)]
+    assert queue.get_stats()['keys'] == 0
+
+def test_exclusive_get_holds_key_until_done():
+    queue = StageQueue('frames', 16, key=camera_key)
+    for item in [('cam-a', 1), ('cam-a', 2), ('cam-b', 1)]:
+        queue.put(item)
+
+    first = queue.get_batch(1, timeout=0, exclusive=True)
+    assert first == [('cam-a', 1)]
+    # cam-a处理中，下一个只能取到cam-b
+    assert queue.get_batch(1, timeout=0, exclusive=True) == [('cam-b', 1)]
+    assert queue.get_batch(1, timeout=0.01, exclusive=True) == []
+
+    queue.done(first)
+    assert queue.get_batch(1, timeout=0, exclusive=True) == [('cam-a', 2)]
+
+def test_ordered_stage_processes_each_camera_in_order():
+    queue = StageQueue('frames', 1000, key=camera_key)
+    seen = {}
+    active = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def handler(item):
+        camera_id, index = item
+        with lock:
+            if camera_id in active:
+                overlaps.append(item)
+            active.add(camera_id)
+        time.sleep(0.001)
+        with lock:
+            active.discard(camera_id)
+            seen.setdefault(camera_id, []).append(index)
+
+    for index in range(50):
+        for camera_id in ('cam-a', 'cam-b', 'cam-c'):
+            queue.put((camera_id, index))
+
+    stage = PipelineStage('inference', queue, handler, workers=4, ordered=True)
+    stage.start()
+    try:
+        deadline = time.time() + 10
+        while stage.processed < 150 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        stage.stop()
+
+    assert not overlaps
+    assert all(seen[camera_id] == list(range(50)) for camera_id in ('cam-a', 'cam-b', 'cam-c'))
+
+def test_stage_forwards_results_and_counts_errors():
+    input_queue = StageQueue('in', 10)
+    output_queue = StageQueue('out', 10)
+
+    def handler(value):
+        if value < 0:
+            raise ValueError('bad')
+        return value * 2 if value else None
+
+    for value in (1, -1, 0, 3):
+        input_queue.put(value)
+
+    stage = PipelineStage('double', input_queue, handler, output_queue=output_queue)
+    stage.start()
+    try:
+        deadline = time.time() + 5
+        while stage.processed < 4 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        stage.stop()
+
+    assert output_queue.get_batch(10, timeout=0) == [2, 6]
+    assert stage.errors == 1
+
+def test_batched_stage_receives_lists():
+    input_queue = StageQueue('in', 10)
+    batches = []
+    for value in range(5):
+        input_queue.put(value)
+
+    stage = PipelineStage('persist', input_queue, batches.append, batch_size=10)
+    stage.start()
+    try:
+        deadline = time.time() + 5
+        while stage.processed < 5 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        stage.stop()
+
+    assert batches == [[0, 1, 2, 3, 4]]
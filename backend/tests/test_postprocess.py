@@ -0,0 +1,114 @@
+"""
+检测结果后处理测试
+"""
+
+import numpy as np
+import pytest
+
+from app.ai import postprocess
+from app.ai.postprocess import (
+    box_iou, non_max_suppression, decode_yolo, make_detections, empty_detections,
+    filter_detections, detections_to_dicts
+)
+
+def test_box_iou():
+    boxes_a = np.array([[0, 0, 10, 10], [0, 0, 0, 0]], dtype=np.float32)
+    boxes_b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], dtype=np.float32)
+    iou = box_iou(boxes_a, boxes_b)
+
+    assert iou.shape == (2, 3)
+    assert iou[0].tolist() == pytest.approx([1.0, 50 / 150, 0.0])
+    assert iou[1].tolist() == [0.0, 0.0, 0.0]
+
+def test_nms_suppresses_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30]], dtype=np.float32)
+    scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+    assert non_max_suppression(boxes, scores, 0.5).tolist() == [1, 2]
+    assert non_max_suppression(boxes, scores, 0.5, max_detections=1).tolist() == [1]
+    assert len(non_max_suppression(np.empty((0, 4)), np.empty(0))) == 0
+
+def test_nms_per_class():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11]], dtype=np.float32)
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+    assert non_max_suppression(boxes, scores, 0.5, classes=np.array([0, 1])).tolist() == [0, 1]
+    assert non_max_suppression(boxes, scores, 0.5, classes=np.array([2, 2])).tolist() == [0]
+
+def test_nms_ios_merges_truncated_boxes():
+    boxes = np.array([[0, 0, 100, 50], [60, 0, 100, 50]], dtype=np.float32)
+    scores = np.array([0.9, 0.6], dtype=np.float32)
+    assert non_max_suppression(boxes, scores, 0.5).tolist() == [0, 1]
+    assert non_max_suppression(boxes, scores, 0.5, match_metric='ios').tolist() == [0]
+
+def test_matrix_and_iterative_nms_agree(monkeypatch):
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 500, (400, 2))
+    wh = rng.uniform(10, 80, (400, 2))
+    boxes = np.hstack([xy, xy + wh]).astype(np.float32)
+    scores = rng.uniform(0, 1, 400).astype(np.float32)
+    classes = rng.integers(0, 3, 400)
+
+    matrix = non_max_suppression(boxes, scores, 0.45, classes=classes)
+    monkeypatch.setattr(postprocess, '_NMS_MATRIX_LIMIT', 0)
+    iterative = non_max_suppression(boxes, scores, 0.45, classes=classes)
+    assert matrix.tolist() == iterative.tolist()
+
+def yolov8_output(rows):
+    """rows: [(cx, cy, w, h, [类别置信度...]), ...] -> (1, 4+C, N)"""
+    return np.array([[cx, cy, w, h, *scores] for cx, cy, w, h, scores in rows], dtype=np.float32).T[None]
+
+def test_decode_yolov8():
+    output = yolov8_output([
+        (50, 50, 20, 10, [0.1, 0.9]),
+        (51, 50, 20, 10, [0.1, 0.8]),
+        (200, 200, 40, 40, [0.7, 0.2]),
+        (300, 300, 40, 40, [0.1, 0.2])
+    ])
+    detections = decode_yolo(output, conf_threshold=0.25, iou_threshold=0.45, head='yolov8')[0]
+
+    assert detections['class_id'].tolist() == [1, 0]
+    assert detections['confidence'].tolist() == pytest.approx([0.9, 0.7])
+    assert detections['bbox'][0].tolist() == [40, 45, 60, 55]
+
+def test_decode_yolov5_multiplies_objectness():
+    output = np.array([[
+        [50, 50, 20, 10, 0.9, 0.1, 0.8],
+        [200, 200, 40, 40, 0.2, 0.9, 0.1],
+        [300, 300, 40, 40, 0.5, 0.9, 0.1]
+    ]], dtype=np.float32)
+    detections = decode_yolo(output, conf_threshold=0.25, head='yolov5')[0]
+
+    assert detections['class_id'].tolist() == [1, 0]
+    assert detections['confidence'].tolist() == pytest.approx([0.72, 0.45])
+
+def test_decode_yolo_empty_and_batched():
+    output = np.concatenate([
+        yolov8_output([(50, 50, 20, 10, [0.1, 0.1]), (60, 60, 20, 10, [0.1, 0.1])]),
+        yolov8_output([(50, 50, 20, 10, [0.9, 0.1]), (60, 60, 20, 10, [0.1, 0.1])])
+    ])
+    # 2个候选框、6个通道，按auto规则会识别为YOLOv5，需要显式指定
+    results = decode_yolo(output, head='yolov8')
+    assert len(results) == 2
+    assert len(results[0]) == 0
+    assert len(results[1]) == 1
+
+def test_decode_yolo_rejects_bad_shapes():
+    with pytest.raises(ValueError):
+        decode_yolo(np.zeros((1, 2, 3, 4)))
+    with pytest.raises(ValueError):
+        decode_yolo(np.zeros((1, 4, 100)), head='yolov8')
+    with pytest.raises(ValueError):
+        decode_yolo(np.zeros((1, 6, 100)), head='ssd')
+
+def test_filter_and_convert_detections():
+    detections = make_detections(
+        np.array([[0, 0, 1, 1], [0, 0, 2, 2], [0, 0, 3, 3]], dtype=np.float32),
+        np.array([0.3, 0.9, 0.6], dtype=np.float32),
+        np.array([0, 1, 5], dtype=np.int32)
+    )
+    filtered = filter_detections(detections, 0.5, max_detections=1)
+    assert filtered['confidence'].tolist() == pytest.approx([0.9])
+
+    dicts = detections_to_dicts(detections, ['car', 'truck'])
+    assert [d['class'] for d in dicts] == ['car', 'truck', '5']
+    assert dicts[1]['bbox'] == [0, 0, 2, 2]
+    assert detections_to_dicts(empty_detections()) == []
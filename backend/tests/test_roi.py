@@ -0,0 +1,75 @@
+"""
+感兴趣区域测试
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+
+from app.ai.roi import RegionOfInterest
+
+TRIANGLE = [[[0.0, 0.0], [0.5, 0.0], [0.0, 0.5]]]
+RECTANGLE = [[[0.25, 0.5], [0.75, 0.5], [0.75, 1.0], [0.25, 1.0]]]
+
+@pytest.mark.parametrize('polygons', [
+    'not a list',
+    [[[0, 0], [1, 0]]],
+    [[[0, 0], [1, 0], [1.5, 1]]],
+    [[[0, 0, 0], [1, 0, 0], [1, 1, 0]]]
+])
+def test_parse_rejects_invalid_polygons(polygons):
+    with pytest.raises(ValueError):
+        RegionOfInterest.parse(polygons)
+
+def test_from_polygons_falls_back_to_full_frame():
+    assert RegionOfInterest.from_polygons(None) is None
+    assert RegionOfInterest.from_polygons([]) is None
+    assert RegionOfInterest.from_polygons([[[0, 0], [2, 0], [2, 2]]]) is None
+
+def test_rectangle_roi_is_a_view_without_mask():
+    roi = RegionOfInterest(RECTANGLE)
+    frame = np.random.randint(0, 255, (100, 200, 3), dtype=np.uint8)
+    crop, offset = roi.apply(frame)
+
+    assert offset == (50, 50)
+    assert crop.shape == (50, 101, 3)
+    assert np.shares_memory(crop, frame)
+    assert np.array_equal(crop, frame[50:100, 50:151])
+
+def test_polygon_roi_masks_outside_pixels():
+    roi = RegionOfInterest(TRIANGLE)
+    frame = np.full((100, 100, 3), 200, dtype=np.uint8)
+    crop, offset = roi.apply(frame)
+
+    assert offset == (0, 0)
+    assert crop.shape[:2] == (51, 51)
+    assert crop[5, 5].tolist() == [200, 200, 200]
+    assert crop[48, 48].tolist() == [0, 0, 0]
+    assert not np.shares_memory(crop, frame)
+
+def test_layout_is_cached_per_frame_size():
+    roi = RegionOfInterest(TRIANGLE)
+    roi.apply(np.zeros((100, 100, 3), dtype=np.uint8))
+    roi.apply(np.zeros((100, 100, 3), dtype=np.uint8))
+    roi.apply(np.zeros((50, 80, 3), dtype=np.uint8))
+    assert set(roi._layouts) == {(100, 100), (50, 80)}
+
+def test_map_predictions_offsets_boxes_and_drops_outside_centers():
+    roi = RegionOfInterest(TRIANGLE)
+    frame_shape = (100, 100, 3)
+    predictions = [
+        {'class': 'car', 'confidence': 0.9, 'bbox': [0, 0, 10, 10]},
+        {'class': 'car', 'confidence': 0.8, 'bbox': [40, 40, 50, 50]},
+        {'class': 'car', 'confidence': 0.7}
+    ]
+    mapped = roi.map_predictions(predictions, (0, 0), frame_shape)
+    assert [p['confidence'] for p in mapped] == [0.9, 0.7]
+
+def test_map_predictions_translates_to_frame_coordinates():
+    roi = RegionOfInterest(RECTANGLE)
+    predictions = [{'class': 'car', 'confidence': 0.9, 'bbox': [10, 5, 30, 25]}]
+    mapped = roi.map_predictions(predictions, (50, 50), (100, 200, 3))
+    assert mapped[0]['bbox'] == [60, 55, 80, 75]
+    # 不修改原始检测结果
+    assert predictions[0]['bbox'] == [10, 5, 30, 25]
@@ -0,0 +1,44 @@
+"""
+快照服务复用流水线抓帧句柄测试
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+
+from app.ai.frame_grabber import GrabberRegistry
+from app.ai.snapshot_service import SnapshotService
+
+class FakeGrabber:
+    def __init__(self, frame):
+        self.frame = frame
+
+    def peek(self):
+        return 1, self.frame, 0.0
+
+def test_snapshot_reuses_registered_pipeline_frame():
+    registry = GrabberRegistry()
+    frame = np.full((48, 64, 3), 7, dtype=np.uint8)
+    registry.register('cam-1', FakeGrabber(frame))
+    service = SnapshotService(grabbers=registry)
+
+    # 流地址为空：只要取到了流水线的帧，就不会去打开新连接
+    snapshot = service.get_frame('cam-1')
+    assert snapshot is not None and (snapshot == frame).all()
+    assert snapshot is not frame
+    assert service.get_jpeg('cam-1') is not None
+    assert service.get_stats()['pooled_handles'] == 0
+
+def test_unregister_keeps_newer_grabber():
+    registry = GrabberRegistry()
+    old, new = FakeGrabber(None), FakeGrabber(None)
+    registry.register('cam-1', old)
+    registry.register('cam-1', new)
+
+    # 旧流水线退出时不能注销重连后登记的新句柄
+    registry.unregister('cam-1', old)
+    assert registry.get('cam-1') is new
+    registry.unregister('cam-1', new)
+    assert registry.get('cam-1') is None
+    assert SnapshotService(grabbers=registry).get_frame('cam-1') is None
@@ -0,0 +1,116 @@
+"""
+流水线监管器测试
+"""
+
+import threading
+import time
+
+from app.ai.stream_supervisor import (
+    StreamSupervisor, STATE_BACKOFF, STATE_FAILED, STATE_RUNNING, STATE_STOPPED
+)
+
+def wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_backoff_delay_is_exponential_with_jitter():
+    supervisor = StreamSupervisor(max_pipelines=1, backoff_base=1.0, backoff_max=60.0)
+    for attempts in range(5):
+        delay = supervisor._backoff_delay(attempts)
+        expected = 2 ** attempts
+        assert expected * 0.8 <= delay <= expected * 1.2
+
+def test_backoff_delay_is_capped():
+    supervisor = StreamSupervisor(max_pipelines=1, backoff_base=1.0, backoff_max=10.0)
+    for attempts in (4, 10, 30):
+        assert 8.0 <= supervisor._backoff_delay(attempts) <= 12.0
+
+def test_failing_runner_gives_up_after_max_attempts():
+    supervisor = StreamSupervisor(max_pipelines=2, backoff_base=0.01, backoff_max=0.02, max_attempts=2)
+    calls = []
+
+    def runner(stop_event):
+        calls.append(time.time())
+        raise RuntimeError('连接失败')
+
+    try:
+        assert supervisor.register('cam-1', runner)
+        pipeline = supervisor.get_pipeline('cam-1')
+        assert pipeline.done.wait(5)
+
+        assert pipeline.state == STATE_FAILED
+        assert len(calls) == 3
+        assert pipeline.restarts == 3
+        assert pipeline.last_error == '连接失败'
+        states = [transition['to'] for transition in pipeline.transitions]
+        assert states.count(STATE_RUNNING) == 3
+        assert states.count(STATE_BACKOFF) == 2
+    finally:
+        supervisor.shutdown()
+
+def test_stable_run_resets_attempts():
+    supervisor = StreamSupervisor(max_pipelines=1, backoff_base=0.01, backoff_max=0.02,
+                                  stable_after=0.0, max_attempts=1)
+    calls = []
+
+    def runner(stop_event):
+        calls.append(1)
+        if len(calls) >= 4:
+            stop_event.wait(5)
+
+    try:
+        supervisor.register('cam-1', runner)
+        pipeline = supervisor.get_pipeline('cam-1')
+        # 每次都算稳定运行，退避次数不会累积到max_attempts
+        assert wait_until(lambda: len(calls) >= 4)
+        assert pipeline.state == STATE_RUNNING
+        assert pipeline.attempts == 1
+    finally:
+        supervisor.shutdown()
+
+def test_register_is_idempotent_and_unregister_stops_runner():
+    supervisor = StreamSupervisor(max_pipelines=1)
+    started = threading.Event()
+
+    def runner(stop_event):
+        started.set()
+        stop_event.wait(5)
+
+    try:
+        assert supervisor.register('cam-1', runner)
+        assert not supervisor.register('cam-1', runner)
+        assert started.wait(5)
+        assert supervisor.is_registered('cam-1')
+
+        pipeline = supervisor.get_pipeline('cam-1')
+        assert supervisor.unregister('cam-1')
+        assert pipeline.done.is_set()
+        assert pipeline.state == STATE_STOPPED
+        assert not supervisor.is_registered('cam-1')
+    finally:
+        supervisor.shutdown()
+
+def test_pipelines_beyond_limit_wait_for_a_slot():
+    supervisor = StreamSupervisor(max_pipelines=1)
+    running = []
+
+    def runner(stop_event):
+        running.append(1)
+        stop_event.wait(5)
+
+    try:
+        supervisor.register('cam-1', runner)
+        assert wait_until(lambda: len(running) == 1)
+        supervisor.register('cam-2', runner)
+        time.sleep(0.1)
+        assert len(running) == 1
+
+        supervisor.unregister('cam-1')
+        assert wait_until(lambda: len(running) == 2)
+        assert supervisor.get_pipeline('cam-2').state == STATE_RUNNING
+    finally:
+        supervisor.shutdown()
@@ -0,0 +1,55 @@
+"""
+切片推理工具测试
+"""
+
+import numpy as np
+
+from app.ai.tiling import tile_origins, make_tiles, merge_tile_predictions, tiling_options
+
+def test_tile_origins_cover_whole_length():
+    assert tile_origins(500, 640, 0.2) == [0]
+    assert tile_origins(640, 640, 0.2) == [0]
+
+    origins = tile_origins(1920, 640, 0.2)
+    assert origins[0] == 0
+    assert origins[-1] == 1920 - 640
+    strides = np.diff(origins)
+    assert (strides <= 512).all() and (strides > 0).all()
+
+def test_make_tiles_returns_views():
+    image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    tiles, origins = make_tiles(image, 640, 640, overlap=0.2)
+
+    assert len(tiles) == len(origins) == len(tile_origins(1080, 640, 0.2)) * len(tile_origins(1920, 640, 0.2))
+    assert all(tile.shape == (640, 640, 3) for tile in tiles)
+    assert all(np.shares_memory(tile, image) for tile in tiles)
+    assert origins[-1] == (1280, 440)
+
+def test_merge_offsets_and_removes_duplicates_across_tiles():
+    # 同一辆车在两个重叠切片中都被检测到，其中一块只看到一部分
+    tile_predictions = [
+        [{'class': 'car', 'confidence': 0.9, 'bbox': [500, 100, 600, 160]}],
+        [{'class': 'car', 'confidence': 0.6, 'bbox': [0, 100, 88, 160]},
+         {'class': 'truck', 'confidence': 0.7, 'bbox': [0, 100, 88, 160]}],
+        [{'class': 'car', 'confidence': 0.5}]
+    ]
+    origins = [(0, 0), (512, 0), (0, 512)]
+    merged = merge_tile_predictions(tile_predictions, origins)
+
+    assert [(p['class'], p['confidence']) for p in merged] == [('car', 0.9), ('truck', 0.7)]
+    assert merged[1]['bbox'] == [512, 100, 600, 160]
+    # 不修改原始检测结果
+    assert tile_predictions[1][1]['bbox'] == [0, 100, 88, 160]
+
+def test_merge_empty():
+    assert merge_tile_predictions([[], []], [(0, 0), (100, 0)]) == []
+
+def test_tiling_options():
+    assert tiling_options(None) is None
+    assert tiling_options({'tiled_inference': False}) is None
+    assert tiling_options({'tiled_inference': True}) == {'overlap': 0.2, 'include_full': True}
+
+    options = tiling_options({'tiled_inference': True, 'tile_size': '800x480', 'tile_overlap': 0.1,
+                              'tile_include_full': False})
+    assert options == {'overlap': 0.1, 'include_full': False, 'tile_size': (800, 480)}
+    assert tiling_options({'tiled_inference': True, 'tile_size': 512})['tile_size'] == (512, 512)
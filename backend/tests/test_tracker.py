@@ -0,0 +1,156 @@
+"""
+多目标跟踪测试
+"""
+
+from app.ai.tracker import MultiObjectTracker, TrackerRegistry, tracker_options, CONFIRMED, LOST
+
+def car(x, y=100.0, confidence=0.9, class_name='car', width=40.0, height=30.0):
+    return {'class': class_name, 'confidence': confidence, 'bbox': [x, y, x + width, y + height]}
+
+def run(tracker, frames):
+    """frames: [(timestamp, predictions), ...]，返回每帧的结果和全部结束轨迹"""
+    results, finished = [], []
+    for timestamp, predictions in frames:
+        frame_results, frame_finished = tracker.update(predictions, timestamp)
+        results.append(frame_results)
+        finished.extend(frame_finished)
+    return results, finished
+
+def test_tracker_options():
+    assert tracker_options({'tracking': False}) is None
+    assert tracker_options({'tracking': True, 'detect_fps': 0}) is None
+
+    options = tracker_options({'tracking': True, 'detect_fps': 5, 'unknown': 1})
+    assert options['detect_fps'] == 5
+    assert 'unknown' not in options
+
+def test_track_confirmed_after_min_hits():
+    tracker = MultiObjectTracker({'track_min_hits': 2})
+    results, _ = run(tracker, [(0.0, [car(100)]), (0.1, [car(102)]), (0.2, [car(104)])])
+
+    assert 'trackId' not in results[0][0]
+    assert results[1][0]['trackId'] == results[2][0]['trackId'] == 1
+    assert tracker.get_stats()['active'] == 1
+
+def test_unconfirmed_track_is_dropped_silently():
+    tracker = MultiObjectTracker()
+    _, finished = run(tracker, [(0.0, [car(100)]), (0.1, [])])
+    assert finished == []
+    assert tracker.tracks == []
+
+def test_fast_car_keeps_one_id_at_low_detection_rate():
+    """3fps检测下每次移动接近一个车身，靠扩展框IoU和速度估计保持同一ID"""
+    tracker = MultiObjectTracker()
+    frames = [(i / 3, [car(100 + 30 * i)]) for i in range(12)]
+    results, _ = run(tracker, frames)
+
+    track_ids = {result[0].get('trackId') for result in results[1:]}
+    assert track_ids == {1}
+    assert tracker.tracks_created == 1
+    # 速度估计约为90像素/秒
+    assert 70 < tracker.get_tracks()[0]['velocity'][0] < 110
+
+def test_two_cars_get_distinct_ids():
+    tracker = MultiObjectTracker()
+    frames = [(i * 0.1, [car(100 + 2 * i), car(400 - 2 * i, y=300)]) for i in range(5)]
+    results, _ = run(tracker, frames)
+
+    assert sorted(result['trackId'] for result in results[-1]) == [1, 2]
+    assert results[-1][0]['trackId'] == results[1][0]['trackId']
+
+def test_low_confidence_detection_continues_confirmed_track():
+    tracker = MultiObjectTracker()
+    results, _ = run(tracker, [(0.0, [car(100)]), (0.1, [car(102)]), (0.2, [car(104, confidence=0.3)])])
+    assert results[2][0]['trackId'] == 1
+    # 低置信度检测框不新建轨迹
+    run(tracker, [(0.3, [car(106), car(500, confidence=0.3)])])
+    assert tracker.tracks_created == 1
+
+def test_lost_track_finishes_with_summary():
+    tracker = MultiObjectTracker({'track_max_lost_seconds': 1.0})
+    frames = [(i * 0.1, [car(100 + 5 * i)]) for i in range(5)]
+    frames += [(0.5, []), (1.0, []), (1.5, [])]
+    _, finished = run(tracker, frames)
+
+    assert len(finished) == 1
+    summary = finished[0]
+    assert summary['trackId'] == 1
+    assert summary['class'] == 'car'
+    assert summary['hits'] == 5
+    assert summary['firstSeen'] == 0.0
+    assert summary['lastSeen'] == 0.4
+    assert all(point[0] <= 0.4 for point in summary['path'])
+    assert tracker.tracks == []
+    assert tracker.get_stats()['finished'] == 1
+
+def test_track_marked_lost_then_recovered():
+    tracker = MultiObjectTracker({'track_max_lost_seconds': 2.0})
+    run(tracker, [(0.0, [car(100)]), (0.1, [car(100)]), (0.2, [])])
+    assert tracker.tracks[0].state == LOST
+
+    results, _ = run(tracker, [(0.3, [car(100)])])
+    assert results[0][0]['trackId'] == 1
+    assert tracker.tracks[0].state == CONFIRMED
+
+def test_class_is_confidence_weighted_vote():
+    tracker = MultiObjectTracker()
+    frames = [(0.0, [car(100)]), (0.1, [car(100, class_name='truck', confidence=0.6)]), (0.2, [car(100)])]
+    run(tracker, frames)
+    assert tracker.get_tracks()[0]['class'] == 'car'
+
+def test_predict_extrapolates_without_changing_state():
+    tracker = MultiObjectTracker()
+    run(tracker, [(i * 0.1, [car(100 + 10 * i)]) for i in range(6)])
+    means = tracker.means.copy()
+    detected_box = tracker.get_tracks()[0]['bbox']
+
+    predicted = tracker.predict(0.5 + 0.5)
+    assert predicted[0]['predicted']
+    assert predicted[0]['bbox'][0] > detected_box[0] + 30
+    assert (tracker.means == means).all()
+    assert tracker.time == 0.5
+
+    # 外推之后再用正常的检测帧更新，ID不变
+    results, _ = run(tracker, [(0.6, [car(160)])])
+    assert results[0][0]['trackId'] == 1
+
+def test_update_older_than_state_uses_current_time():
+    tracker = MultiObjectTracker()
+    run(tracker, [(1.0, [car(100)]), (1.1, [car(101)])])
+    results, _ = run(tracker, [(0.5, [car(102)])])
+    assert results[0][0]['trackId'] == 1
+    assert tracker.time == 1.1
+    assert tracker.tracks[0].last_seen == 1.1
+
+def test_flush_returns_confirmed_tracks_only():
+    tracker = MultiObjectTracker()
+    run(tracker, [(0.0, [car(100)]), (0.1, [car(100), car(400)])])
+    finished = tracker.flush()
+    assert [summary['trackId'] for summary in finished] == [1]
+    assert tracker.tracks == []
+
+def test_registry_predict_and_remove_camera():
+    registry = TrackerRegistry()
+    tracker = registry.get('cam-1', 'model-1')
+    assert registry.get('cam-1', 'model-1') is tracker
+    registry.get('cam-2', 'model-1')
+    run(tracker, [(0.0, [car(100)]), (0.1, [car(100)])])
+
+    tracks = registry.predict('cam-1', 0.2)
+    assert [(track['trackId'], track['modelId']) for track in tracks] == [(1, 'model-1')]
+
+    removed = registry.remove_camera('cam-1')
+    assert [(model_id, len(finished)) for model_id, finished in removed] == [('model-1', 1)]
+    assert list(registry.get_stats()) == ['cam-2']
+
+def test_registry_refuses_trackers_for_stopped_camera():
+    registry = TrackerRegistry()
+    registry.get('cam-1', 'model-1')
+    registry.remove_camera('cam-1')
+
+    # 停止前排队的帧到达时不再新建跟踪器
+    assert registry.get('cam-1', 'model-1') is None
+    assert registry.get_stats() == {}
+
+    registry.open_camera('cam-1')
+    assert registry.get('cam-1', 'model-1') is not None